@@ -1,11 +1,24 @@
 import argparse
+import base64
+import contextlib
+import hashlib
+import json
 import os
 import platform
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+import tomllib
+import urllib.parse
+import urllib.request
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
+
+from tooling_metrics import PhaseMetrics
 
 UV_VERSION = "0.8.4"
 PNPM_VERSION = "10.14.0"
@@ -13,6 +26,9 @@ COPIER_VERSION = "9.9.1"
 COPIER_TEMPLATE_EXTENSIONS_VERSION = "0.3.2"
 PRE_COMMIT_VERSION = "4.3.0"
 GITHUB_WINDOWS_RUNNER_BIN_PATH = r"C:\Users\runneradmin\.local\bin"
+# the installers, tool wheels and pnpm tarball are kept here between runs
+CACHE_DIR_ENV_VAR = "CI_TOOLING_CACHE_DIR"
+SSM_PLUGIN_VERSION = "1.2.707.0"
 INSTALL_SSM_PLUGIN_BY_DEFAULT = False
 parser = argparse.ArgumentParser(description="Install CI tooling for the repo")
 _ = parser.add_argument(
@@ -36,111 +52,326 @@ _ = parser.add_argument(
     default=INSTALL_SSM_PLUGIN_BY_DEFAULT,
     help="Install the SSM plugin for AWS CLI",
 )
+_ = parser.add_argument(
+    "--force",
+    action="store_true",
+    default=False,
+    help="Reinstall every tool, even the ones already installed at the pinned version",
+)
+_ = parser.add_argument(
+    "--cache-dir",
+    type=Path,
+    default=Path(os.environ.get(CACHE_DIR_ENV_VAR, Path.home() / ".cache" / "ci-tooling")),
+    help=f"Directory to cache the downloaded installers, tool wheels and pnpm tarball in (default: ${CACHE_DIR_ENV_VAR} or ~/.cache/ci-tooling)",
+)
+_ = parser.add_argument(
+    "--offline",
+    action="store_true",
+    default=False,
+    help=(
+        "Install only from the cache directory (and --find-links), failing instead of downloading anything. "
+        "uv itself must already be installed, since its installer always downloads the release archive"
+    ),
+)
+_ = parser.add_argument(
+    "--find-links",
+    type=Path,
+    default=None,
+    help="Local directory of wheels to install the Python tools from, in addition to the package index",
+)
 
 
-def main():
-    args = parser.parse_args(sys.argv[1:])
-    is_windows = platform.system() == "Windows"
+METRICS = PhaseMetrics(Path(__file__).name)
+
+
+class DownloadCache:
+    """A content-addressed cache of downloaded files, so that repeated runs do not need to refetch them.
+
+    Each file is stored under its SHA-256 digest, and an index maps each URL to the digest of its contents. Every cache hit is re-hashed
+    before being used, so a corrupted cache is refetched instead of installed. That digest is taken from the download itself, so it only
+    guards against corruption: a file is only checked against a published checksum when `fetch` is given its `integrity`.
+    """
+
+    def __init__(self, cache_dir: Path, *, offline: bool):
+        super().__init__()
+        self.blobs_dir = cache_dir / "sha256"
+        self.index_file = cache_dir / "index.json"
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._index: dict[str, str] = {}
+        if self.index_file.exists():
+            try:
+                with self.index_file.open("r", encoding="utf-8") as f:
+                    index: Any = json.load(f)
+            except (OSError, ValueError) as e:
+                # the blobs are re-hashed before being used anyway, so a lost index only means downloading them again
+                print(
+                    f"Warning: could not read the download cache index {self.index_file} ({e}), starting from an empty one"
+                )
+            else:
+                if isinstance(index, dict):
+                    self._index = index
+
+    def fetch(self, url: str, *, integrity: str | None = None) -> Path:
+        """Return the path of the cached contents of the URL, downloading them if needed.
+
+        `integrity` is an optional Subresource Integrity string (e.g. `sha512-<base64>`, as published by the npm registry) that the
+        contents must match.
+        """
+        # keep the extension (e.g. .tgz), since some tools dispatch on it, but not the tail of a version number
+        suffix = Path(urllib.parse.urlparse(url).path).suffix
+        if suffix[1:].isdigit():
+            suffix = ""
+        with self._lock:
+            digest = self._index.get(url)
+        if digest is not None:
+            cached_file = self.blobs_dir / f"{digest}{suffix}"
+            if (
+                cached_file.exists()
+                and _verify(cached_file, f"sha256-{digest}", is_hex=True)
+                and _verify(cached_file, integrity)
+            ):
+                print(f"Using the cached copy of {url}")
+                return cached_file
+        if self.offline:
+            raise FileNotFoundError(f"{url} is not in the cache at {self.blobs_dir} and --offline is set")
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        with (
+            urllib.request.urlopen(url) as response,  # noqa: S310 # the URLs are the pinned https ones defined in this script
+            tempfile.NamedTemporaryFile(dir=self.blobs_dir, delete=False) as f,
+        ):
+            shutil.copyfileobj(response, f)
+        downloaded_file = Path(f.name)
+        if not _verify(downloaded_file, integrity):
+            downloaded_file.unlink()
+            raise ValueError(f"The contents of {url} do not match the expected checksum {integrity}")
+        digest = _file_digest(downloaded_file, "sha256").hex()
+        cached_file = downloaded_file.replace(self.blobs_dir / f"{digest}{suffix}")
+        with self._lock:
+            self._index[url] = digest
+            self._save_index()
+        return cached_file
+
+    def _save_index(self) -> None:
+        """Atomically write the index, so that an interrupted run can never leave a partially written one behind."""
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.index_file.parent, prefix=f"{self.index_file.name}.", delete=False
+        ) as f:
+            json.dump(self._index, f, indent=2)
+        try:
+            _ = Path(f.name).replace(self.index_file)
+        except OSError:
+            with contextlib.suppress(OSError):
+                Path(f.name).unlink()
+            raise
+
+
+def _file_digest(path: Path, algorithm: str) -> bytes:
+    digest = hashlib.new(algorithm)
+    with path.open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _verify(path: Path, integrity: str | None, *, is_hex: bool = False) -> bool:
+    """Check the file against a `<algorithm>-<digest>` string, with the digest in base64 (as in Subresource Integrity) or in hex."""
+    if integrity is None:
+        return True
+    algorithm, _, expected = integrity.partition("-")
+    actual = _file_digest(path, algorithm)
+    return (actual.hex() if is_hex else base64.b64encode(actual).decode("ascii")) == expected
+
+
+def _uv_path(*, is_windows: bool) -> str:
+    return ((GITHUB_WINDOWS_RUNNER_BIN_PATH + "\\") if is_windows else "") + "uv"
+
+
+def _powershell_command(pwsh: str, command: str) -> list[str]:
+    return [pwsh, "-NoProfile", "-NonInteractive", "-Command", command]
+
+
+def _requirements_key(requirements: dict[str, str]) -> str:
+    return ",".join(f"{name}{specifier}" for name, specifier in sorted(requirements.items()))
+
+
+# the version of each tool, in the same form as `probe_installed_versions` reports it
+PINNED_VERSIONS = {
+    "uv": UV_VERSION,
+    "copier": _requirements_key(
+        {"copier": f"=={COPIER_VERSION}", "copier-template-extensions": f"=={COPIER_TEMPLATE_EXTENSIONS_VERSION}"}
+    ),
+    "pre-commit": _requirements_key({"pre-commit": f"=={PRE_COMMIT_VERSION}"}),
+    "pnpm": PNPM_VERSION,
+    "session-manager-plugin": SSM_PLUGIN_VERSION,
+}
+
+
+def _probe_output(command: list[str]) -> str | None:
+    executable = shutil.which(command[0])
+    if executable is None:
+        return None
+    result = subprocess.run([executable, *command[1:]], capture_output=True, text=True, check=False)  # noqa: S603 # the commands are the fixed version queries in this script
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def _read_uv_tool_requirements(tool_dir: str | None, tool: str) -> str | None:
+    # uv records the requirements each tool was installed with in a receipt, which is much faster to read than asking the tool itself
+    if tool_dir is None:
+        return None
+    try:
+        with (Path(tool_dir) / tool / "uv-receipt.toml").open("rb") as f:
+            receipt = tomllib.load(f)
+        return _requirements_key(
+            {requirement["name"]: requirement.get("specifier", "") for requirement in receipt["tool"]["requirements"]}
+        )
+    except (OSError, KeyError, TypeError, tomllib.TOMLDecodeError):
+        return None
+
+
+def probe_installed_versions(uv_path: str) -> dict[str, str | None]:
+    """Query the installed version of every tool at once, with None for the ones that are missing or broken."""
+    with METRICS.phase("probe_installed_versions"), ThreadPoolExecutor(max_workers=4) as executor:
+        uv_version = executor.submit(_probe_output, [uv_path, "--version"])
+        uv_tool_dir = executor.submit(_probe_output, [uv_path, "tool", "dir"])
+        pnpm_version = executor.submit(_probe_output, ["pnpm", "--version"])
+        ssm_plugin_version = executor.submit(_probe_output, ["session-manager-plugin", "--version"])
+    uv_version_output = uv_version.result()  # e.g. "uv 0.8.4 (e176e1714 2025-07-30)"
+    return {
+        "uv": uv_version_output.split()[1] if uv_version_output is not None else None,
+        "copier": _read_uv_tool_requirements(uv_tool_dir.result(), "copier"),
+        "pre-commit": _read_uv_tool_requirements(uv_tool_dir.result(), "pre-commit"),
+        "pnpm": pnpm_version.result(),
+        "session-manager-plugin": ssm_plugin_version.result(),
+    }
+
+
+def is_satisfied(installed_versions: dict[str, str | None], tool: str) -> bool:
+    if installed_versions.get(tool) != PINNED_VERSIONS[tool]:
+        return False
+    print(f"Skipping {tool} as {PINNED_VERSIONS[tool]} is already installed")
+    return True
+
+
+def install_python_tools(
+    args: argparse.Namespace, cache: DownloadCache, pwsh: str | None, installed_versions: dict[str, str | None]
+) -> None:
     uv_env = dict(os.environ)
     uv_env.update({"UV_PYTHON_PREFERENCE": "only-system", "UV_PYTHON": args.python_version})
-    uv_path = ((GITHUB_WINDOWS_RUNNER_BIN_PATH + "\\") if is_windows else "") + "uv"
-    if is_windows:
-        pwsh = shutil.which("pwsh") or shutil.which("powershell")
-        if not pwsh:
-            raise FileNotFoundError("Neither 'pwsh' nor 'powershell' found on PATH")
-    if not args.no_python:
-        if is_windows:
-            uv_env.update({"PATH": rf"{GITHUB_WINDOWS_RUNNER_BIN_PATH};{uv_env['PATH']}"})
-            # invoke installer in a pwsh process
-            _ = subprocess.run(
-                [
-                    pwsh,  # type: ignore[reportPossiblyUnboundVariable] # this matches the conditional above that defines pwsh
-                    "-NoProfile",
-                    "-NonInteractive",
-                    "-Command",
-                    f"irm https://astral.sh/uv/{UV_VERSION}/install.ps1 | iex",
-                ],
-                check=True,
-                env=uv_env,
-            )
-        else:
-            _ = subprocess.run(
-                f"curl -fsSL https://astral.sh/uv/{UV_VERSION}/install.sh | sh",
-                check=True,
-                shell=True,
-                env=uv_env,
-            )
-            # TODO: add uv autocompletion to the shell https://docs.astral.sh/uv/getting-started/installation/#shell-autocompletion
-        _ = subprocess.run(
-            [
-                uv_path,
-                "tool",
-                "install",
-                f"copier=={COPIER_VERSION}",
-                "--with",
-                f"copier-template-extensions=={COPIER_TEMPLATE_EXTENSIONS_VERSION}",
-            ],
-            check=True,
-            env=uv_env,
+    # keep the downloaded wheels next to the installers, unless the caller already manages uv's cache
+    _ = uv_env.setdefault("UV_CACHE_DIR", str(args.cache_dir / "uv"))
+    if args.offline:
+        uv_env["UV_OFFLINE"] = "1"
+    uv_path = _uv_path(is_windows=pwsh is not None)
+    if pwsh is not None:
+        uv_env.update({"PATH": rf"{GITHUB_WINDOWS_RUNNER_BIN_PATH};{uv_env['PATH']}"})
+    if not is_satisfied(installed_versions, "uv"):
+        if args.offline:
+            # only the installer script could be cached, and it downloads the release archive of uv when it runs
+            raise FileNotFoundError(f"uv {UV_VERSION} is not installed, and it cannot be installed with --offline")
+        with METRICS.phase("install_uv"):
+            if pwsh is not None:
+                installer = cache.fetch(f"https://astral.sh/uv/{UV_VERSION}/install.ps1")
+                # invoke installer in a pwsh process
+                _ = METRICS.run(
+                    _powershell_command(pwsh, f"Get-Content -Raw -LiteralPath '{installer}' | Invoke-Expression"),
+                    check=True,
+                    env=uv_env,
+                )
+            else:
+                installer = cache.fetch(f"https://astral.sh/uv/{UV_VERSION}/install.sh")
+                _ = METRICS.run(["sh", str(installer)], check=True, env=uv_env)
+                # TODO: add uv autocompletion to the shell https://docs.astral.sh/uv/getting-started/installation/#shell-autocompletion
+    find_links = ["--find-links", str(args.find_links)] if args.find_links is not None else []
+    tool_installs = {  # tool -> requirements
+        "copier": [
+            f"copier=={COPIER_VERSION}",
+            "--with",
+            f"copier-template-extensions=={COPIER_TEMPLATE_EXTENSIONS_VERSION}",
+        ],
+        "pre-commit": [f"pre-commit=={PRE_COMMIT_VERSION}"],
+    }
+    tool_installs = {
+        tool: requirements for tool, requirements in tool_installs.items() if not is_satisfied(installed_versions, tool)
+    }
+
+    def install_tool(tool: str, requirements: list[str]) -> None:
+        with METRICS.phase(f"install_{tool.replace('-', '_')}"):
+            # --force, since a mismatched version of the tool may already be installed
+            _ = METRICS.run([uv_path, "tool", "install", "--force", *requirements, *find_links], check=True, env=uv_env)
+
+    # the tools are installed into separate environments, so they do not need to wait on each other
+    with ThreadPoolExecutor(max_workers=max(1, len(tool_installs))) as executor:
+        futures = [executor.submit(install_tool, *tool_install) for tool_install in tool_installs.items()]
+    for future in futures:
+        future.result()
+    _ = subprocess.run(
+        [
+            uv_path,
+            "tool",
+            "list",
+        ],
+        check=True,
+        env=uv_env,
+    )
+
+
+def install_pnpm(cache: DownloadCache, pwsh: str | None, installed_versions: dict[str, str | None]) -> None:
+    if is_satisfied(installed_versions, "pnpm"):
+        return
+    with METRICS.phase("install_pnpm"):
+        metadata_file = cache.fetch(f"https://registry.npmjs.org/pnpm/{PNPM_VERSION}")
+        with metadata_file.open("r", encoding="utf-8") as f:
+            dist = json.load(f)["dist"]
+        tarball = cache.fetch(dist["tarball"], integrity=dist["integrity"])
+        pnpm_install_sequence = ["npm -v", f'npm install -g "{tarball}"', "pnpm -v"]
+        for cmd in pnpm_install_sequence:
+            _ = METRICS.run(_powershell_command(pwsh, cmd) if pwsh is not None else [cmd], shell=True, check=True)
+
+
+def install_ssm_plugin(cache: DownloadCache, installed_versions: dict[str, str | None]) -> None:
+    if is_satisfied(installed_versions, "session-manager-plugin"):
+        return
+    with METRICS.phase("install_ssm_plugin"):
+        # Based on https://docs.aws.amazon.com/systems-manager/latest/userguide/install-plugin-debian-and-ubuntu.html
+        # no specific reason for that version, just pinning it for best practice
+        local_package_path = cache.fetch(
+            f"https://s3.amazonaws.com/session-manager-downloads/plugin/{SSM_PLUGIN_VERSION}/ubuntu_64bit/session-manager-plugin.deb"
         )
-        _ = subprocess.run(
-            [
-                uv_path,
-                "tool",
-                "install",
-                f"pre-commit=={PRE_COMMIT_VERSION}",
-            ],
+        _ = METRICS.run(
+            ["sudo", "dpkg", "-i", str(local_package_path)],
             check=True,
-            env=uv_env,
         )
         _ = subprocess.run(
-            [
-                uv_path,
-                "tool",
-                "list",
-            ],
+            ["session-manager-plugin", "--version"],
             check=True,
-            env=uv_env,
         )
+
+
+def main():
+    args = parser.parse_args(sys.argv[1:])
+    is_windows = platform.system() == "Windows"
+    pwsh = None
+    if is_windows:
+        pwsh = shutil.which("pwsh") or shutil.which("powershell")
+        if not pwsh:
+            raise FileNotFoundError("Neither 'pwsh' nor 'powershell' found on PATH")
+    if args.install_ssm_plugin and is_windows:
+        raise NotImplementedError("SSM plugin installation is not implemented for Windows")
+    cache = DownloadCache(args.cache_dir, offline=args.offline)
+    installed_versions = {} if args.force else probe_installed_versions(_uv_path(is_windows=is_windows))
+    installs: list[Callable[[], None]] = []
+    if not args.no_python:
+        installs.append(lambda: install_python_tools(args, cache, pwsh, installed_versions))
     if not args.no_node:
-        pnpm_install_sequence = ["npm -v", f"npm install -g pnpm@{PNPM_VERSION}", "pnpm -v"]
-        for cmd in pnpm_install_sequence:
-            cmd = (
-                [
-                    pwsh,  # type: ignore[reportPossiblyUnboundVariable] # this matches the conditional above that defines pwsh
-                    "-NoProfile",
-                    "-NonInteractive",
-                    "-Command",
-                    cmd,
-                ]
-                if is_windows
-                else [cmd]
-            )
-            _ = subprocess.run(cmd, shell=True, check=True)
+        installs.append(lambda: install_pnpm(cache, pwsh, installed_versions))
     if args.install_ssm_plugin:
-        if is_windows:
-            raise NotImplementedError("SSM plugin installation is not implemented for Windows")
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            local_package_path = Path(tmp_dir) / "session-manager-plugin.deb"
-            # Based on https://docs.aws.amazon.com/systems-manager/latest/userguide/install-plugin-debian-and-ubuntu.html
-            # no specific reason for that version, just pinning it for best practice
-            _ = subprocess.run(
-                [
-                    "curl",
-                    "https://s3.amazonaws.com/session-manager-downloads/plugin/1.2.707.0/ubuntu_64bit/session-manager-plugin.deb",
-                    "-o",
-                    f"{local_package_path}",
-                ],
-                check=True,
-            )
-            _ = subprocess.run(
-                ["sudo", "dpkg", "-i", str(local_package_path)],
-                check=True,
-            )
-            _ = subprocess.run(
-                ["session-manager-plugin", "--version"],
-                check=True,
-            )
+        installs.append(lambda: install_ssm_plugin(cache, installed_versions))
+    # none of the installs depend on each other, so run them all at once
+    with ThreadPoolExecutor(max_workers=max(1, len(installs))) as executor:
+        futures = [executor.submit(install) for install in installs]
+    for future in futures:
+        future.result()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,42 @@
 """Used typically to calculate if all the files in the context of building a Docker image have changed or not."""
 
 import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import selectors
+import signal
+import socket
+import stat
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import zlib
+from collections import deque
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import FrameType
+from typing import Any
+from typing import cast
+
+# the per-phase timings are recorded by the module shared by all the repo tooling scripts, which lives in .devcontainer
+sys.path.append(str(Path(__file__).resolve().parents[2] / ".devcontainer"))
+from tooling_metrics import PhaseMetrics
 
 DEVCONTAINER_COMMENT_LINE_PREFIX = (
     "  // Devcontainer context hash (do not manually edit this, it's managed by a pre-commit hook): "
@@ -14,65 +46,741 @@ DEVCONTAINER_COMMENT_LINE_SUFFIX = (
     " # spellchecker:disable-line"  # the typos hook can sometimes mess with the hash without this
 )
 
+ADLER32_BASE = 65521  # largest prime smaller than 65536, as defined by the Adler-32 algorithm
+DIGEST_CACHE_VERSION = 2
+# Files modified this recently are not cached, since a second write within the same filesystem timestamp tick (and with the same size)
+# would be indistinguishable from the cached version. This is the same "racily clean" problem that git solves for its own index.
+DIGEST_CACHE_RACY_WINDOW_NS = 2_000_000_000
+
+# the original single-threaded streaming checksum, kept so that existing hashes can still be checked
+ALGORITHM_ADLER32 = "adler32"
+ALGORITHM_MERKLE_SHA256 = "merkle-sha256"
+ALGORITHM_GIT_BLOB = "git-blob"  # reuses the object IDs Git already computed, so clean files are never read
+READ_BUFFER_SIZE = 1024 * 1024
+MMAP_THRESHOLD_BYTES = 8 * 1024 * 1024  # below this, a few readinto calls are cheaper than setting up a memory map
+# domain separation between leaves and interior nodes, so a leaf can never be confused with a subtree
+MERKLE_LEAF_PREFIX = b"\x00"
+MERKLE_NODE_PREFIX = b"\x01"
+GIT_OUTPUT_CHUNK_SIZE = 64 * 1024
+# how far ahead of the in-order combine the thread pool may run, which bounds memory usage
+PENDING_DIGESTS_PER_THREAD = 4
+CONTEXTS_CONFIG_RELATIVE_PATH = Path(".devcontainer") / "hash-contexts.json"
+DEVCONTAINER_CONTEXT_NAME = "devcontainer"
+ALL_FILES_CONTEXT_NAME = "all"
+OUTPUT_FORMAT_JSON = "json"
+OUTPUT_FORMAT_GITHUB_OUTPUT = "github-output"  # `name=hash` lines, ready to be appended to $GITHUB_OUTPUT
+DAEMON_PROTOCOL_VERSION = 1
+DAEMON_SOCKET_NAME = "daemon.sock"
+DAEMON_CONNECT_TIMEOUT_SECONDS = 1
+DAEMON_RESPONSE_TIMEOUT_SECONDS = 120
+# from <sys/inotify.h>
+INOTIFY_MODIFY = 0x00000002
+INOTIFY_CLOSE_WRITE = 0x00000008
+INOTIFY_MOVED_FROM = 0x00000040
+INOTIFY_MOVED_TO = 0x00000080
+INOTIFY_CREATE = 0x00000100
+INOTIFY_DELETE = 0x00000200
+INOTIFY_DELETE_SELF = 0x00000400
+INOTIFY_MOVE_SELF = 0x00000800
+INOTIFY_Q_OVERFLOW = 0x00004000
+INOTIFY_IGNORED = 0x00008000
+INOTIFY_ONLYDIR = 0x01000000
+INOTIFY_ISDIR = 0x40000000
+INOTIFY_CLOEXEC = 0o2000000
+INOTIFY_NONBLOCK = 0o4000
+INOTIFY_DIRECTORY_MASK = (
+    INOTIFY_MODIFY
+    | INOTIFY_CLOSE_WRITE
+    | INOTIFY_MOVED_FROM
+    | INOTIFY_MOVED_TO
+    | INOTIFY_CREATE
+    | INOTIFY_DELETE
+    | INOTIFY_DELETE_SELF
+    | INOTIFY_MOVE_SELF
+)
+# git replaces the index by renaming index.lock over it
+INOTIFY_INDEX_MASK = INOTIFY_MOVED_TO | INOTIFY_CLOSE_WRITE | INOTIFY_CREATE | INOTIFY_DELETE
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, length of the name that follows
+INOTIFY_READ_SIZE = 64 * 1024
+# Used when the repository does not declare its own contexts in CONTEXTS_CONFIG_RELATIVE_PATH
+DEFAULT_CONTEXTS: dict[str, dict[str, Any]] = {
+    DEVCONTAINER_CONTEXT_NAME: {
+        "devcontainer_json": ".devcontainer/devcontainer.json",
+        "include": [
+            ".devcontainer/**",
+            "**/*.lock",
+            "**/*pnpm-lock.yaml",
+            "**/*hash_git_files.py",
+            ".pre-commit-config.yaml",
+        ],
+        "exclude": [".devcontainer/**/*devcontainer.json"],
+    }
+}
+
+
+METRICS = PhaseMetrics(Path(__file__).name)
+_thread_local = threading.local()
+
+
+def _iter_git_output_entries(repo_path: Path, args: list[str]) -> Iterator[bytes]:
+    """Run a git command with NUL-delimited output, yielding each entry as soon as git has written it."""
+    start = time.perf_counter()
+    with subprocess.Popen(  # noqa: S603 # there's no concern about executing untrusted input, only we will call this script
+        ["git", "-C", str(repo_path), *args],  # noqa: S607 # yes, this is not using a complete executable path, but it's just git and git should always be present in PATH
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    ) as process:
+        assert process.stdout is not None, "stdout was requested as a pipe"
+        assert process.stderr is not None, "stderr was requested as a pipe"
+        # a binary pipe with the default buffering, whose read1 returns whatever git has written so far instead of waiting for a full chunk
+        stdout = cast(io.BufferedReader, process.stdout)
+        pending = b""
+        while chunk := stdout.read1(GIT_OUTPUT_CHUNK_SIZE):
+            *entries, pending = (pending + chunk).split(b"\0")
+            yield from entries
+        stderr = process.stderr.read()
+        returncode = process.wait()
+        METRICS.record_subprocess(process.args, time.perf_counter() - start)  # pyright: ignore[reportArgumentType] # it's the list passed in above
+        if returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr)
+
+
+def get_tracked_files(repo_path: Path, pathspecs: Sequence[str] = ()) -> Iterator[str]:
+    """Yield the files tracked by Git in the given repository folder, using the 'git ls-files -z' command.
+
+    The files are yielded while git is still listing them, in the order of the Git index (which is sorted by path). If pathspecs are provided,
+    git only lists the files matching them.
+    """
+    try:
+        for entry in _iter_git_output_entries(repo_path, ["ls-files", "-z", "--", *pathspecs]):
+            yield entry.decode("utf-8")
+
+    except subprocess.CalledProcessError:
+        print("Error: The directory does not appear to be a Git repository or Git is not installed.", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        sys.exit(1)
+
 
-def get_tracked_files(repo_path: Path) -> list[str]:
-    """Return a list of files tracked by Git in the given repository folder, using the 'git ls-files' command."""
+def get_git_path(repo_path: Path, name: str) -> Path:
+    """Return the path of an entry inside the repository's Git directory, using the 'git rev-parse --git-path' command."""
     try:
-        result = subprocess.run(  # noqa: S603 # there's no concern about executing untrusted input, only we will call this script
-            ["git", "-C", str(repo_path), "ls-files"],  # noqa: S607 # yes, this is not using a complete executable path, but it's just git and git should always be present in PATH
+        result = METRICS.run(
+            ["git", "-C", str(repo_path), "rev-parse", "--git-path", name],
             capture_output=True,
             text=True,
             check=True,
         )
-        return result.stdout.splitlines()
-
     except subprocess.CalledProcessError:
         print("Error: The directory does not appear to be a Git repository or Git is not installed.", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
         sys.exit(1)
+    return repo_path / result.stdout.strip()
 
 
-def filter_files_for_devcontainer_context(files: list[str]) -> tuple[list[str], Path]:
-    devcontainer_context: list[str] = []
-    devcontainer_json_file_path: str | None = None
-    for file in files:
-        if file.startswith(".devcontainer/"):
-            if file.endswith("devcontainer.json"):
-                devcontainer_json_file_path = file
-                continue
-            devcontainer_context.append(file)
-        elif file.endswith((".lock", "pnpm-lock.yaml", "hash_git_files.py")) or file == ".pre-commit-config.yaml":
-            devcontainer_context.append(file)
-    if devcontainer_json_file_path is None:
-        raise ValueError("No devcontainer.json file found in the tracked files.")  # noqa: TRY003 # not worth a custom exception for this
-    return devcontainer_context, Path(devcontainer_json_file_path)
+def _run_git(repo_path: Path, args: list[str], stdin: bytes | None = None) -> bytes:
+    return METRICS.run(
+        ["git", "-C", str(repo_path), *args],
+        input=stdin,
+        capture_output=True,
+        check=True,
+    ).stdout
 
 
-def compute_adler32(repo_path: Path, files: list[str]) -> int:
-    """Compute an overall Adler-32 checksum of the provided files.
+def _parse_git_object_entry(entry: bytes, object_id_field: int) -> tuple[str, str]:
+    """Parse an entry of `git ls-files -s -z` or `git ls-tree -z` into (path, object ID)."""
+    info, path = entry.split(b"\t", 1)
+    return path.decode("utf-8"), info.split(b" ")[object_id_field].decode("ascii")
+
 
-    The checksum incorporates both the file names and their contents. Files are processed in sorted order to ensure consistent ordering.
+def _hash_modified_files(repo_path: Path, pathspecs: Sequence[str]) -> dict[str, str | None]:
+    """Return the object IDs of the files with unstaged modifications, or None for files deleted from the working tree.
+
+    A modified submodule gets the ID of the commit checked out in it, which is what `git add` would record for it.
     """
-    checksum = 1  # Adler-32 default starting value
+    modified_object_ids: dict[str, str | None] = {}
+    files_to_hash: list[str] = []
+    for path in _run_git(repo_path, ["ls-files", "-m", "-z", "--", *pathspecs]).decode("utf-8").split("\0"):
+        if not path:
+            continue
+        file_path = repo_path / path
+        if not os.path.lexists(file_path):
+            modified_object_ids[path] = None
+        elif file_path.is_dir():
+            modified_object_ids[path] = _run_git(file_path, ["rev-parse", "HEAD"]).decode("ascii").strip()
+        else:
+            files_to_hash.append(path)
+    if files_to_hash:
+        stdin = "".join(f"{path}\n" for path in files_to_hash).encode("utf-8")
+        object_ids = _run_git(repo_path, ["hash-object", "--stdin-paths"], stdin=stdin).decode("ascii").split()
+        modified_object_ids.update(zip(files_to_hash, object_ids, strict=True))
+    return modified_object_ids
 
-    for file in sorted(files):
-        file_path = repo_path / file  # Use pathlib to combine paths
-        # Update the checksum with the file name (encoded as bytes)
-        checksum = zlib.adler32(file.encode("utf-8"), checksum)
+
+def get_git_blob_ids(
+    repo_path: Path, ref: str | None = None, pathspecs: Sequence[str] = ()
+) -> Iterator[tuple[str, str]]:
+    """Yield the path and Git object ID of every tracked file, in the order of the Git index (which is sorted by path).
+
+    With a ref, the IDs are read from the tree of that commit, so no checkout is needed. Otherwise they are read from the index (`git ls-files -s`),
+    and only the files with unstaged modifications (`git ls-files -m`, the same check `git status` uses) are re-hashed from disk with
+    `git hash-object`, so the result reflects the working tree. Files deleted from the working tree are left out. A submodule is represented
+    by the ID of its commit, so changes inside it only count once they are committed there. Pathspecs only narrow down the files read from
+    the index, since `git ls-tree` does not support pathspec magic.
+    """
+    try:
+        if ref is not None:
+            for entry in _iter_git_output_entries(repo_path, ["ls-tree", "-r", "-z", ref]):
+                yield _parse_git_object_entry(entry, object_id_field=2)
+            return
+
+        modified_object_ids = _hash_modified_files(repo_path, pathspecs)
+        previous_path: str | None = None
+        for entry in _iter_git_output_entries(repo_path, ["ls-files", "-s", "-z", "--", *pathspecs]):
+            path, object_id = _parse_git_object_entry(entry, object_id_field=1)
+            if path == previous_path:
+                continue  # a file with merge conflicts has one entry per stage, and its working tree version is re-hashed anyway
+            previous_path = path
+            if path in modified_object_ids:
+                modified_object_id = modified_object_ids[path]
+                if modified_object_id is None:
+                    continue
+                object_id = modified_object_id
+            yield path, object_id
+    except subprocess.CalledProcessError as e:
+        print(f"Error: could not read Git object IDs: {e.stderr.decode('utf-8', 'replace').strip()}", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        sys.exit(1)
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translate a glob into a regular expression, with the same semantics as Git's `:(glob)` pathspec magic.
+
+    `*` and `?` do not match a `/`, a `**` path segment matches any number of directories (including none), and a trailing `/**` matches
+    everything inside the directory.
+    """
+    segments = pattern.split("/")
+    regex_parts: list[str] = []
+    for index, segment in enumerate(segments):
+        is_last = index == len(segments) - 1
+        if segment == "**":
+            regex_parts.append(".+" if is_last else "(?:.*/)?")
+            continue
+        segment_regex = ""
+        position = 0
+        while position < len(segment):
+            char = segment[position]
+            if char == "*":
+                segment_regex += "[^/]*"
+                while position + 1 < len(segment) and segment[position + 1] == "*":
+                    position += 1  # any other run of asterisks is the same as a single one
+            elif char == "?":
+                segment_regex += "[^/]"
+            elif char == "[" and (closing := segment.find("]", position + 2)) != -1:
+                char_class = segment[position + 1 : closing].replace("\\", "\\\\")
+                if char_class.startswith("!"):
+                    char_class = "^" + char_class[1:]
+                segment_regex += f"[{char_class}]"
+                position = closing
+            else:
+                segment_regex += re.escape(char)
+            position += 1
+        regex_parts.append(segment_regex if is_last else f"{segment_regex}/")
+    return "".join(regex_parts)
+
+
+def _compile_globs(patterns: Sequence[str]) -> re.Pattern[str] | None:
+    """Compile a list of globs into a single regular expression matching any of them."""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{_glob_to_regex(pattern)})" for pattern in patterns))
+
+
+class ContextRules:
+    """The rules selecting which tracked files make up a hashing context, compiled once into a single matcher.
+
+    A file is part of the context if it matches any of the include globs and none of the exclude globs. If the context is hashed into a
+    devcontainer.json file, that file is never part of the context itself.
+    """
+
+    def __init__(
+        self, name: str, include: Sequence[str], exclude: Sequence[str] = (), devcontainer_json: str | None = None
+    ):
+        super().__init__()
+        self.name = name
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.devcontainer_json = devcontainer_json
+        self._include_regex = _compile_globs(self.include)
+        self._exclude_regex = _compile_globs(self.exclude)
+
+    @classmethod
+    def from_json_dict(cls, name: str, json_dict: dict[str, Any]) -> "ContextRules":
+        return cls(
+            name,
+            include=json_dict["include"],
+            exclude=json_dict.get("exclude", []),
+            devcontainer_json=json_dict.get("devcontainer_json"),
+        )
+
+    def to_json_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "include": self.include,
+            "exclude": self.exclude,
+            "devcontainer_json": self.devcontainer_json,
+        }
+
+    def matches(self, file: str) -> bool:
+        if self._include_regex is None or file == self.devcontainer_json:
+            return False
+        if self._include_regex.fullmatch(file) is None:
+            return False
+        return self._exclude_regex is None or self._exclude_regex.fullmatch(file) is None
+
+    def include_pathspecs(self) -> list[str]:
+        pathspecs = [f":(glob){pattern}" for pattern in self.include]
+        if self.devcontainer_json is not None:
+            pathspecs.append(f":(literal){self.devcontainer_json}")
+        return pathspecs
+
+    def to_pathspecs(self) -> list[str]:
+        """Translate the rules into Git pathspecs, so that git only lists the relevant files in the first place."""
+        pathspecs = self.include_pathspecs()
+        if pathspecs:
+            # the devcontainer.json file is checked before the excludes in `matches`, so it must not be excluded here either
+            pathspecs.extend(
+                f":(glob,exclude){pattern}" for pattern in self.exclude if not self._excludes_devcontainer_json(pattern)
+            )
+        return pathspecs
+
+    def _excludes_devcontainer_json(self, pattern: str) -> bool:
+        return (
+            self.devcontainer_json is not None
+            and re.fullmatch(_glob_to_regex(pattern), self.devcontainer_json) is not None
+        )
+
+
+def union_pathspecs(contexts: Sequence[ContextRules]) -> list[str]:
+    """Translate the rules of several contexts into Git pathspecs listing every file that could be part of any of them."""
+    if len(contexts) == 1:
+        return contexts[0].to_pathspecs()
+    # git applies exclude pathspecs to all the other pathspecs, so one context's excludes would drop files from another context. Leave the
+    # excludes to `ContextRules.matches` instead.
+    pathspecs: list[str] = []
+    for rules in contexts:
+        pathspecs.extend(pathspec for pathspec in rules.include_pathspecs() if pathspec not in pathspecs)
+    return pathspecs
+
+
+def load_context_rules(config_file: Path) -> dict[str, ContextRules]:
+    """Load the named hashing contexts declared in the config file, falling back to the default contexts if it does not exist."""
+    contexts_json: dict[str, dict[str, Any]] = DEFAULT_CONTEXTS
+    if config_file.exists():
+        with config_file.open("r", encoding="utf-8") as f:
+            contexts_json = json.load(f)
+    return {name: ContextRules.from_json_dict(name, context_json) for name, context_json in contexts_json.items()}
+
+
+class ContextFilter[T]:
+    """Lazily filter a stream of tracked entries down to the ones that are part of a hashing context.
+
+    If the context is hashed into a devcontainer.json file, that file is recorded in `devcontainer_json_file` as it goes by.
+    """
+
+    def __init__(self, rules: ContextRules, entries: Iterable[T], path_of: Callable[[T], str]):
+        super().__init__()
+        self.rules = rules
+        self._entries = entries
+        self._path_of = path_of
+        self.devcontainer_json_file: Path | None = None
+
+    def __iter__(self) -> Iterator[T]:
+        """Yield the entries in the context, in the order they were provided."""
+        for entry in self._entries:
+            file = self._path_of(entry)
+            if file == self.rules.devcontainer_json:
+                self.devcontainer_json_file = Path(file)
+            elif self.rules.matches(file):
+                yield entry
+
+    def get_devcontainer_json_file(self) -> Path:
+        """Return the devcontainer.json file, once the entries have been fully iterated."""
+        if self.devcontainer_json_file is None:
+            raise ValueError("No devcontainer.json file found in the tracked files.")  # noqa: TRY003 # not worth a custom exception for this
+        return self.devcontainer_json_file
+
+
+def filter_files_for_devcontainer_context(
+    files: Iterable[str], rules: ContextRules | None = None
+) -> tuple[list[str], Path]:
+    if rules is None:
+        rules = ContextRules.from_json_dict(DEVCONTAINER_CONTEXT_NAME, DEFAULT_CONTEXTS[DEVCONTAINER_CONTEXT_NAME])
+    context = ContextFilter(rules, files, lambda file: file)
+    devcontainer_context = list(context)
+    return devcontainer_context, context.get_devcontainer_json_file()
+
+
+def _check_sorted(previous_file: str | None, file: str) -> None:
+    if previous_file is not None and file < previous_file:
+        raise ValueError(  # noqa: TRY003 # not worth a custom exception for this
+            f"Files must be provided in sorted order (as git lists them), but {file!r} came after {previous_file!r}"
+        )
+
+
+def adler32_combine(adler1: int, adler2: int, len2: int) -> int:
+    """Combine two Adler-32 checksums as if the data of the second had been appended to the data of the first.
+
+    Port of zlib's adler32_combine (which the Python zlib module does not expose), so that a per-file checksum can be folded into the running
+    checksum without re-reading the file.
+    """
+    remainder = len2 % ADLER32_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = (remainder * sum1) % ADLER32_BASE
+    sum1 += (adler2 & 0xFFFF) + ADLER32_BASE - 1
+    sum2 += ((adler1 >> 16) & 0xFFFF) + ((adler2 >> 16) & 0xFFFF) + ADLER32_BASE - remainder
+    if sum1 >= ADLER32_BASE:
+        sum1 -= ADLER32_BASE
+    if sum1 >= ADLER32_BASE:
+        sum1 -= ADLER32_BASE
+    if sum2 >= (ADLER32_BASE << 1):
+        sum2 -= ADLER32_BASE << 1
+    if sum2 >= ADLER32_BASE:
+        sum2 -= ADLER32_BASE
+    return sum1 | (sum2 << 16)
+
+
+def compute_file_adler32(file_path: Path) -> tuple[int, int]:
+    """Return the Adler-32 checksum of the file contents (starting from the default value) and the number of bytes read."""
+    checksum = 1
+    length = 0
+    with file_path.open("rb") as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                break
+            checksum = zlib.adler32(chunk, checksum)
+            length += len(chunk)
+    return checksum, length
+
+
+def _get_read_buffer() -> memoryview:
+    """Return a read buffer that is reused for every file read by the current thread."""
+    buffer: memoryview | None = getattr(_thread_local, "read_buffer", None)
+    if buffer is None:
+        buffer = memoryview(bytearray(READ_BUFFER_SIZE))
+        _thread_local.read_buffer = buffer
+    return buffer
+
+
+def compute_file_sha256(file_path: Path) -> str:
+    """Return the hex SHA-256 digest of the file contents.
+
+    Large files are memory-mapped and hashed in a single call, smaller ones are read into a reusable per-thread buffer. hashlib releases the GIL
+    while hashing, so this scales across threads.
+    """
+    with file_path.open("rb", buffering=0) as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return hashlib.sha256(mapped).hexdigest()
+        digest = hashlib.sha256()
+        buffer = _get_read_buffer()
+        while bytes_read := f.readinto(buffer):
+            digest.update(buffer[:bytes_read])
+        return digest.hexdigest()
+
+
+class DigestCache:
+    """On-disk cache of per-file content digests, keyed on the path and the size, mtime_ns and inode of the file.
+
+    Only the entries looked up since loading are written back by `save`, so files that are no longer tracked (or no longer part of the hashed
+    context) are evicted on the next run. Each set of files being hashed (and each algorithm) should use its own cache file for that reason.
+    """
+
+    def __init__(self, cache_file: Path, digest_width: int, entries: dict[str, list[Any]] | None = None):
+        super().__init__()
+        self.cache_file = cache_file
+        self.digest_width = digest_width
+        self._entries: dict[str, list[Any]] = entries if entries is not None else {}
+        self._used: dict[str, list[Any]] = {}
+        self._is_dirty = False
+        self._racy_cutoff_ns = time.time_ns() - DIGEST_CACHE_RACY_WINDOW_NS
+
+    @classmethod
+    def load(cls, cache_file: Path, digest_width: int) -> "DigestCache":
+        """Load the cache file, starting from an empty cache if it is missing, unreadable or from a different cache version."""
         try:
-            with file_path.open("rb") as f:
-                while True:
-                    chunk = f.read(4096)
-                    if not chunk:
-                        break
-                    checksum = zlib.adler32(chunk, checksum)
-        except Exception as e:
-            if "[Errno 21] Is a directory" in str(e):
-                # Ignore symlinks that on windows sometimes get confused as being directories
-                continue
-            print(f"Error reading file {file}: {e}", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+            with cache_file.open("r", encoding="utf-8") as f:
+                data: Any = json.load(f)
+        except (OSError, ValueError):
+            return cls(cache_file, digest_width)
+        if not isinstance(data, dict):
+            return cls(cache_file, digest_width)
+        fields = cast("dict[str, Any]", data)  # JSON object keys are always strings
+        if fields.get("version") != DIGEST_CACHE_VERSION or not isinstance(fields.get("entries"), dict):
+            return cls(cache_file, digest_width)
+        # the shape of each entry is validated when it is looked up
+        return cls(cache_file, digest_width, cast("dict[str, list[Any]]", fields["entries"]))
+
+    def get(self, file: str, stat_result: os.stat_result) -> list[Any] | None:
+        """Return the stored digest fields of the file, or None if there is no entry matching its current size, mtime and inode."""
+        entry = self._entries.get(file)
+        if (
+            isinstance(entry, list)
+            and len(entry) == 3 + self.digest_width  # size, mtime_ns, inode, then the digest fields
+            and entry[:3] == [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino]
+        ):
+            self._used[file] = entry
+            return entry[3:]
+        return None
+
+    def put(self, file: str, stat_result: os.stat_result, digest: Sequence[int | str]) -> None:
+        self._is_dirty = True
+        if stat_result.st_mtime_ns >= self._racy_cutoff_ns:
+            return
+        self._used[file] = [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, *digest]
+
+    def get_updated_entries(self) -> dict[str, list[Any]]:
+        """Return the loaded entries updated with the ones looked up since loading, for a cache that is kept in memory instead of saved."""
+        return {**self._entries, **self._used}
+
+    def save(self) -> None:
+        """Atomically write the entries used since loading back to the cache file, if anything changed."""
+        if not self._is_dirty and len(self._used) == len(self._entries):
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.cache_file.parent, prefix=f"{self.cache_file.name}.", delete=False
+        ) as f:
+            json.dump({"version": DIGEST_CACHE_VERSION, "entries": self._used}, f, separators=(",", ":"))
+        try:
+            # the rename is atomic, so a crash or a concurrent run can never leave a partially written cache file behind
+            _ = Path(f.name).replace(self.cache_file)
+        except OSError:
+            with contextlib.suppress(OSError):
+                Path(f.name).unlink()
             raise
 
-    return checksum
+
+def _get_file_digest(
+    repo_path: Path, file: str, cache: DigestCache | None, compute_digest: Callable[[Path], Sequence[int | str]]
+) -> Sequence[Any] | None:
+    """Return the digest fields of the file contents, or None if the file should not contribute any contents."""
+    file_path = repo_path / file  # Use pathlib to combine paths
+    try:
+        if cache is None:
+            return compute_digest(file_path)
+        stat_result = file_path.stat()
+        if stat.S_ISDIR(stat_result.st_mode):
+            # Ignore symlinks that on windows sometimes get confused as being directories
+            return None
+        digest = cache.get(file, stat_result)
+        if digest is None:
+            digest = compute_digest(file_path)
+            cache.put(file, stat_result, digest)
+    except Exception as e:
+        if "[Errno 21] Is a directory" in str(e):
+            # Ignore symlinks that on windows sometimes get confused as being directories
+            return None
+        print(f"Error reading file {file}: {e}", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        raise
+    return digest
+
+
+def file_digester(repo_path: Path, algorithm: str, cache: DigestCache | None) -> Callable[[str], Sequence[Any] | None]:
+    """Return a function computing the digest fields of a tracked file's contents for the given algorithm."""
+    if algorithm == ALGORITHM_ADLER32:
+        return lambda file: _get_file_digest(repo_path, file, cache, compute_file_adler32)
+    return lambda file: _get_file_digest(repo_path, file, cache, lambda file_path: (compute_file_sha256(file_path),))
+
+
+class Adler32Digest:
+    """The running Adler-32 checksum of a hashing context, which incorporates both the file names and their contents."""
+
+    def __init__(self):
+        super().__init__()
+        self.checksum = 1  # Adler-32 default starting value
+
+    def add(self, file: str, digest: Sequence[Any] | None) -> None:
+        # Update the checksum with the file name (encoded as bytes)
+        self.checksum = zlib.adler32(file.encode("utf-8"), self.checksum)
+        if digest is None:
+            return
+        content_checksum, length = digest
+        self.checksum = adler32_combine(self.checksum, content_checksum, length)
+
+    def hexdigest(self) -> str:
+        return f"{self.checksum:08x}"  # Format the checksum as an 8-digit hexadecimal value.
+
+
+class MerkleTreeBuilder:
+    """Incrementally compute the SHA-256 Merkle root of a stream of leaf digests.
+
+    The leaves are combined pairwise, level by level, and an unpaired node at the end of a level is promoted to the next level unchanged, so the
+    shape of the tree only depends on the number of leaves. Only the root of one complete subtree per level is kept in memory.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._subtrees: list[tuple[int, bytes]] = []  # (height, digest), with strictly decreasing heights
+
+    def add(self, leaf: bytes) -> None:
+        height, digest = 0, leaf
+        while self._subtrees and self._subtrees[-1][0] == height:
+            _, left = self._subtrees.pop()
+            digest = hashlib.sha256(MERKLE_NODE_PREFIX + left + digest).digest()
+            height += 1
+        self._subtrees.append((height, digest))
+
+    def root(self) -> bytes:
+        if not self._subtrees:
+            return hashlib.sha256(b"").digest()
+        # the promoted, unpaired nodes are exactly the incomplete subtrees on the right edge, so fold them from the right
+        _, digest = self._subtrees[-1]
+        for _, left in reversed(self._subtrees[:-1]):
+            digest = hashlib.sha256(MERKLE_NODE_PREFIX + left + digest).digest()
+        return digest
+
+
+def _merkle_leaf(file: str, digest: str | None) -> bytes:
+    return hashlib.sha256(
+        MERKLE_LEAF_PREFIX + file.encode("utf-8") + b"\x00" + (digest.encode("ascii") if digest is not None else b"")
+    ).digest()
+
+
+class MerkleDigest:
+    """The running SHA-256 Merkle root of a hashing context, where each leaf incorporates a file name and the digest of its contents."""
+
+    def __init__(self):
+        super().__init__()
+        self._builder = MerkleTreeBuilder()
+
+    def add(self, file: str, digest: Sequence[Any] | None) -> None:
+        self._builder.add(_merkle_leaf(file, None if digest is None else digest[0]))
+
+    def hexdigest(self) -> str:
+        return self._builder.root().hex()
+
+
+def new_context_digest(algorithm: str) -> Adler32Digest | MerkleDigest:
+    if algorithm == ALGORITHM_ADLER32:
+        return Adler32Digest()
+    if algorithm in (ALGORITHM_MERKLE_SHA256, ALGORITHM_GIT_BLOB):
+        return MerkleDigest()
+    raise NotImplementedError(f"Hashing algorithm {algorithm} is not supported")
+
+
+def _map_in_order[T, R](
+    executor: ThreadPoolExecutor, fn: Callable[[T], R], items: Iterable[T], max_pending: int
+) -> Iterator[tuple[T, R]]:
+    """Like `executor.map`, but consumes the items lazily and keeps at most `max_pending` of them in flight."""
+    pending: deque[tuple[T, Future[R]]] = deque()
+    for item in items:
+        pending.append((item, executor.submit(fn, item)))
+        if len(pending) >= max_pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+    while pending:
+        done_item, future = pending.popleft()
+        yield done_item, future.result()
+
+
+def _digest_files[T](
+    files: Iterable[tuple[str, T]],
+    digest_file: Callable[[str], Sequence[Any] | None],
+    algorithm: str,
+    jobs: int | None,
+) -> Iterator[tuple[str, T, Sequence[Any] | None]]:
+    """Digest the contents of the (file, payload) pairs, yielding them in the order they were provided together with their digest.
+
+    With Adler-32 the files are read one at a time, as the original checksum did. With SHA-256 they are digested in parallel on a thread pool.
+    """
+    if algorithm == ALGORITHM_ADLER32:
+        for file, payload in files:
+            yield file, payload, digest_file(file)
+        return
+    workers = jobs if jobs is not None else min(32, (os.cpu_count() or 1) + 4)  # the same default as ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (file, payload), digest in _map_in_order(
+            executor,
+            lambda item: digest_file(item[0]),
+            files,
+            max_pending=workers * PENDING_DIGESTS_PER_THREAD,
+        ):
+            yield file, payload, digest
+
+
+def _compute_single_context(
+    repo_path: Path, files: Iterable[str], algorithm: str, cache: DigestCache | None, jobs: int | None
+) -> Adler32Digest | MerkleDigest:
+    context_digest = new_context_digest(algorithm)
+    previous_file: str | None = None
+    digest_file = file_digester(repo_path, algorithm, cache)
+    for file, _, digest in _digest_files(((file, None) for file in files), digest_file, algorithm, jobs):
+        _check_sorted(previous_file, file)
+        previous_file = file
+        context_digest.add(file, digest)
+    return context_digest
+
+
+def compute_adler32(repo_path: Path, files: Iterable[str], cache: DigestCache | None = None) -> int:
+    """Compute an overall Adler-32 checksum of the provided files.
+
+    The checksum incorporates both the file names and their contents. Files must be provided in sorted order (the order git lists them in) to
+    ensure consistent ordering, so that they can be hashed while they are still being listed. If a cache is provided, the checksum of the contents
+    of unchanged files is taken from it instead of re-reading them.
+    """
+    context_digest = _compute_single_context(repo_path, files, ALGORITHM_ADLER32, cache, jobs=None)
+    assert isinstance(context_digest, Adler32Digest)
+    return context_digest.checksum
+
+
+def compute_merkle_sha256(
+    repo_path: Path, files: Iterable[str], cache: DigestCache | None = None, jobs: int | None = None
+) -> str:
+    """Compute an overall SHA-256 Merkle root of the provided files.
+
+    The files are digested in parallel on a thread pool. Each leaf incorporates both the file name and the digest of its contents, and the leaves
+    are combined in the order the files are provided (which must be sorted, as git lists them) so the result does not depend on which thread
+    finished first.
+    """
+    return _compute_single_context(repo_path, files, ALGORITHM_MERKLE_SHA256, cache, jobs).hexdigest()
+
+
+class MultiContextHasher:
+    """Hash several contexts in a single pass over the tracked files.
+
+    Every file is matched against the rules of all the contexts, so it only needs to be digested once no matter how many contexts it is part
+    of, and its digest is then fed to each of them. The devcontainer.json files of the contexts are recorded as they go by.
+    """
+
+    def __init__(self, contexts: Sequence[ContextRules], algorithm: str):
+        super().__init__()
+        self.contexts = list(contexts)
+        self._context_digests = [new_context_digest(algorithm) for _ in self.contexts]
+        self.devcontainer_json_files: dict[str, Path] = {}
+
+    def select[T](self, entries: Iterable[T], path_of: Callable[[T], str]) -> Iterator[tuple[T, list[int]]]:
+        """Yield the entries that are part of at least one context, together with the indexes of those contexts."""
+        previous_file: str | None = None
+        for entry in entries:
+            file = path_of(entry)
+            _check_sorted(previous_file, file)
+            previous_file = file
+            members: list[int] = []
+            for index, rules in enumerate(self.contexts):
+                if file == rules.devcontainer_json:
+                    self.devcontainer_json_files[rules.name] = Path(file)
+                elif rules.matches(file):
+                    members.append(index)
+            if members:
+                yield entry, members
+
+    def add(self, file: str, digest: Sequence[Any] | None, members: Iterable[int]) -> None:
+        for index in members:
+            self._context_digests[index].add(file, digest)
+
+    def hexdigests(self) -> dict[str, str]:
+        return {
+            rules.name: context_digest.hexdigest()
+            for rules, context_digest in zip(self.contexts, self._context_digests, strict=True)
+        }
 
 
 def find_devcontainer_hash_line(lines: list[str]) -> tuple[int, str | None]:
@@ -127,10 +835,407 @@ def update_devcontainer_context_hash(devcontainer_json_file: Path, new_hash: str
         raise
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Compute an Adler-32 checksum of all Git-tracked files in the specified folder."
+def save_digest_cache(cache: DigestCache) -> None:
+    try:
+        cache.save()
+    except OSError as e:
+        # the cache is only an optimization, so failing to write it should never fail the hash computation
+        print(f"Warning: could not write digest cache {cache.cache_file}: {e}", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+
+
+class InotifyWatcher:
+    """Watch directories for changes with the Linux inotify API, called through ctypes so that no extra dependency is needed."""
+
+    def __init__(self):
+        super().__init__()
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd: int = self._libc.inotify_init1(INOTIFY_NONBLOCK | INOTIFY_CLOEXEC)
+        if self._fd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def add_watch(self, directory: Path, mask: int) -> int:
+        wd: int = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask | INOTIFY_ONLYDIR)
+        if wd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number), str(directory))
+        return wd
+
+    def remove_watch(self, wd: int) -> None:
+        _ = self._libc.inotify_rm_watch(self._fd, wd)  # fails harmlessly if the kernel already dropped the watch
+
+    def read_events(self) -> Iterator[tuple[int, int, str]]:
+        """Yield the (watch descriptor, mask, name) of every event queued so far, without blocking."""
+        while True:
+            try:
+                buffer = os.read(self._fd, INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+                offset += INOTIFY_EVENT_HEADER.size
+                name = os.fsdecode(buffer[offset : offset + name_length].rstrip(b"\x00"))
+                offset += name_length
+                yield wd, mask, name
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class HashDaemon:
+    """Answer context hash queries over a Unix socket, keeping the tracked files and the per-file digests in memory between queries.
+
+    The digests of files in watched directories are trusted until inotify reports a change in that directory, so answering a query does not
+    need to stat anything. Pending events are always drained before answering, and since the kernel queues them before the write returns, a
+    query can never see a digest of a file that was modified before the query was sent. Files that cannot be watched (or every file, when
+    inotify is not available) fall back to polling their size, mtime and inode like the on-disk cache does.
+    """
+
+    def __init__(self, repo_path: Path, socket_path: Path):
+        super().__init__()
+        self.repo_path = repo_path.resolve()
+        self.socket_path = socket_path
+        self._index_file = get_git_path(self.repo_path, "index").resolve()
+        self._index_stamp: tuple[int, int, int] | None = None
+        self._index_wd: int | None = None
+        self._tracked_files: dict[tuple[str, ...], list[str]] = {}
+        self._watched_directories: dict[str, int] = {}
+        self._directories_by_wd: dict[int, str] = {}
+        self._digests: dict[tuple[str, str], Sequence[Any] | None] = {}  # (algorithm, file) -> digest fields
+        self._polling_caches: dict[str, DigestCache] = {}
+        self._watcher: InotifyWatcher | None = None
+        try:
+            self._watcher = InotifyWatcher()
+            self._index_wd = self._watcher.add_watch(self._index_file.parent, INOTIFY_INDEX_MASK)
+        except OSError as e:
+            print(f"inotify is not available ({e}), falling back to polling", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+
+    def _forget_directory(self, directory: str) -> None:
+        prefix = f"{directory}/" if directory else ""
+        for key in [key for key in self._digests if key[1].startswith(prefix)]:
+            del self._digests[key]
+        for watched, wd in list(self._watched_directories.items()):
+            if watched == directory or watched.startswith(prefix):
+                del self._watched_directories[watched]
+                del self._directories_by_wd[wd]
+                if self._watcher is not None:
+                    self._watcher.remove_watch(wd)
+        # the cached file lists are what the watches get re-added from, so they must be listed again
+        self._tracked_files.clear()
+
+    def process_events(self) -> None:
+        """Invalidate everything the queued inotify events report as possibly changed."""
+        if self._watcher is None:
+            return
+        for wd, mask, name in self._watcher.read_events():
+            if mask & INOTIFY_Q_OVERFLOW:
+                self._forget_directory("")
+            elif wd == self._index_wd:
+                if name == self._index_file.name:
+                    self._tracked_files.clear()
+            elif (directory := self._directories_by_wd.get(wd)) is None:
+                continue
+            elif mask & (INOTIFY_DELETE_SELF | INOTIFY_MOVE_SELF | INOTIFY_IGNORED):
+                self._forget_directory(directory)
+            else:
+                path = f"{directory}/{name}" if directory else name
+                if mask & INOTIFY_ISDIR:
+                    self._forget_directory(path)
+                else:
+                    for algorithm in (ALGORITHM_ADLER32, ALGORITHM_MERKLE_SHA256):
+                        _ = self._digests.pop((algorithm, path), None)
+
+    def _watch_directories(self, files: Iterable[str]) -> None:
+        if self._watcher is None:
+            return
+        for directory in {file.rpartition("/")[0] for file in files}:
+            if directory in self._watched_directories:
+                continue
+            try:
+                wd = self._watcher.add_watch(self.repo_path / directory, INOTIFY_DIRECTORY_MASK)
+            except OSError:
+                continue  # e.g. a deleted directory or the watch limit, so the files in it are polled instead
+            self._watched_directories[directory] = wd
+            self._directories_by_wd[wd] = directory
+
+    def _get_tracked_files(self, pathspecs: Sequence[str]) -> list[str]:
+        if self._index_wd is None:
+            index_stat = self._index_file.stat()
+            index_stamp = (index_stat.st_size, index_stat.st_mtime_ns, index_stat.st_ino)
+            if index_stamp != self._index_stamp:
+                self._tracked_files.clear()
+                self._index_stamp = index_stamp
+        key = tuple(pathspecs)
+        if key not in self._tracked_files:
+            files = list(get_tracked_files(self.repo_path, pathspecs))
+            self._watch_directories(files)
+            self._tracked_files[key] = files
+        return self._tracked_files[key]
+
+    def _file_digester(self, algorithm: str, cache: DigestCache) -> Callable[[str], Sequence[Any] | None]:
+        poll = file_digester(self.repo_path, algorithm, cache)
+        compute = file_digester(self.repo_path, algorithm, None)
+
+        def digest_file(file: str) -> Sequence[Any] | None:
+            key = (algorithm, file)
+            if key in self._digests:
+                return self._digests[key]
+            if file.rpartition("/")[0] not in self._watched_directories or (self.repo_path / file).is_symlink():
+                return poll(file)  # a change to the target of a symlink is not reported in the directory of the link
+            digest = compute(file)
+            self._digests[key] = digest
+            return digest
+
+        return digest_file
+
+    def handle_request(self, request: dict[str, Any]) -> dict[str, Any]:
+        if request.get("version") != DAEMON_PROTOCOL_VERSION:
+            raise ValueError(f"Unsupported protocol version {request.get('version')}")  # noqa: TRY003 # not worth a custom exception for this
+        if Path(request["folder"]) != self.repo_path:
+            raise ValueError(f"This daemon serves {self.repo_path}, not {request['folder']}")  # noqa: TRY003 # not worth a custom exception for this
+        algorithm: str = request["algorithm"]
+        if algorithm not in (ALGORITHM_ADLER32, ALGORITHM_MERKLE_SHA256):
+            raise NotImplementedError(f"Hashing algorithm {algorithm} is not supported by the daemon")
+        self.process_events()
+        contexts = [ContextRules.from_json_dict(context["name"], context) for context in request["contexts"]]
+        hasher = MultiContextHasher(contexts, algorithm)
+        previous_cache = self._polling_caches.get(algorithm)
+        cache = DigestCache(
+            Path(os.devnull),  # never saved
+            digest_width=2 if algorithm == ALGORITHM_ADLER32 else 1,
+            entries=previous_cache.get_updated_entries() if previous_cache is not None else None,
+        )
+        self._polling_caches[algorithm] = cache
+        for file, members, digest in _digest_files(
+            hasher.select(self._get_tracked_files(union_pathspecs(contexts)), lambda file: file),
+            self._file_digester(algorithm, cache),
+            algorithm,
+            request.get("jobs"),
+        ):
+            hasher.add(file, digest, members)
+        return {
+            "hashes": hasher.hexdigests(),
+            "devcontainer_json_files": {name: str(path) for name, path in hasher.devcontainer_json_files.items()},
+        }
+
+    def _answer(self, server: socket.socket) -> None:
+        connection, _ = server.accept()
+        with connection:
+            connection.settimeout(DAEMON_CONNECT_TIMEOUT_SECONDS)
+            try:
+                with connection.makefile("rb") as request_file:
+                    request = json.loads(request_file.readline())
+                response = self.handle_request(request)
+            except (Exception, SystemExit) as e:  # noqa: BLE001 # a bad query should never take down the daemon, the client falls back to hashing directly
+                response = {"error": str(e)}
+            with contextlib.suppress(OSError):
+                connection.sendall(json.dumps(response).encode("utf-8") + b"\n")
+
+    def serve_forever(self) -> None:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server, selectors.DefaultSelector() as selector:
+            server.bind(str(self.socket_path))
+            try:
+                self.socket_path.chmod(0o600)
+                server.listen()
+                _ = selector.register(server, selectors.EVENT_READ)
+                if self._watcher is not None:
+                    _ = selector.register(self._watcher.fileno(), selectors.EVENT_READ)
+                print(f"Serving context hashes of {self.repo_path} on {self.socket_path}", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+                while True:
+                    for key, _ in selector.select():
+                        if key.fileobj is server:
+                            self._answer(server)
+                        else:
+                            self.process_events()  # keep the kernel queue short, so that it does not overflow between queries
+            finally:
+                self.socket_path.unlink(missing_ok=True)
+                if self._watcher is not None:
+                    self._watcher.close()
+
+
+def _is_daemon_running(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(DAEMON_CONNECT_TIMEOUT_SECONDS)
+        try:
+            client.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def _handle_sigterm(signum: int, frame: FrameType | None) -> None:  # noqa: ARG001 # the signature signal.signal expects
+    # exit through SystemExit, so that the socket file is still removed on the way out
+    sys.exit(0)
+
+
+def serve(repo_path: Path, socket_path: Path) -> None:
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        if _is_daemon_running(socket_path):
+            print(f"Error: a daemon is already serving {socket_path}", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+            sys.exit(1)
+        socket_path.unlink()  # left behind by a daemon that did not shut down cleanly
+    _ = signal.signal(signal.SIGTERM, _handle_sigterm)
+    with contextlib.suppress(KeyboardInterrupt):
+        HashDaemon(repo_path, socket_path).serve_forever()
+
+
+def query_daemon(
+    socket_path: Path, repo_path: Path, contexts: Sequence[ContextRules], algorithm: str, jobs: int | None
+) -> tuple[dict[str, str], dict[str, Path]] | None:
+    """Ask a running daemon for the hashes of the contexts, returning None if there is no daemon able to answer."""
+    if not hasattr(socket, "AF_UNIX") or not socket_path.exists():
+        return None
+    request = {
+        "version": DAEMON_PROTOCOL_VERSION,
+        "folder": str(repo_path.resolve()),
+        "algorithm": algorithm,
+        "contexts": [rules.to_json_dict() for rules in contexts],
+        "jobs": jobs,
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(DAEMON_CONNECT_TIMEOUT_SECONDS)
+            client.connect(str(socket_path))
+            client.settimeout(DAEMON_RESPONSE_TIMEOUT_SECONDS)
+            client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with client.makefile("rb") as response_file:
+                response: Any = json.loads(response_file.readline())
+    except (OSError, ValueError):
+        return None
+    if "error" in response:
+        print(f"Warning: the daemon could not answer ({response['error']}), hashing directly", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        return None
+    return response["hashes"], {name: Path(file) for name, file in response["devcontainer_json_files"].items()}
+
+
+def _select_contexts(args: argparse.Namespace, repo_path: Path) -> list[ContextRules]:
+    context_names: list[str] | None = args.contexts
+    if context_names is None and not args.for_devcontainer_config_update:
+        return [ContextRules(ALL_FILES_CONTEXT_NAME, include=["**"])]
+    config_file: Path = (
+        args.context_config if args.context_config is not None else repo_path / CONTEXTS_CONFIG_RELATIVE_PATH
+    )
+    available_contexts = load_context_rules(config_file)
+    contexts: list[ContextRules] = []
+    for name in context_names if context_names is not None else [DEVCONTAINER_CONTEXT_NAME]:
+        if name not in available_contexts:
+            print(  # noqa: T201 # this just runs as a simple script, so using print instead of log
+                f"Error: unknown context {name!r}, {config_file} declares: {', '.join(available_contexts)}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        if args.for_devcontainer_config_update and available_contexts[name].devcontainer_json is None:
+            print(f"Error: context {name!r} is not hashed into a devcontainer.json file", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+            sys.exit(1)
+        if available_contexts[name] not in contexts:
+            contexts.append(available_contexts[name])
+    return contexts
+
+
+def _load_digest_cache(
+    args: argparse.Namespace, repo_path: Path, contexts: Sequence[ContextRules]
+) -> DigestCache | None:
+    if args.no_cache:
+        return None
+    cache_dir: Path = args.cache_dir if args.cache_dir is not None else get_git_path(repo_path, "hash_git_files")
+    # the cache only keeps the entries used by the latest run, so each set of contexts gets its own cache file
+    cache_name = "+".join(sorted(rules.name for rules in contexts))
+    return DigestCache.load(
+        cache_dir / f"{cache_name}-{args.algorithm}.json",
+        digest_width=2 if args.algorithm == ALGORITHM_ADLER32 else 1,
     )
+
+
+def _compute_context_hashes(
+    args: argparse.Namespace, repo_path: Path, contexts: Sequence[ContextRules]
+) -> MultiContextHasher:
+    """Stream the Git-tracked files through the hashing pipeline once, feeding each file to every context it is part of."""
+    hasher = MultiContextHasher(contexts, args.algorithm)
+    pathspecs = union_pathspecs(contexts)
+    cache: DigestCache | None = None
+    digested: Iterable[tuple[str, list[int], Sequence[Any] | None]]
+    if args.algorithm == ALGORITHM_GIT_BLOB:
+        digested = (
+            (file, members, (object_id,))
+            for (file, object_id), members in hasher.select(
+                get_git_blob_ids(repo_path, args.ref, pathspecs), lambda entry: entry[0]
+            )
+        )
+    else:
+        cache = _load_digest_cache(args, repo_path, contexts)
+        digested = _digest_files(
+            hasher.select(get_tracked_files(repo_path, pathspecs), lambda file: file),
+            file_digester(repo_path, args.algorithm, cache),
+            args.algorithm,
+            args.jobs,
+        )
+
+    # If the debug flag is specified, print out all discovered files.
+    if args.debug:
+        print("Tracked files discovered:")  # noqa: T201 # this just runs as a simple script, so using print instead of log
+    for file, members, digest in digested:
+        if args.debug:
+            print(file)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        hasher.add(file, digest, members)
+
+    if cache is not None:
+        save_digest_cache(cache)
+    return hasher
+
+
+def _get_daemon_socket(args: argparse.Namespace, repo_path: Path) -> Path:
+    if args.daemon_socket is not None:
+        return args.daemon_socket
+    return get_git_path(repo_path, "hash_git_files") / DAEMON_SOCKET_NAME
+
+
+def _hash_contexts(
+    args: argparse.Namespace, repo_path: Path, contexts: Sequence[ContextRules]
+) -> tuple[dict[str, str], dict[str, Path]]:
+    """Return the hashes and devcontainer.json files of the contexts, from the daemon if one is running and otherwise by hashing directly."""
+    # the daemon only keeps the working tree files in memory, and does not report which files it hashed
+    if not (args.no_daemon or args.no_cache or args.debug or args.algorithm == ALGORITHM_GIT_BLOB):
+        result = query_daemon(_get_daemon_socket(args, repo_path), repo_path, contexts, args.algorithm, args.jobs)
+        if result is not None:
+            return result
+    hasher = _compute_context_hashes(args, repo_path, contexts)
+    return hasher.hexdigests(), hasher.devcontainer_json_files
+
+
+def _update_devcontainer_hashes(
+    args: argparse.Namespace, hashes: dict[str, str], devcontainer_json_files: dict[str, Path]
+) -> None:
+    any_updated = False
+    for name, overall_checksum_str in hashes.items():
+        if name not in devcontainer_json_files:
+            raise ValueError(f"No devcontainer.json file for context {name!r} found in the tracked files.")  # noqa: TRY003 # not worth a custom exception for this
+        devcontainer_json_file = devcontainer_json_files[name]
+        current_hash = extract_devcontainer_context_hash(devcontainer_json_file)
+        if current_hash != overall_checksum_str:
+            update_devcontainer_context_hash(devcontainer_json_file, overall_checksum_str)
+            print(  # noqa: T201
+                f"Updated {devcontainer_json_file} with the new hash: {overall_checksum_str}"
+            )
+            any_updated = True
+    if any_updated:
+        if args.exit_zero:
+            sys.exit(0)
+        else:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute a checksum of all Git-tracked files in the specified folder.")
     _ = parser.add_argument("folder", type=Path, help="Path to the Git repository folder")
     _ = parser.add_argument("--debug", action="store_true", help="Print all discovered Git-tracked files")
     _ = parser.add_argument(
@@ -139,45 +1244,108 @@ def main():
         help="Update the hash in the devcontainer.json file based on all files relevant to devcontainer context",
     )
     _ = parser.add_argument("--exit-zero", action="store_true", help="Exit with code 0 even if the hash changes")
+    _ = parser.add_argument(
+        "--no-cache", action="store_true", help="Re-read every file instead of using the cache of per-file digests"
+    )
+    _ = parser.add_argument(
+        "--algorithm",
+        choices=[ALGORITHM_ADLER32, ALGORITHM_MERKLE_SHA256, ALGORITHM_GIT_BLOB],
+        default=ALGORITHM_ADLER32,
+        help=(
+            f"How to combine the files into the hash. '{ALGORITHM_ADLER32}' (default) is the original single-threaded streaming checksum, "
+            f"'{ALGORITHM_MERKLE_SHA256}' digests files in parallel and combines them in a Merkle tree, "
+            f"'{ALGORITHM_GIT_BLOB}' combines the Git object IDs in a Merkle tree and only reads files with unstaged modifications"
+        ),
+    )
+    _ = parser.add_argument(
+        "--ref",
+        default=None,
+        help=f"Hash the files of this commit instead of the working tree, without checking it out (requires '{ALGORITHM_GIT_BLOB}')",
+    )
+    _ = parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help=f"Number of threads used to digest files with '{ALGORITHM_MERKLE_SHA256}' (default: based on the CPU count)",
+    )
+    _ = parser.add_argument(
+        "--context-config",
+        type=Path,
+        default=None,
+        help=f"JSON file declaring the rules of the hashing contexts (default: {CONTEXTS_CONFIG_RELATIVE_PATH.as_posix()} in the repository folder)",
+    )
+    _ = parser.add_argument(
+        "--context",
+        dest="contexts",
+        action="append",
+        default=None,
+        help=(
+            "Name of a context declared in the context config to hash instead of all the files. Can be repeated to hash several contexts "
+            f"in a single pass, in which case the hashes are printed in the --output-format (default: {DEVCONTAINER_CONTEXT_NAME} with "
+            "--for-devcontainer-config-update, which then updates the devcontainer.json file of each context)"
+        ),
+    )
+    _ = parser.add_argument(
+        "--output-format",
+        choices=[OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_GITHUB_OUTPUT],
+        default=OUTPUT_FORMAT_JSON,
+        help=(
+            f"How to print the hashes of the contexts selected with --context. '{OUTPUT_FORMAT_JSON}' (default) prints an object mapping "
+            f"the context names to their hash, '{OUTPUT_FORMAT_GITHUB_OUTPUT}' prints `name=hash` lines to append to $GITHUB_OUTPUT"
+        ),
+    )
+    _ = parser.add_argument(
+        "--serve",
+        action="store_true",
+        help=(
+            "Run in the foreground as a daemon that keeps the tracked files and their digests in memory (invalidated with inotify, or "
+            "by polling where that is not available) and answers the hash queries of later invocations over a Unix socket"
+        ),
+    )
+    _ = parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Always hash directly, even if a daemon is serving the repository folder",
+    )
+    _ = parser.add_argument(
+        "--daemon-socket",
+        type=Path,
+        default=None,
+        help=f"Unix socket of the daemon (default: {DAEMON_SOCKET_NAME} in the hash_git_files folder inside the Git directory)",
+    )
+    _ = parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Where to store the cache of per-file digests (default: the hash_git_files folder inside the Git directory)",
+    )
     args = parser.parse_args()
+    if args.ref is not None and args.algorithm != ALGORITHM_GIT_BLOB:
+        parser.error(f"--ref requires --algorithm {ALGORITHM_GIT_BLOB}")
+    if args.ref is not None and args.for_devcontainer_config_update:
+        parser.error("--ref cannot be combined with --for-devcontainer-config-update")
 
     repo_path = args.folder
     if not repo_path.is_dir():
         print(f"Error: {repo_path} is not a valid directory.", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
         sys.exit(1)
 
-    # Retrieve the list of Git-tracked files.
-    files = get_tracked_files(repo_path)
-    devcontainer_json_file: Path | None = None
-    if args.for_devcontainer_config_update:
-        files, devcontainer_json_file = filter_files_for_devcontainer_context(files)
-
-    # If the debug flag is specified, print out all discovered files.
-    if args.debug:
-        print("Tracked files discovered:")  # noqa: T201 # this just runs as a simple script, so using print instead of log
-        for file in files:
-            print(file)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+    if args.serve:
+        serve(repo_path, _get_daemon_socket(args, repo_path))
+        return
 
-    # Compute the overall Adler-32 checksum.
-    overall_checksum = compute_adler32(repo_path, files)
-    overall_checksum_str = f"{overall_checksum:08x}"  # Format the checksum as an 8-digit hexadecimal value.
+    with METRICS.phase("hash"):
+        hashes, devcontainer_json_files = _hash_contexts(args, repo_path, _select_contexts(args, repo_path))
     if args.for_devcontainer_config_update:
-        assert devcontainer_json_file is not None, (
-            "this should have been set earlier in a similar conditional statement"
-        )
-        current_hash = extract_devcontainer_context_hash(devcontainer_json_file)
-        if current_hash != overall_checksum_str:
-            update_devcontainer_context_hash(devcontainer_json_file, overall_checksum_str)
-            print(  # noqa: T201
-                f"Updated {devcontainer_json_file} with the new hash: {overall_checksum_str}"
-            )
-            if args.exit_zero:
-                sys.exit(0)
-            else:
-                sys.exit(1)
-
+        with METRICS.phase("update_devcontainer_json"):
+            _update_devcontainer_hashes(args, hashes, devcontainer_json_files)
+    elif args.contexts is None:
+        print(hashes[ALL_FILES_CONTEXT_NAME])  # noqa: T201 # print this so that the value can be picked up via STDOUT when calling this in a CI pipeline or as a subprocess
+    elif args.output_format == OUTPUT_FORMAT_GITHUB_OUTPUT:
+        for name, overall_checksum_str in hashes.items():
+            print(f"{name}={overall_checksum_str}")  # noqa: T201 # print this so that the value can be picked up via STDOUT when calling this in a CI pipeline or as a subprocess
     else:
-        print(overall_checksum_str)  # noqa: T201 # print this so that the value can be picked up via STDOUT when calling this in a CI pipeline or as a subprocess
+        print(json.dumps(hashes))  # noqa: T201 # print this so that the value can be picked up via STDOUT when calling this in a CI pipeline or as a subprocess
 
 
 if __name__ == "__main__":
@@ -1,56 +1,192 @@
-"""Update any project files that point to a private package registry to use public ones.
+"""Update any project files (pyproject.toml and uv.lock) that point to a private package registry to use public ones.
 
 Since the CI pipelines for testing these copier templates don't have access to private registries, we can't test installing from them as part of CI.
 
 Seems minimal risk, since the only problem we'd be missing is if the pyproject.toml (or similar config files) had syntax errors that would have been
 caught by pre-commit.
+
+The rewritten uv.lock files are left without the distributions that only the private registry served, so they must be relocked afterwards,
+which CI does by running `manual-setup-deps.py --skip-check-lock` (a `uv sync` that isn't frozen) right after this script.
 """
 
+import hashlib
+import mmap
+import os
 import re
+import shutil
+import tempfile
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import TextIO
+
+# "pyproject.toml" is 1 part, "subdir/pyproject.toml" is 2 parts, and "subdir/subsubdir/pyproject.toml" is 3 parts
+MAX_PATH_PARTS = 3
+FILE_NAMES = frozenset({"pyproject.toml", "uv.lock"})
+INDEX_BLOCK_HEADER = "[[tool.uv.index]]"
+PUBLIC_INDEX_URL = "https://pypi.org/simple/"
+# uv normalizes the registry URLs it writes into uv.lock, dropping the trailing slash
+PUBLIC_LOCK_REGISTRY_URL = "https://pypi.org/simple"
+# CodeArtifact is the only private registry the template supports
+PRIVATE_REGISTRY_MARKERS = (".codeartifact.",)
+PRIVATE_URL_PATTERN = re.compile(
+    r'"https?://[^"]*(?:' + "|".join(re.escape(marker) for marker in PRIVATE_REGISTRY_MARKERS) + r')[^"]*"'
+)
+# e.g. `source = { registry = "..." }` or `{ name = "...", index = "..." }`, as opposed to the `url` of a distribution
+INDEX_KEY_PATTERN = re.compile(r'\b(?:registry|index)\s*=\s*"')
+TABLE_HEADER_PATTERN = re.compile(r"^\s*\[\[?[^\[\],]+\]\]?\s*(?:#.*)?$")
+DEFAULT_TRUE_PATTERN = re.compile(r"^\s*default\s*=\s*true\b")
+# installed dependencies and caches can hold hundreds of thousands of files, none of which are the project's own config files
+PRUNED_DIRECTORY_NAMES = frozenset(
+    {
+        ".git",
+        ".venv",
+        "venv",
+        "node_modules",
+        "site-packages",
+        "__pycache__",
+        ".cache",
+        ".mypy_cache",
+        ".pytest_cache",
+        ".ruff_cache",
+        ".tox",
+        ".nox",
+    }
+)
+
+
+def contains_any(file_path: Path, markers: tuple[bytes, ...]) -> bool:
+    """Check for any of the markers without reading the file into memory, to cheaply skip the files with nothing to rewrite."""
+    if file_path.stat().st_size == 0:
+        return False  # an empty file can't be memory-mapped
+    with file_path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return any(mapped.find(marker) != -1 for marker in markers)
+
+
+def rewrite_atomically(file_path: Path, rewrite: Callable[[Iterable[str]], Iterator[str]]) -> bool:
+    """Stream the lines of the file through the rewrite into a temporary file, and only replace the file if something changed.
+
+    Returns whether the file was replaced. Leaving unchanged files (and their mtimes) alone keeps any hash caches of them valid.
+    """
+    input_digest = hashlib.sha256()
+    output_digest = hashlib.sha256()
+
+    def read_lines(source: TextIO) -> Iterator[str]:
+        for line in source:
+            input_digest.update(line.encode("utf-8"))
+            yield line
+
+    with (
+        file_path.open("r", encoding="utf-8", newline="") as source,
+        tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", newline="", dir=file_path.parent, prefix=f".{file_path.name}.", delete=False
+        ) as target,
+    ):
+        for line in rewrite(read_lines(source)):
+            output_digest.update(line.encode("utf-8"))
+            _ = target.write(line)
+    temp_file = Path(target.name)
+    if input_digest.digest() == output_digest.digest():
+        temp_file.unlink()
+        return False
+    shutil.copymode(file_path, temp_file)
+    _ = temp_file.replace(file_path)
+    return True
+
+
+def _is_table_header(line: str) -> bool:
+    return TABLE_HEADER_PATTERN.match(line) is not None
+
+
+def has_default_index(lines: Iterable[str]) -> bool:
+    in_index_block = False
+    for line in lines:
+        if _is_table_header(line):
+            in_index_block = line.strip() == INDEX_BLOCK_HEADER
+        elif in_index_block and DEFAULT_TRUE_PATTERN.match(line):
+            return True
+    return False
+
+
+def replace_index_blocks(lines: Iterable[str]) -> Iterator[str]:
+    """Remove every [[tool.uv.index]] block, and append a single block for PyPI.
+
+    A block ends at the next table header of either kind, so a `[table]` right after an index block is kept.
+    """
+    in_index_block = False
+    last_line = ""
+    for line in lines:
+        if _is_table_header(line):
+            in_index_block = line.strip() == INDEX_BLOCK_HEADER
+        if in_index_block:
+            continue
+        last_line = line
+        yield line
+    # Ensure file ends with a newline before appending the new block.
+    if last_line and not last_line.endswith("\n"):
+        yield "\n"
+    yield f'{INDEX_BLOCK_HEADER}\nname = "pypi"\nurl = "{PUBLIC_INDEX_URL}"\n'
 
 
-def process_file(file_path: Path):
-    # Read the entire file content
-    content = file_path.read_text()
+def replace_lock_registries(lines: Iterable[str]) -> Iterator[str]:
+    """Point the registry and index URLs of the lock file at PyPI, and drop the distributions only the private registry serves.
 
-    # Regex to match a block starting with [[tool.uv.index]]
-    # until the next block header (a line starting with [[) or the end of the file.
-    pattern = re.compile(r"(\[\[tool\.uv\.index\]\].*?)(?=\n\[\[|$)", re.DOTALL)
+    The URLs and hashes of those distributions can't be translated to PyPI's, so the next `uv lock` fills them back in from PyPI, preferring
+    the versions that were locked.
+    """
+    for line in lines:
+        if PRIVATE_URL_PATTERN.search(line) is None:
+            yield line
+        elif INDEX_KEY_PATTERN.search(line) is not None:
+            yield PRIVATE_URL_PATTERN.sub(f'"{PUBLIC_LOCK_REGISTRY_URL}"', line)
 
-    # Find all uv.index blocks.
-    blocks = pattern.findall(content)
 
-    # Check if any block contains "default = true"
-    if not any("default = true" in block for block in blocks):
-        print(f"No changes in: {file_path}")
-        return
+def process_pyproject(file_path: Path) -> bool:
+    if not contains_any(file_path, (INDEX_BLOCK_HEADER.encode("utf-8"),)):
+        return False
+    with file_path.open("r", encoding="utf-8") as f:
+        # If at least one block contains "default = true", replace all uv.index blocks.
+        if not has_default_index(f):
+            return False
+    return rewrite_atomically(file_path, replace_index_blocks)
 
-    # If at least one block contains "default = true", remove all uv.index blocks.
-    new_content = pattern.sub("", content)
 
-    # Ensure file ends with a newline before appending the new block.
-    if not new_content.endswith("\n"):
-        new_content += "\n"
+def process_lock_file(file_path: Path) -> bool:
+    if not contains_any(file_path, tuple(marker.encode("utf-8") for marker in PRIVATE_REGISTRY_MARKERS)):
+        return False
+    return rewrite_atomically(file_path, replace_lock_registries)
 
-    # Append the new block.
-    new_block = '[[tool.uv.index]]\nname = "pypi"\nurl = "https://pypi.org/simple/"\n'
-    new_content += new_block
 
-    # Write the updated content back to the file.
-    _ = file_path.write_text(new_content)
-    print(f"Updated file: {file_path}")
+def process_file(file_path: Path):
+    is_updated = process_lock_file(file_path) if file_path.name == "uv.lock" else process_pyproject(file_path)
+    print(f"Updated file: {file_path}" if is_updated else f"No changes in: {file_path}")
+
+
+def find_files(base_dir: Path, file_names: frozenset[str]) -> list[Path]:
+    """Find the files with any of the names at most MAX_PATH_PARTS deep, without descending any deeper or into PRUNED_DIRECTORY_NAMES."""
+    found: list[Path] = []
+    directories = [(base_dir, 1)]
+    while directories:
+        directory, parts = directories.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name in file_names and entry.is_file():
+                    found.append(directory / entry.name)
+                elif (
+                    parts < MAX_PATH_PARTS
+                    and entry.name not in PRUNED_DIRECTORY_NAMES
+                    and entry.is_dir(follow_symlinks=False)
+                ):
+                    directories.append((directory / entry.name, parts + 1))
+    return sorted(found)
 
 
 def main():
-    base_dir = Path(".")
-    # Use rglob to find all pyproject.toml files recursively.
-    for file_path in base_dir.rglob("pyproject.toml"):
-        # Check if the file is at most two levels deep.
-        # The relative path's parts count should be <= 3 (e.g. "pyproject.toml" is 1 part,
-        # "subdir/pyproject.toml" is 2 parts, and "subdir/subsubdir/pyproject.toml" is 3 parts).
-        if len(file_path.relative_to(base_dir).parts) <= 3:
-            process_file(file_path)
+    with ThreadPoolExecutor() as executor:
+        # consume the results, so that any exception is raised
+        _ = list(executor.map(process_file, find_files(Path(), FILE_NAMES)))
 
 
 if __name__ == "__main__":
@@ -1,8 +1,25 @@
 import argparse
+import json
+import os
+import re
 import subprocess
+import sys
+import time
 import tomllib
+from collections.abc import Iterable
 from pathlib import Path
 
+# the per-phase timings are recorded by the module shared by all the repo tooling scripts, which lives in .devcontainer (this
+# file is in src/ of the template itself, but in .github/workflows/ of the repositories instantiated from it)
+sys.path.extend(str(directory / ".devcontainer") for directory in Path(__file__).resolve().parents[1:3])
+from tooling_metrics import PhaseMetrics
+
+# how long a snapshot of the remote's tags is trusted for the checks that don't push anything
+DEFAULT_TAG_INDEX_TTL_SECONDS = 300
+
+
+METRICS = PhaseMetrics(Path(__file__).name)
+
 
 def extract_version(toml_path: Path | str) -> str:
     """Load toml_path and return the version string.
@@ -27,8 +44,8 @@ def extract_version(toml_path: Path | str) -> str:
 
 def ensure_tag_not_present(tag: str, remote: str) -> None:
     try:
-        _ = subprocess.run(  # noqa: S603 # this is trusted input, it's our own arguments being passed in
-            ["git", "ls-remote", "--exit-code", "--tags", remote, f"refs/tags/{tag}"],  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+        _ = METRICS.run(
+            ["git", "ls-remote", "--exit-code", "--tags", remote, f"refs/tags/{tag}"],
             check=True,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
@@ -39,6 +56,149 @@ def ensure_tag_not_present(tag: str, remote: str) -> None:
         return
 
 
+def discover_pyproject_files() -> list[Path]:
+    """Return every pyproject.toml tracked in the repository, at any depth."""
+    result = METRICS.run(
+        ["git", "ls-files", "-z", "--", ":(glob)**/pyproject.toml"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return sorted(Path(file) for file in result.stdout.split("\0") if file)
+
+
+def tag_for(pyproject_file: Path, version: str) -> str:
+    """Name the tag of the package, prefixed with its directory unless it is at the root of the repository."""
+    directory = pyproject_file.parent.as_posix()
+    return f"v{version}" if directory == "." else f"{directory}/v{version}"
+
+
+def fetch_remote_tags(remote: str) -> set[str]:
+    """List every tag on the remote in a single round-trip."""
+    result = METRICS.run(
+        ["git", "ls-remote", "--tags", "--refs", remote],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return {line.partition("\trefs/tags/")[2] for line in result.stdout.splitlines() if "\trefs/tags/" in line}
+
+
+class TagIndex:
+    """The tags known to be on a remote: the local tags, plus a snapshot of the remote's tags that is reused for up to a TTL.
+
+    Only the checks right before pushing need to ask the remote, so every other check is a local lookup while the snapshot is fresh.
+    """
+
+    def __init__(self, remote: str, ttl_seconds: float):
+        super().__init__()
+        self.remote = remote
+        self.ttl_seconds = ttl_seconds
+
+    def _snapshot_file(self) -> Path:
+        # kept inside the .git folder, so it's never tracked and is shared by every worktree
+        result = METRICS.run(
+            ["git", "rev-parse", "--git-common-dir"],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        remote_name = re.sub(r"[^A-Za-z0-9_.-]", "_", self.remote)
+        return Path(result.stdout.strip()) / "git-tag-index" / f"{remote_name}.json"
+
+    def _load_snapshot(self, snapshot_file: Path) -> set[str] | None:
+        try:
+            with snapshot_file.open("r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if time.time() - snapshot["fetched_at"] < self.ttl_seconds:
+                return set(snapshot["tags"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return None
+
+    def local_tags(self) -> set[str]:
+        result = METRICS.run(
+            ["git", "for-each-ref", "--format=%(refname:strip=2)", "refs/tags"],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        return set(result.stdout.splitlines())
+
+    def remote_tags(self, *, authoritative: bool = False) -> set[str]:
+        """Return the tags on the remote, from the snapshot if it's fresh and the caller doesn't need an authoritative answer."""
+        snapshot_file = self._snapshot_file()
+        if not authoritative and (snapshot := self._load_snapshot(snapshot_file)) is not None:
+            return snapshot
+        tags = fetch_remote_tags(self.remote)
+        self._save_snapshot(snapshot_file, time.time(), tags)
+        return tags
+
+    def _save_snapshot(self, snapshot_file: Path, fetched_at: float, tags: set[str]) -> None:
+        snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = snapshot_file.with_name(f"{snapshot_file.name}.{os.getpid()}.tmp")
+        with temp_file.open("w", encoding="utf-8") as f:
+            json.dump({"fetched_at": fetched_at, "tags": sorted(tags)}, f)
+        _ = temp_file.replace(snapshot_file)
+
+    def add_pushed(self, tags: Iterable[str]) -> None:
+        """Add tags that were just pushed to the snapshot, so that it doesn't report them as missing until it expires."""
+        snapshot_file = self._snapshot_file()
+        try:
+            with snapshot_file.open("r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            fetched_at = float(snapshot["fetched_at"])
+            known_tags = set(snapshot["tags"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return  # without a snapshot, the next check asks the remote anyway
+        self._save_snapshot(snapshot_file, fetched_at, known_tags | set(tags))
+
+    def existing(self, tags: Iterable[str]) -> list[str]:
+        """Return which of the tags exist, counting the local tags as present so the remote is only asked about the others."""
+        tags = set(tags)
+        known_tags = self.local_tags()
+        if tags - known_tags:
+            known_tags |= self.remote_tags()
+        return sorted(tags & known_tags)
+
+
+def push_new_tags(tags: list[str], remote: str) -> None:
+    """Create the tags on HEAD and push all of them atomically, so that either every tag lands on the remote or none does."""
+    ref_updates = "".join(f"create refs/tags/{tag} HEAD\n" for tag in tags)
+    _ = METRICS.run(["git", "update-ref", "--stdin"], check=True, input=ref_updates, text=True)
+    _ = METRICS.run(["git", "push", "--atomic", remote, *(f"refs/tags/{tag}" for tag in tags)], check=True)
+
+
+def main_batch(args: argparse.Namespace) -> None:
+    with METRICS.phase("extract_version"):
+        tags: dict[Path, str] = {}
+        for pyproject_file in discover_pyproject_files():
+            try:
+                tags[pyproject_file] = tag_for(pyproject_file, extract_version(pyproject_file))
+            except KeyError:
+                continue  # e.g. the virtual root of a uv workspace
+    if not args.push_tag_to_remote and not args.confirm_tag_not_present:
+        for pyproject_file, tag in tags.items():
+            print(f"{pyproject_file}\t{tag}")  # noqa: T201 # specifically printing this out so CI pipelines can read the value from stdout
+        return
+
+    # as for a single file, pushing takes precedence over only confirming, and fails if any of the tags is already on the remote
+    tag_index = TagIndex(args.remote, args.tag_index_ttl)
+    with METRICS.phase("confirm_tag_not_present"):
+        if args.push_tag_to_remote:
+            # right before pushing, the remote itself is asked instead of trusting the snapshot
+            present_tags = sorted(set(tags.values()) & tag_index.remote_tags(authoritative=True))
+        else:
+            present_tags = tag_index.existing(tags.values())
+    if present_tags:
+        raise Exception(f"Error: tags {', '.join(present_tags)} exist on remote '{args.remote}'")  # noqa: TRY002,TRY003 # not worth a custom exception
+    if not args.push_tag_to_remote or not tags:
+        return
+    with METRICS.phase("push_tag"):
+        push_new_tags(sorted(tags.values()), args.remote)
+        tag_index.add_pushed(tags.values())
+
+
 def main():
     parser = argparse.ArgumentParser(
         description=(
@@ -50,7 +210,7 @@ def main():
     _ = parser.add_argument(
         "file",
         nargs="?",
-        default="pyproject.toml",
+        default=None,
         help="Path to pyproject.toml (default: pyproject.toml)",
     )
     _ = parser.add_argument(
@@ -66,25 +226,57 @@ def main():
             "Internally confirms the tag is not already present."
         ),
     )
+    _ = parser.add_argument(
+        "--batch",
+        action="store_true",
+        help=(
+            "Handle every pyproject.toml tracked in the repository at once, tagging each package as "
+            "<directory>/v<version> (or v<version> at the root), instead of just the given file. "
+            "With --push-tag-to-remote, all the tags are pushed atomically, and none of them is if any is already on the remote."
+        ),
+    )
     _ = parser.add_argument(
         "--remote",
         default="origin",
         help="Name of git remote to query/push (default: origin)",
     )
+    _ = parser.add_argument(
+        "--tag-index-ttl",
+        type=float,
+        default=DEFAULT_TAG_INDEX_TTL_SECONDS,
+        help=(
+            "How many seconds a cached snapshot of the remote's tags answers --confirm-tag-not-present before the remote "
+            f"is asked again (default: {DEFAULT_TAG_INDEX_TTL_SECONDS}, 0 to always ask). Pushing always asks the remote."
+        ),
+    )
     args = parser.parse_args()
 
-    ver = extract_version(args.file)
+    if args.batch:
+        if args.file is not None:
+            parser.error(
+                "a file cannot be given with --batch, which handles every pyproject.toml tracked in the repository"
+            )
+        main_batch(args)
+        return
+
+    with METRICS.phase("extract_version"):
+        ver = extract_version(args.file if args.file is not None else "pyproject.toml")
 
     tag = f"v{ver}"
 
     if args.push_tag_to_remote:
-        ensure_tag_not_present(tag, args.remote)
-        _ = subprocess.run(["git", "tag", tag], check=True)  # noqa: S603,S607 # this is trusted input, it's our own pyproject.toml file. and if `git` isn't in PATH, then there are larger problems anyway
-        _ = subprocess.run(["git", "push", args.remote, tag], check=True)  # noqa: S603,S607 # this is trusted input, it's our own pyproject.toml file. and if `git` isn't in PATH, then there are larger problems anyway
+        with METRICS.phase("confirm_tag_not_present"):
+            ensure_tag_not_present(tag, args.remote)
+        with METRICS.phase("push_tag"):
+            _ = METRICS.run(["git", "tag", tag], check=True)
+            _ = METRICS.run(["git", "push", args.remote, tag], check=True)
+            TagIndex(args.remote, args.tag_index_ttl).add_pushed([tag])
         return
 
     if args.confirm_tag_not_present:
-        ensure_tag_not_present(tag, args.remote)
+        with METRICS.phase("confirm_tag_not_present"):
+            if TagIndex(args.remote, args.tag_index_ttl).existing([tag]):
+                raise Exception(f"Error: tag '{tag}' exists on remote '{args.remote}'")  # noqa: TRY002,TRY003 # not worth a custom exception
         return
 
     # Default behavior: just print the version
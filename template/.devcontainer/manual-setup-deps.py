@@ -1,22 +1,44 @@
 import argparse
+import base64
 import enum
+import graphlib
+import hashlib
 import json
 import os
 import platform
+import re
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import tomllib
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from pathlib import Path
 from typing import Any
+from typing import cast
+
+from tooling_metrics import PhaseMetrics
 
 REPO_ROOT_DIR = Path(__file__).parent.parent.resolve()
 ENVS_CONFIG = REPO_ROOT_DIR / ".devcontainer" / "envs.json"
+# the fingerprint of each environment as of its last successful setup, so that unchanged environments can be skipped
+STATE_FILE = REPO_ROOT_DIR / ".cache" / "manual-setup-deps-state.json"
+STATE_VERSION = 1
+# the uv cache and pnpm store shared by all the environments, kept in the home directory so that every checkout on the machine shares it too
+PACKAGE_CACHE_DIR_ENV_VAR = "REPO_TOOLING_PACKAGE_CACHE_DIR"
 parser = argparse.ArgumentParser(description="Manual setup for dependencies in the repo")
 _ = parser.add_argument(
     "--python-version",
     type=str,
-    default=f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}",
-    help="What version to install.",
+    # the pre-commit hooks run this with whichever `python` is first in PATH, so a UV_PYTHON already chosen by CI takes precedence
+    default=os.environ.get("UV_PYTHON", f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"),
+    help="What version to install (default: $UV_PYTHON, or the version of the interpreter running this script).",
 )
 _ = parser.add_argument("--skip-check-lock", action="store_true", default=False, help="Skip the lock file check step")
 _ = parser.add_argument(
@@ -31,6 +53,42 @@ _ = parser.add_argument(
 _ = parser.add_argument(
     "--no-node", action="store_true", default=False, help="Do not process any environments using node package managers"
 )
+_ = parser.add_argument(
+    "--jobs",
+    type=int,
+    default=1,
+    help="How many environments to set up concurrently. With more than one, the output of each environment is prefixed with its name",
+)
+_ = parser.add_argument(
+    "--force",
+    action="store_true",
+    default=False,
+    help="Set up every environment, even the ones whose lock file, manifest and tool versions are unchanged since their last setup",
+)
+_ = parser.add_argument(
+    "--fail-fast",
+    action="store_true",
+    default=False,
+    help="Stop setting up all the other environments as soon as one of them fails",
+)
+_ = parser.add_argument(
+    "--package-cache-dir",
+    type=Path,
+    default=Path(os.environ.get(PACKAGE_CACHE_DIR_ENV_VAR, Path.home() / ".cache" / "repo-tooling" / "packages")),
+    help=f"Directory of the uv cache and pnpm store shared by all the environments (default: ${PACKAGE_CACHE_DIR_ENV_VAR} or ~/.cache/repo-tooling/packages)",
+)
+subparsers = parser.add_subparsers(dest="command")
+cache_parser = subparsers.add_parser(
+    "cache", help="Manage the package cache shared by the environments instead of setting them up"
+)
+_ = cache_parser.add_argument(
+    "action",
+    choices=["warm", "stats", "prune"],
+    help="warm: download every locked package into the cache. stats: report the size of the cache and how many locked packages it already holds. prune: remove the packages that no lock file references anymore",
+)
+
+
+METRICS = PhaseMetrics(Path(__file__).name)
 
 
 class PackageManager(str, enum.Enum):
@@ -45,20 +103,435 @@ class EnvConfig:
         self.path = REPO_ROOT_DIR
         if "relative_directory" in json_dict:
             self.path = REPO_ROOT_DIR / json_dict["relative_directory"]
+        self.name: str = json_dict.get("description", self.path.relative_to(REPO_ROOT_DIR).as_posix())
+        # the names (descriptions) of the environments that must be set up before this one
+        self.depends_on: list[str] = json_dict.get("depends_on", [])
         if self.package_manager == PackageManager.UV:
             self.lock_file = self.path / "uv.lock"
+            self.manifest_file = self.path / "pyproject.toml"
+            self.installed_dir = self.path / os.environ.get("UV_PROJECT_ENVIRONMENT", ".venv")
         elif self.package_manager == PackageManager.PNPM:
             self.lock_file = self.path / "pnpm-lock.yaml"
+            self.manifest_file = self.path / "package.json"
+            self.installed_dir = self.path / "node_modules"
         else:
             raise NotImplementedError(f"Package manager {self.package_manager} is not supported")
 
 
+def _executable_identity(name: str) -> str:
+    # Asking the tool for its version would mean starting it (and for pnpm, a whole Node process). Any upgrade replaces the resolved
+    # executable though, which changes its size or mtime.
+    executable = shutil.which(name)
+    if executable is None:
+        return "missing"
+    resolved = Path(executable).resolve()
+    stat_result = resolved.stat()
+    return f"{resolved}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+
+
+class SetupState:
+    """The fingerprint of each environment as of its last successful setup, persisted in the state file."""
+
+    def __init__(self, state_file: Path, fingerprints: dict[str, str] | None = None):
+        super().__init__()
+        self.state_file = state_file
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+        self._is_dirty = False
+
+    @classmethod
+    def load(cls, state_file: Path) -> "SetupState":
+        """Load the state file, starting from an empty state if it is missing, unreadable or from a different version."""
+        try:
+            with state_file.open("r", encoding="utf-8") as f:
+                data: Any = json.load(f)
+        except (OSError, ValueError):
+            return cls(state_file)
+        if not isinstance(data, dict):
+            return cls(state_file)
+        fields = cast("dict[str, Any]", data)  # JSON object keys are always strings
+        if fields.get("version") != STATE_VERSION or not isinstance(fields.get("fingerprints"), dict):
+            return cls(state_file)
+        # the fingerprints are only ever compared for equality, so a malformed one just never matches
+        return cls(state_file, cast("dict[str, str]", fields["fingerprints"]))
+
+    def is_up_to_date(self, env: EnvConfig, fingerprint: str) -> bool:
+        return (
+            self.fingerprints.get(env.path.relative_to(REPO_ROOT_DIR).as_posix()) == fingerprint
+            and env.installed_dir.exists()
+        )
+
+    def record(self, env: EnvConfig, fingerprint: str) -> None:
+        self.fingerprints[env.path.relative_to(REPO_ROOT_DIR).as_posix()] = fingerprint
+        self._is_dirty = True
+
+    def save(self) -> None:
+        """Atomically write the state file, if anything changed."""
+        if not self._is_dirty:
+            return
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.state_file.parent, prefix=f"{self.state_file.name}.", delete=False
+        ) as f:
+            json.dump({"version": STATE_VERSION, "fingerprints": self.fingerprints}, f, indent=2)
+        _ = Path(f.name).replace(self.state_file)
+
+
+def check_dependencies(envs: list[EnvConfig]) -> None:
+    """Raise a ValueError if the environments have duplicate names, unknown dependencies or a dependency cycle."""
+    names = [env.name for env in envs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(
+            f"Environment names must be unique to be depended on, but found duplicates: {', '.join(duplicates)}"
+        )
+    for env in envs:
+        unknown = [dependency for dependency in env.depends_on if dependency not in names]
+        if unknown:
+            raise ValueError(f"Environment {env.name} depends on unknown environments: {', '.join(unknown)}")
+    try:
+        graphlib.TopologicalSorter({env.name: env.depends_on for env in envs}).prepare()
+    except graphlib.CycleError as e:
+        cycle: list[str] = e.args[1]
+        raise ValueError(f"Environments depend on each other in a cycle: {' -> '.join(cycle)}") from e
+
+
+def _locked_uv_packages(lock_file: Path) -> set[tuple[str, str]]:
+    """Return the (name, version) of every package in the uv lock file that comes from an index."""
+    with lock_file.open("rb") as f:
+        lock = tomllib.load(f)
+    return {
+        (package["name"], package["version"])
+        for package in lock.get("package", [])
+        if "registry" in package.get("source", {}) and "version" in package
+    }
+
+
+def _locked_pnpm_integrities(lock_file: Path) -> set[str]:
+    # The standard library can't parse YAML, but every package resolved from a registry has exactly one `integrity: sha512-...` field
+    return set(re.findall(r"integrity: (sha\d+-[A-Za-z0-9+/=]+)", lock_file.read_text(encoding="utf-8")))
+
+
+def _size_bytes(directory: Path) -> int:
+    # the files hardlinked many times over are only counted once
+    seen_inodes: set[tuple[int, int]] = set()
+    total = 0
+    for root, _, files in os.walk(directory):
+        for file in files:
+            stat_result = (Path(root) / file).lstat()
+            if (stat_result.st_dev, stat_result.st_ino) not in seen_inodes:
+                seen_inodes.add((stat_result.st_dev, stat_result.st_ino))
+                total += stat_result.st_size
+    return total
+
+
+class PackageCache:
+    """The uv cache and pnpm store shared by all the environments, so that each package is only downloaded and unpacked once.
+
+    Only the layout that uv and pnpm have kept stable across their cache versions is relied on: uv keeps the wheels and source
+    distributions of each package in a directory named after it, and pnpm names its index files after the integrity hash of each package.
+    """
+
+    def __init__(self, cache_dir: Path):
+        super().__init__()
+        self.uv_dir = cache_dir / "uv"
+        self.pnpm_store_dir = cache_dir / "pnpm-store"
+
+    def _uv_package_dirs(self) -> list[Path]:
+        return [
+            package_dir
+            for pattern in ("wheels-v*/pypi/*", "wheels-v*/index/*/*", "sdists-v*/pypi/*", "sdists-v*/index/*/*")
+            for package_dir in self.uv_dir.glob(pattern)
+            if package_dir.is_dir()
+        ]
+
+    def is_uv_package_cached(self, name: str, version: str) -> bool:
+        # the entries of a package directory are named `<version>-<wheel tags>` for wheels and `<version>` for source distributions, and
+        # a wheel version can never contain a dash
+        return any(
+            package_dir.name == name and any(entry.name.partition("-")[0] == version for entry in package_dir.iterdir())
+            for package_dir in self._uv_package_dirs()
+        )
+
+    def is_pnpm_package_cached(self, integrity: str) -> bool:
+        digest = base64.b64decode(integrity.partition("-")[2]).hex()
+        return any(self.pnpm_store_dir.glob(f"v*/*/{digest[:2]}/{digest[2:]}*"))
+
+    def print_stats(self, envs: list[EnvConfig]) -> None:
+        uv_packages = {
+            package
+            for env in envs
+            if env.package_manager == PackageManager.UV and env.lock_file.exists()
+            for package in _locked_uv_packages(env.lock_file)
+        }
+        pnpm_integrities = {
+            integrity
+            for env in envs
+            if env.package_manager == PackageManager.PNPM and env.lock_file.exists()
+            for integrity in _locked_pnpm_integrities(env.lock_file)
+        }
+        for name, directory, cached, locked in (
+            ("uv", self.uv_dir, sum(self.is_uv_package_cached(*package) for package in uv_packages), len(uv_packages)),
+            (
+                "pnpm",
+                self.pnpm_store_dir,
+                sum(self.is_pnpm_package_cached(integrity) for integrity in pnpm_integrities),
+                len(pnpm_integrities),
+            ),
+        ):
+            size_mb = _size_bytes(directory) / 1_000_000 if directory.exists() else 0
+            hit_rate = f"{cached / locked:.0%}" if locked else "n/a"
+            print(
+                f"{name}: {size_mb:.1f} MB in {directory}, {cached}/{locked} locked packages cached (hit rate {hit_rate})"
+            )
+
+    def prune_uv(self, envs: list[EnvConfig]) -> None:
+        """Remove the cached packages that no uv lock file references, whatever their version."""
+        locked_names = {
+            name
+            for env in envs
+            if env.package_manager == PackageManager.UV and env.lock_file.exists()
+            for name, _ in _locked_uv_packages(env.lock_file)
+        }
+        for package_dir in self._uv_package_dirs():
+            if package_dir.name not in locked_names:
+                print(f"Removing {package_dir.relative_to(self.uv_dir)} from the uv cache")
+                shutil.rmtree(package_dir)
+
+
+class EnvDependencyFailedError(Exception):
+    def __init__(self, failed_dependencies: list[str]):
+        super().__init__(f"Not set up because it depends on failed environments: {', '.join(failed_dependencies)}")
+
+
+class EnvSetupCancelledError(Exception):
+    def __init__(self):
+        super().__init__("cancelled because another environment failed")
+
+
+class EnvRunner:
+    """Check the lock files and install the dependencies of environments, possibly several of them concurrently.
+
+    When running concurrently, the output of each command is streamed line by line with the name of its environment as a prefix, so that
+    the interleaved output of the environments can still be told apart.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        super().__init__()
+        self.args = args
+        self.is_windows = platform.system() == "Windows"
+        self.uv_env = dict(os.environ)
+        self.uv_env.update({"UV_PYTHON_PREFERENCE": "only-system", "UV_PYTHON": args.python_version})
+        self.package_cache = PackageCache(args.package_cache_dir)
+        # a uv cache that is already configured (e.g. one restored by CI) is kept, and the cache subcommand then manages that one
+        self.package_cache.uv_dir = Path(self.uv_env.setdefault("UV_CACHE_DIR", str(self.package_cache.uv_dir)))
+        # uv falls back to copying (with a warning) when the cache is on a different filesystem than the environment
+        _ = self.uv_env.setdefault("UV_LINK_MODE", "hardlink")
+        self.skip_check_lock: bool = args.skip_check_lock or args.optionally_check_lock
+        self.state = SetupState.load(STATE_FILE)
+        self.prefix_output = args.jobs > 1
+        self._lock = threading.Lock()
+        self._running_processes: set[subprocess.Popen[str]] = set()
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        """Stop all the commands that are running, and refuse to start any new one."""
+        with self._lock:
+            self._cancelled = True
+            for process in self._running_processes:
+                process.terminate()
+
+    def _run_command(self, env: EnvConfig, command: list[str], process_env: dict[str, str] | None = None) -> None:
+        if not self.prefix_output:
+            _ = METRICS.run(command, check=True, env=process_env)
+            return
+        start = time.perf_counter()
+        with subprocess.Popen(  # noqa: S603 # these are our own package manager commands
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=process_env, text=True, errors="replace"
+        ) as process:
+            with self._lock:
+                if self._cancelled:
+                    process.terminate()
+                self._running_processes.add(process)
+            assert process.stdout is not None, "stdout was requested as a pipe"
+            for line in process.stdout:
+                with self._lock:
+                    print(f"[{env.name}] {line}", end="", flush=True)
+            returncode = process.wait()
+            with self._lock:
+                self._running_processes.discard(process)
+        METRICS.record_subprocess(command, time.perf_counter() - start)
+        if self._cancelled:
+            raise EnvSetupCancelledError
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command)
+
+    def setup(self, env: EnvConfig) -> None:
+        if self._cancelled:
+            raise EnvSetupCancelledError
+        env_skip_check_lock = self.skip_check_lock
+        if self.args.optionally_check_lock and env.lock_file.exists():
+            env_skip_check_lock = False
+        if not self.args.force and self.state.is_up_to_date(
+            env, self._fingerprint(env, env_skip_check_lock=env_skip_check_lock)
+        ):
+            print(f"Skipping environment {env.path} as nothing changed since it was last set up")
+            return
+        if not env_skip_check_lock:
+            self._check_lock(env)
+        self._install(env, env_skip_check_lock=env_skip_check_lock)
+        # only fingerprinted now, since an install that isn't frozen to the lock file may have just rewritten it
+        self.state.record(env, self._fingerprint(env, env_skip_check_lock=env_skip_check_lock))
+
+    def _fingerprint(self, env: EnvConfig, *, env_skip_check_lock: bool) -> str:
+        """Fingerprint everything that determines the result of setting up the environment."""
+        digest = hashlib.sha256()
+        parts = [env.package_manager.value, str(env_skip_check_lock), _executable_identity(env.package_manager.value)]
+        if env.package_manager == PackageManager.UV:
+            parts.append(self.args.python_version)
+        for part in parts:
+            digest.update(part.encode("utf-8") + b"\0")
+        for file in (env.lock_file, env.manifest_file):
+            digest.update(file.read_bytes() if file.exists() else b"missing")
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _check_lock(self, env: EnvConfig) -> None:
+        if env.package_manager == PackageManager.UV:
+            with METRICS.phase(f"check_lock:{env.path.relative_to(REPO_ROOT_DIR).as_posix()}"):
+                self._run_command(env, ["uv", "lock", "--check", "--directory", str(env.path)], self.uv_env)
+        elif env.package_manager == PackageManager.PNPM:
+            pass  # doesn't seem to be a way to do this https://github.com/orgs/pnpm/discussions/3202
+        else:
+            raise NotImplementedError(f"Package manager {env.package_manager} does not support lock file checking")
+
+    def _install(self, env: EnvConfig, *, env_skip_check_lock: bool) -> None:
+        env_name = env.path.relative_to(REPO_ROOT_DIR).as_posix()
+        if env.package_manager == PackageManager.UV:
+            sync_command = ["uv", "sync", "--directory", str(env.path)]
+            if not env_skip_check_lock:
+                sync_command.append("--frozen")
+            with METRICS.phase(f"install:{env_name}"):
+                self._run_command(env, sync_command, self.uv_env)
+        elif env.package_manager == PackageManager.PNPM:
+            pnpm_command = ["install", "--dir", str(env.path)]
+            if not env_skip_check_lock:
+                pnpm_command.append("--frozen-lockfile")
+            with METRICS.phase(f"install:{env_name}"):
+                self._run_command(env, self._pnpm_command(pnpm_command))
+        else:
+            raise NotImplementedError(f"Package manager {env.package_manager} is not supported for installation")
+
+    def _pnpm_command(self, pnpm_args: list[str]) -> list[str]:
+        # pnpm hardlinks from its store by default, whenever the store is on the same filesystem
+        pnpm_command = ["pnpm", *pnpm_args, "--store-dir", str(self.package_cache.pnpm_store_dir)]
+        if not self.is_windows:
+            return pnpm_command
+        pwsh = shutil.which("pwsh") or shutil.which("powershell")
+        if not pwsh:
+            raise FileNotFoundError("Neither 'pwsh' nor 'powershell' found on PATH")
+        return [
+            pwsh,
+            "-NoProfile",
+            "-NonInteractive",
+            "-Command",
+            " ".join(pnpm_command),
+        ]
+
+    def warm_cache(self, env: EnvConfig) -> None:
+        """Download and unpack every package in the lock file of the environment into the shared cache, without installing them."""
+        if not env.lock_file.exists():
+            print(f"Skipping environment {env.path} as it has no lock file to warm the cache from")
+            return
+        with METRICS.phase(f"warm_cache:{env.path.relative_to(REPO_ROOT_DIR).as_posix()}"):
+            if env.package_manager == PackageManager.UV:
+                # uv has no download-only mode, so install into a throwaway environment instead
+                with tempfile.TemporaryDirectory() as venv_dir:
+                    self._run_command(
+                        env,
+                        [
+                            "uv",
+                            "sync",
+                            "--frozen",
+                            "--no-install-project",
+                            "--all-extras",
+                            "--all-groups",
+                            "--directory",
+                            str(env.path),
+                        ],
+                        {**self.uv_env, "UV_PROJECT_ENVIRONMENT": venv_dir},
+                    )
+            elif env.package_manager == PackageManager.PNPM:
+                self._run_command(env, self._pnpm_command(["fetch", "--dir", str(env.path)]))
+            else:
+                raise NotImplementedError(f"Package manager {env.package_manager} does not support warming the cache")
+
+    def prune_cache(self, envs: list[EnvConfig]) -> None:
+        """Remove the packages that no lock file of the environments references from the shared cache."""
+        with METRICS.phase("prune_cache"):
+            if any(env.package_manager == PackageManager.UV for env in envs) and self.package_cache.uv_dir.exists():
+                self.package_cache.prune_uv(envs)
+                # then let uv remove the unpacked archives that only the pruned packages pointed to
+                _ = METRICS.run(["uv", "cache", "prune"], check=True, env=self.uv_env)
+            if (
+                any(env.package_manager == PackageManager.PNPM for env in envs)
+                and self.package_cache.pnpm_store_dir.exists()
+            ):
+                # pnpm already tracks which projects use each package of its store
+                _ = METRICS.run(self._pnpm_command(["store", "prune"]), check=True)
+
+
+def run_envs(
+    runner: EnvRunner, envs: list[EnvConfig], action: Callable[[EnvConfig], None] | None = None
+) -> dict[str, BaseException]:
+    """Set up the environments (or run another action on them) with at most `--jobs` at a time, returning the failure of each one that failed.
+
+    Each environment starts as soon as all the environments it depends on have finished. Dependencies on environments that
+    are not being set up (e.g. due to `--no-node`) are considered satisfied.
+    """
+    envs_by_name = {env.name: env for env in envs}
+    dependencies = {env.name: [name for name in env.depends_on if name in envs_by_name] for env in envs}
+    if action is None:
+        action = runner.setup
+    sorter = graphlib.TopologicalSorter(dependencies)
+    sorter.prepare()
+    failures: dict[str, BaseException] = {}
+    with ThreadPoolExecutor(max_workers=max(1, runner.args.jobs)) as executor:
+        running: dict[Future[None], EnvConfig] = {}
+        while sorter.is_active():
+            for name in sorter.get_ready():
+                failed_dependencies = [dependency for dependency in dependencies[name] if dependency in failures]
+                if failed_dependencies:
+                    failures[name] = EnvDependencyFailedError(failed_dependencies)
+                    sorter.done(name)
+                    continue
+                running[executor.submit(action, envs_by_name[name])] = envs_by_name[name]
+            if not running:
+                continue  # only failed dependents were ready, which may have made their own dependents ready
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                env = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    failures[env.name] = error
+                    if runner.args.fail_fast and not isinstance(error, EnvSetupCancelledError):
+                        runner.cancel()
+                sorter.done(env.name)
+    return failures
+
+
+def run_cache_command(runner: EnvRunner, envs: list[EnvConfig]) -> dict[str, BaseException]:
+    """Run the action of the `cache` subcommand, returning the failure of each environment that failed."""
+    if runner.args.action == "stats":
+        runner.package_cache.print_stats(envs)
+        return {}
+    if runner.args.action == "prune":
+        runner.prune_cache(envs)
+        return {}
+    return run_envs(runner, envs, action=runner.warm_cache)
+
+
 def main():
     args = parser.parse_args(sys.argv[1:])
-    is_windows = platform.system() == "Windows"
-    uv_env = dict(os.environ)
-    uv_env.update({"UV_PYTHON_PREFERENCE": "only-system", "UV_PYTHON": args.python_version})
-    skip_check_lock = args.skip_check_lock or args.optionally_check_lock
     if args.skip_check_lock and args.optionally_check_lock:
         print("Cannot skip and optionally check the lock file at the same time.")
         sys.exit(1)
@@ -66,54 +539,33 @@ def main():
     with ENVS_CONFIG.open("r") as f:
         envs = json.load(f)
 
-    for env_dict in envs:
-        env = EnvConfig(env_dict)
+    all_envs = [EnvConfig(env_dict) for env_dict in envs]
+    try:
+        check_dependencies(all_envs)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    envs_to_setup: list[EnvConfig] = []
+    for env in all_envs:
         if args.no_python and env.package_manager == PackageManager.UV:
             print(f"Skipping environment {env.path} as it uses a Python package manager and --no-python is set")
             continue
         if args.no_node and env.package_manager == PackageManager.PNPM:
             print(f"Skipping environment {env.path} as it uses a Node package manager and --no-node is set")
             continue
-        env_skip_check_lock = skip_check_lock
-        if args.optionally_check_lock and env.lock_file.exists():
-            env_skip_check_lock = False
-        if not env_skip_check_lock:
-            if env.package_manager == PackageManager.UV:
-                _ = subprocess.run(["uv", "lock", "--check", "--directory", str(env.path)], check=True, env=uv_env)
-            elif env.package_manager == PackageManager.PNPM:
-                pass  # doesn't seem to be a way to do this https://github.com/orgs/pnpm/discussions/3202
-            else:
-                raise NotImplementedError(f"Package manager {env.package_manager} does not support lock file checking")
-        if env.package_manager == PackageManager.UV:
-            sync_command = ["uv", "sync", "--directory", str(env.path)]
-            if not env_skip_check_lock:
-                sync_command.append("--frozen")
-            _ = subprocess.run(
-                sync_command,
-                check=True,
-                env=uv_env,
-            )
-        elif env.package_manager == PackageManager.PNPM:
-            pnpm_command = ["pnpm", "install", "--dir", str(env.path)]
-            if not env_skip_check_lock:
-                pnpm_command.append("--frozen-lockfile")
-            if is_windows:
-                pwsh = shutil.which("pwsh") or shutil.which("powershell")
-                if not pwsh:
-                    raise FileNotFoundError("Neither 'pwsh' nor 'powershell' found on PATH")
-                pnpm_command = [
-                    pwsh,
-                    "-NoProfile",
-                    "-NonInteractive",
-                    "-Command",
-                    " ".join(pnpm_command),
-                ]
-            _ = subprocess.run(
-                pnpm_command,
-                check=True,
-            )
-        else:
-            raise NotImplementedError(f"Package manager {env.package_manager} is not supported for installation")
+        envs_to_setup.append(env)
+
+    runner = EnvRunner(args)
+    if args.command == "cache":
+        failures = run_cache_command(runner, envs_to_setup)
+    else:
+        failures = run_envs(runner, envs_to_setup)
+        runner.state.save()
+    for name, error in failures.items():
+        print(f"Environment {name} failed: {error}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+"""Per-phase timing instrumentation shared by the repo tooling scripts.
+
+The scripts import this from .devcontainer (they live outside of any package, and run before any dependencies are installed), and only
+record anything when the environment variable named by METRICS_FILE_ENV_VAR is set.
+"""
+
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Generator
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+if sys.platform != "win32":
+    import resource
+
+# When set, every phase of the repo tooling scripts appends a JSON line with its timings to the file at this path
+METRICS_FILE_ENV_VAR = "REPO_TOOLING_METRICS_FILE"
+
+
+class PhaseMetrics:
+    """Record the wall time, CPU time, peak RSS, bytes read and subprocess durations of each phase of a script as JSON lines."""
+
+    def __init__(self, script: str):
+        super().__init__()
+        self.script = script
+        self.metrics_file = os.environ.get(METRICS_FILE_ENV_VAR)
+        self.run_id = f"{os.getpid()}-{time.time_ns()}"  # groups the phases of one invocation
+        self._local = threading.local()  # the phase currently running in each thread
+
+    @staticmethod
+    def _snapshot() -> dict[str, float]:
+        snapshot = {"wall": time.perf_counter()}
+        if sys.platform != "win32":
+            # ru_maxrss is in bytes on macOS, but in kilobytes on Linux
+            rss_unit = 1 if sys.platform == "darwin" else 1024
+            own_usage = resource.getrusage(resource.RUSAGE_SELF)
+            children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            snapshot.update(
+                user_cpu=own_usage.ru_utime,
+                system_cpu=own_usage.ru_stime,
+                child_user_cpu=children_usage.ru_utime,
+                child_system_cpu=children_usage.ru_stime,
+                peak_rss_bytes=own_usage.ru_maxrss * rss_unit,
+                child_peak_rss_bytes=children_usage.ru_maxrss * rss_unit,
+            )
+        # rchar counts every byte read through a syscall, including from pipes and the page cache
+        with (
+            contextlib.suppress(OSError, ValueError, StopIteration),
+            Path("/proc/self/io").open("r", encoding="utf-8") as io_file,
+        ):
+            snapshot["bytes_read"] = int(next(line for line in io_file if line.startswith("rchar:")).split()[1])
+        return snapshot
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Generator[None]:
+        """Record the resources used by the code run inside this context as one phase."""
+        if not self.metrics_file:
+            yield
+            return
+        outer_subprocesses: list[dict[str, Any]] | None = getattr(self._local, "subprocesses", None)
+        subprocesses: list[dict[str, Any]] = []
+        self._local.subprocesses = subprocesses
+        started_at = time.time()
+        start = self._snapshot()
+        error: str | None = None
+        try:
+            yield
+        except BaseException as e:
+            if not (isinstance(e, SystemExit) and not e.code):  # exiting successfully is not an error
+                error = type(e).__name__
+            raise
+        finally:
+            end = self._snapshot()
+            record: dict[str, Any] = {
+                "script": self.script,
+                "run_id": self.run_id,
+                "phase": name,
+                "host": platform.node(),
+                "platform": sys.platform,
+                "started_at": started_at,
+                "error": error,
+                "subprocesses": subprocesses,
+            }
+            for key in ("wall", "user_cpu", "system_cpu", "child_user_cpu", "child_system_cpu", "bytes_read"):
+                if key in start and key in end:
+                    record[key if key == "bytes_read" else f"{key}_seconds"] = end[key] - start[key]
+            for key in ("peak_rss_bytes", "child_peak_rss_bytes"):
+                if key in end:
+                    record[key] = end[key]  # a high-water mark for the whole process so far, not just this phase
+            self._local.subprocesses = outer_subprocesses
+            # metrics should never break the tooling itself
+            with contextlib.suppress(OSError), Path(self.metrics_file).open("a", encoding="utf-8") as f:
+                _ = f.write(json.dumps(record) + "\n")
+
+    def record_subprocess(self, command: str | Sequence[str], seconds: float) -> None:
+        subprocesses: list[dict[str, Any]] | None = getattr(self._local, "subprocesses", None)
+        if subprocesses is not None:
+            subprocesses.append(
+                {"command": command if isinstance(command, str) else " ".join(command), "seconds": seconds}
+            )
+
+    def run(self, command: str | Sequence[str], **kwargs: Any) -> subprocess.CompletedProcess[Any]:  # noqa: ANN401 # passed straight through to subprocess.run
+        """Like `subprocess.run`, but records how long the command took in the current phase."""
+        start = time.perf_counter()
+        try:
+            return subprocess.run(command, **kwargs)  # noqa: PLW1510,S603 # pyright: ignore[reportUnknownVariableType] # the callers pass check= and only trusted commands, and the return type depends on them
+        finally:
+            self.record_subprocess(command, time.perf_counter() - start)
@@ -0,0 +1,253 @@
+"""Benchmark each phase of hash_git_files against synthetic Git repositories, optionally failing on a regression from a stored baseline.
+
+Everything runs offline against repositories generated in a temporary directory, e.g.:
+    python tests/benchmark_hash_git_files.py --file-count 20000 --depth 6 --save-baseline
+    python tests/benchmark_hash_git_files.py --file-count 20000 --depth 6 --max-regression 0.25
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+HASH_GIT_FILES_PATH = REPO_ROOT / ".github" / "workflows" / "hash_git_files.py"
+DEFAULT_BASELINE_PATH = Path(__file__).resolve().parent / "benchmark_hash_git_files_baseline.json"
+SIZE_DISTRIBUTION_UNIFORM = "uniform"
+# mostly small files with a long tail of large ones, like a typical source tree
+SIZE_DISTRIBUTION_LOGNORMAL = "lognormal"
+LOCK_FILE_EVERY = 10  # every Nth generated file is a lock file, so that the devcontainer context is not trivially empty
+BASELINE_VERSION = 1
+# well outside of the racy window of the digest cache, which does not store the digests of files modified just before hashing them
+GENERATED_FILE_AGE_NS = 60_000_000_000
+
+
+def load_hash_git_files() -> ModuleType:
+    # the script lives outside of any package, so it has to be loaded from its path
+    spec = importlib.util.spec_from_file_location("hash_git_files", HASH_GIT_FILES_PATH)
+    assert spec is not None
+    assert spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _draw_size(rng: random.Random, args: argparse.Namespace) -> int:
+    if args.size_distribution == SIZE_DISTRIBUTION_UNIFORM:
+        return rng.randint(args.min_size, args.max_size)
+    return max(args.min_size, min(args.max_size, int(rng.lognormvariate(args.median_size_log, 1.5))))
+
+
+def generate_repo(repo_path: Path, args: argparse.Namespace) -> int:
+    """Generate a Git repository of random files (deterministic for a given seed), returning the total number of bytes written."""
+    rng = random.Random(args.seed)  # noqa: S311 # this is test data, not cryptography
+    directories = [Path()]
+    for _ in range(args.directory_count):
+        parent = rng.choice(directories)
+        if len(parent.parts) < args.depth:
+            directories.append(parent / f"dir{len(directories)}")
+    total_bytes = 0
+    mtime_ns = time.time_ns() - GENERATED_FILE_AGE_NS
+    for index in range(args.file_count):
+        directory = repo_path / rng.choice(directories)
+        directory.mkdir(parents=True, exist_ok=True)
+        extension = "lock" if index % LOCK_FILE_EVERY == 0 else "txt"
+        contents = rng.randbytes(_draw_size(rng, args))
+        file_path = directory / f"file{index}.{extension}"
+        _ = file_path.write_bytes(contents)
+        os.utime(file_path, ns=(mtime_ns, mtime_ns))
+        total_bytes += len(contents)
+    devcontainer_folder = repo_path / ".devcontainer"
+    devcontainer_folder.mkdir()
+    _ = (devcontainer_folder / "devcontainer.json").write_text("{\n}\n", encoding="utf-8")
+    _ = subprocess.run(["git", "init", "--quiet"], cwd=repo_path, check=True)  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+    _ = subprocess.run(["git", "add", "--all"], cwd=repo_path, check=True)  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+    return total_bytes
+
+
+def _time_best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _ = fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmarks(repo_path: Path, total_bytes: int, args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    """Time each phase separately (best of the repeats), returning the seconds, files/s and MB/s of each."""
+    hash_git_files = load_hash_git_files()
+    files: list[str] = list(hash_git_files.get_tracked_files(repo_path))
+    context_files, devcontainer_json_file = hash_git_files.filter_files_for_devcontainer_context(files)
+    context_bytes = sum((repo_path / file).stat().st_size for file in context_files)
+    cache_file = repo_path / ".git" / "benchmark-digest-cache.json"
+
+    # populate the cache, so that the timed runs only measure the hits
+    warm_cache = hash_git_files.DigestCache.load(cache_file, digest_width=2)
+    _ = hash_git_files.compute_adler32(repo_path, files, warm_cache)
+    warm_cache.save()
+    loaded_cache = hash_git_files.DigestCache.load(cache_file, digest_width=2)
+    # a cache with every entry changed, so that each of the timed saves writes all of them
+    changed_cache = hash_git_files.DigestCache(repo_path / ".git" / "benchmark-digest-cache-save.json", digest_width=2)
+    cached_bytes = 0  # what the cached runs avoid reading
+    for file in files:
+        stat_result = (repo_path / file).stat()
+        digest = loaded_cache.get(file, stat_result)
+        if digest is not None:
+            cached_bytes += stat_result.st_size
+            changed_cache.put(file, stat_result, digest)
+
+    phases: dict[str, tuple[int, int, Callable[[], Any]]] = {  # name -> (files, bytes, benchmark)
+        "get_tracked_files": (len(files), 0, lambda: list(hash_git_files.get_tracked_files(repo_path))),
+        "filter_files_for_devcontainer_context": (
+            len(files),
+            0,
+            lambda: hash_git_files.filter_files_for_devcontainer_context(files),
+        ),
+        "compute_adler32": (len(files), total_bytes, lambda: hash_git_files.compute_adler32(repo_path, files)),
+        "load_digest_cache": (
+            len(files),
+            0,
+            lambda: hash_git_files.DigestCache.load(cache_file, digest_width=2),
+        ),
+        "compute_adler32_cached": (
+            len(files),
+            cached_bytes,
+            lambda: hash_git_files.compute_adler32(repo_path, files, loaded_cache),
+        ),
+        "save_digest_cache": (len(files), 0, changed_cache.save),
+        "compute_merkle_sha256": (
+            len(files),
+            total_bytes,
+            lambda: hash_git_files.compute_merkle_sha256(repo_path, files),
+        ),
+        "compute_devcontainer_context_adler32": (
+            len(context_files),
+            context_bytes,
+            lambda: hash_git_files.compute_adler32(repo_path, context_files),
+        ),
+        "update_devcontainer_context_hash": (
+            1,
+            0,
+            lambda: hash_git_files.update_devcontainer_context_hash(
+                repo_path / devcontainer_json_file, f"{random.getrandbits(32):08x}"
+            ),
+        ),
+    }
+    results: dict[str, dict[str, float]] = {}
+    for name, (file_count, byte_count, benchmark) in phases.items():
+        seconds = _time_best_of(args.repeat, benchmark)
+        results[name] = {
+            "seconds": seconds,
+            "files_per_second": file_count / seconds,
+            "mb_per_second": byte_count / 1_000_000 / seconds,
+        }
+    return results
+
+
+def scenario_key(args: argparse.Namespace) -> str:
+    return (
+        f"files={args.file_count},directories={args.directory_count},depth={args.depth},sizes={args.size_distribution}:"
+        f"{args.min_size}-{args.max_size},seed={args.seed}"
+    )
+
+
+def find_regressions(
+    results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], max_regression: float
+) -> list[str]:
+    regressions: list[str] = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        slowdown = result["seconds"] / baseline[name]["seconds"] - 1
+        if slowdown > max_regression:
+            regressions.append(
+                f"{name}: {result['seconds']:.4f}s is {slowdown:.0%} slower than the baseline of {baseline[name]['seconds']:.4f}s"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark hash_git_files against a synthetic Git repository.")
+    _ = parser.add_argument("--file-count", type=int, default=5000, help="Number of files to generate")
+    _ = parser.add_argument(
+        "--directory-count", type=int, default=200, help="Number of directories to spread the files across"
+    )
+    _ = parser.add_argument("--depth", type=int, default=5, help="Maximum depth of the generated directories")
+    _ = parser.add_argument(
+        "--size-distribution",
+        choices=[SIZE_DISTRIBUTION_UNIFORM, SIZE_DISTRIBUTION_LOGNORMAL],
+        default=SIZE_DISTRIBUTION_LOGNORMAL,
+        help="How the sizes of the generated files are distributed between --min-size and --max-size",
+    )
+    _ = parser.add_argument("--min-size", type=int, default=0, help="Smallest file size in bytes")
+    _ = parser.add_argument("--max-size", type=int, default=4 * 1024 * 1024, help="Largest file size in bytes")
+    _ = parser.add_argument(
+        "--median-size-log",
+        type=float,
+        default=8.0,
+        help=f"Natural log of the median file size with the '{SIZE_DISTRIBUTION_LOGNORMAL}' distribution (default: about 3KB)",
+    )
+    _ = parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the random generator, for repeatable repositories"
+    )
+    _ = parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of times each phase is run, keeping the fastest"
+    )
+    _ = parser.add_argument(
+        "--baseline", type=Path, default=DEFAULT_BASELINE_PATH, help="JSON file storing the baseline timings"
+    )
+    _ = parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as the baseline of this scenario"
+    )
+    _ = parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.25,
+        help="Fail if a phase is slower than its baseline by more than this fraction (default: 0.25)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_path = Path(temp_dir)
+        total_bytes = generate_repo(repo_path, args)
+        print(f"Generated {args.file_count} files ({total_bytes / 1_000_000:.1f} MB) in {repo_path}")  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        results = run_benchmarks(repo_path, total_bytes, args)
+
+    for name, result in results.items():
+        print(  # noqa: T201 # this just runs as a simple script, so using print instead of log
+            f"{name:<40} {result['seconds']:>9.4f}s {result['files_per_second']:>12.0f} files/s {result['mb_per_second']:>9.1f} MB/s"
+        )
+
+    baselines: dict[str, Any] = {"version": BASELINE_VERSION, "scenarios": {}}
+    if args.baseline.exists():
+        with args.baseline.open("r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    key = scenario_key(args)
+    if args.save_baseline:
+        baselines["scenarios"][key] = results
+        with args.baseline.open("w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+            _ = f.write("\n")
+        print(f"Saved the baseline of {key} to {args.baseline}")  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        return 0
+    if key not in baselines["scenarios"]:
+        print(f"No baseline stored for {key} in {args.baseline}, run with --save-baseline to create one")  # noqa: T201 # this just runs as a simple script, so using print instead of log
+        return 0
+    regressions = find_regressions(results, baselines["scenarios"][key], args.max_regression)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,349 @@
+"""Instantiate the template for every copier data file x Python version concurrently, like the CI lint-matrix does one at a time.
+
+Each combination runs in its own temporary directory: `copier copy`, the private registry replacement, `manual-setup-deps.py` and
+`pre-commit run -a`. All of them share one package cache and one PRE_COMMIT_HOME, so once those are warm the whole matrix can run
+offline in about the time of its slowest combination.
+
+The result of each combination is recorded in a local result cache, keyed on the hash of the template's files (from hash_git_files), the
+contents of the data file and the Python version, so that the combinations that already passed with the same key are skipped, e.g.:
+    python tests/run_copier_matrix.py
+    python tests/run_copier_matrix.py --python-version 3.13.2 --data-file tests/copier_data/data1.yaml --keep
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_DATA_FILES = sorted((REPO_ROOT / "tests" / "copier_data").glob("*.yaml"))
+# matching the lint-matrix in .github/workflows/ci.yaml
+DEFAULT_PYTHON_VERSIONS = ["3.12.7", "3.13.2"]
+DEFAULT_SHARED_CACHE_DIR = REPO_ROOT / ".cache" / "copier-matrix"
+REPLACE_PRIVATE_PACKAGE_REGISTRIES_PATH = REPO_ROOT / ".github" / "workflows" / "replace_private_package_registries.py"
+# the same hooks the lint-matrix skips, since the instantiated template changes the devcontainer context hash every time
+SKIPPED_HOOKS = "git-dirty,compute-devcontainer-context-hash"
+HASH_GIT_FILES_PATH = REPO_ROOT / ".github" / "workflows" / "hash_git_files.py"
+# everything a combination's result depends on besides its data file and Python version
+TEMPLATE_INPUT_PATHSPECS = [
+    "template",
+    "copier.yml",
+    "extensions/context.py",
+    ".github/workflows/replace_private_package_registries.py",
+]
+DEFAULT_RESULT_CACHE_DIR = DEFAULT_SHARED_CACHE_DIR / "results"
+RESULT_CACHE_VERSION = 1
+_print_lock = threading.Lock()
+
+
+def _print(message: str) -> None:
+    with _print_lock:
+        print(message, flush=True)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+
+
+def load_hash_git_files() -> ModuleType:
+    # the script lives outside of any package, so it has to be loaded from its path
+    spec = importlib.util.spec_from_file_location("hash_git_files", HASH_GIT_FILES_PATH)
+    assert spec is not None
+    assert spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _git(*args: str) -> str:
+    return subprocess.run(  # noqa: S603 # these are our own fixed git commands
+        ["git", *args],  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+        cwd=REPO_ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def template_matches_vcs_ref(vcs_ref: str) -> bool:
+    """Check that the template files in the working tree are exactly the ones copier instantiates from the ref."""
+    is_head = _git("rev-parse", "--verify", f"{vcs_ref}^{{commit}}") == _git("rev-parse", "--verify", "HEAD^{commit}")
+    return is_head and not _git("status", "--porcelain", "--", *TEMPLATE_INPUT_PATHSPECS)
+
+
+def compute_template_hash() -> str:
+    hash_git_files = load_hash_git_files()
+    files = hash_git_files.get_tracked_files(REPO_ROOT, TEMPLATE_INPUT_PATHSPECS)
+    return hash_git_files.compute_merkle_sha256(REPO_ROOT, files)
+
+
+class ResultCache:
+    """The pass/fail and step timings of each combination, stored as one JSON file per key in a local directory."""
+
+    def __init__(self, directory: Path):
+        super().__init__()
+        self.directory = directory
+
+    @staticmethod
+    def key_for(key_inputs: dict[str, str]) -> str:
+        return hashlib.sha256(json.dumps(key_inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        try:
+            with (self.directory / f"{key}.json").open("r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return record if record.get("version") == RESULT_CACHE_VERSION else None
+
+    def store(self, key: str, record: dict[str, Any]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.directory, delete=False) as f:
+            json.dump({"version": RESULT_CACHE_VERSION, **record}, f, indent=2)
+        _ = Path(f.name).replace(self.directory / f"{key}.json")
+
+
+class Combination:
+    """One data file x Python version of the matrix, with the duration of each of its steps."""
+
+    def __init__(self, data_file: Path, python_version: str):
+        super().__init__()
+        self.data_file = data_file
+        self.python_version = python_version
+        self.name = f"{data_file.stem}-py{python_version}"
+        self.step_seconds: dict[str, float] = {}
+        self.failed_step: str | None = None
+        self.log_file: Path | None = None
+        # what the result cache is keyed on, and the passing result recorded for that key if there is one
+        self.key_inputs: dict[str, str] = {}
+        self.cached_record: dict[str, Any] | None = None
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.step_seconds.values())
+
+
+def run_combination(combination: Combination, args: argparse.Namespace, work_dir: Path) -> None:
+    """Run every step of the combination in turn, logging their output to a file and stopping at the first failing step."""
+    instance_dir = work_dir / combination.name
+    combination.log_file = work_dir / f"{combination.name}.log"
+    env = dict(os.environ)
+    env.update(
+        {
+            "UV_PYTHON": combination.python_version,
+            "PRE_COMMIT_HOME": str(args.shared_cache_dir / "pre-commit"),
+            "SKIP": SKIPPED_HOOKS,
+            # so that the setup doesn't attempt to access AWS if CodeArtifact is set as the registry
+            "CODEARTIFACT_AUTH_TOKEN": "faketoken",
+        }
+    )
+    if args.offline:
+        env.update({"UV_OFFLINE": "1", "npm_config_offline": "true"})
+    steps: list[tuple[str, list[str], Path]] = [
+        (
+            "copier_copy",
+            [
+                "copier",
+                "copy",
+                "--trust",
+                "--defaults",
+                "--vcs-ref",
+                args.vcs_ref,
+                "--data-file",
+                str(combination.data_file),
+                "--data",
+                f"python_version={combination.python_version}",
+                str(REPO_ROOT),
+                str(instance_dir),
+            ],
+            work_dir,
+        ),
+        ("git_init", ["git", "init", "--quiet"], instance_dir),
+        ("replace_registries", [sys.executable, str(REPLACE_PRIVATE_PACKAGE_REGISTRIES_PATH)], instance_dir),
+        (
+            "setup_deps",
+            [
+                sys.executable,
+                ".devcontainer/manual-setup-deps.py",
+                "--skip-check-lock",
+                # it otherwise sets UV_PYTHON to the version of the interpreter running it, which is the one running this script
+                "--python-version",
+                combination.python_version,
+                "--package-cache-dir",
+                str(args.shared_cache_dir / "packages"),
+            ],
+            instance_dir,
+        ),
+        # add everything to git so that pre-commit recognizes the files and runs on them
+        ("git_add", ["git", "add", "--all"], instance_dir),
+        ("pre_commit", ["pre-commit", "run", "--all-files"], instance_dir),
+    ]
+    with combination.log_file.open("w", encoding="utf-8") as log:
+        for step_name, command, cwd in steps:
+            _ = log.write(f"$ {' '.join(command)}\n")
+            _ = log.flush()
+            start = time.perf_counter()
+            returncode = subprocess.run(  # noqa: S603 # these are our own fixed commands
+                command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT, check=False
+            ).returncode
+            combination.step_seconds[step_name] = time.perf_counter() - start
+            if returncode != 0:
+                combination.failed_step = step_name
+                _print(f"[{combination.name}] {step_name} failed after {combination.step_seconds[step_name]:.1f}s")
+                return
+            _print(f"[{combination.name}] {step_name} finished in {combination.step_seconds[step_name]:.1f}s")
+
+
+def print_summary(combinations: list[Combination], wall_seconds: float) -> None:
+    step_names = list(dict.fromkeys(step for combination in combinations for step in combination.step_seconds))
+    width = max(len(step) for step in [*step_names, "total"]) + 2
+    _print("")
+    _print(f"{'combination':<24}" + "".join(f"{step:>{width}}" for step in [*step_names, "total"]) + "  result")
+    for combination in sorted(combinations, key=lambda combination: combination.total_seconds, reverse=True):
+        timings = "".join(
+            f"{combination.step_seconds[step]:>{width - 1}.1f}s"
+            if step in combination.step_seconds
+            else f"{'-':>{width}}"
+            for step in step_names
+        )
+        if combination.cached_record is not None:
+            result = "ok (cached)"
+        elif combination.failed_step is None:
+            result = "ok"
+        else:
+            result = f"FAILED at {combination.failed_step} (see {combination.log_file})"
+        _print(f"{combination.name:<24}{timings}{combination.total_seconds:>{width - 1}.1f}s  {result}")
+    slowest = max((combination.total_seconds for combination in combinations), default=0)
+    _print(f"\nMatrix took {wall_seconds:.1f}s of wall time, and its slowest combination {slowest:.1f}s")
+
+
+def load_cached_results(combinations: list[Combination], args: argparse.Namespace) -> ResultCache | None:
+    """Key each combination, and mark the ones that already passed with the same key as cached, explaining why they are skipped."""
+    if not template_matches_vcs_ref(args.vcs_ref):
+        _print(
+            f"Not using the result cache, since the template files have uncommitted changes or --vcs-ref {args.vcs_ref} is not HEAD"
+        )
+        return None
+    result_cache = ResultCache(args.result_cache_dir)
+    template_hash = compute_template_hash()
+    for combination in combinations:
+        combination.key_inputs = {
+            "template_hash": template_hash,
+            "data_file": combination.data_file.name,
+            "data_file_sha256": hashlib.sha256(combination.data_file.read_bytes()).hexdigest(),
+            "python_version": combination.python_version,
+        }
+        record = result_cache.load(ResultCache.key_for(combination.key_inputs))
+        if record is None or not record["passed"]:
+            continue
+        combination.cached_record = record
+        combination.step_seconds = record["step_seconds"]
+        data_file_sha256 = combination.key_inputs["data_file_sha256"]
+        _print(
+            f"Skipping {combination.name}, which already passed with the same template hash ({template_hash[:12]}), {combination.data_file.name} ({data_file_sha256[:12]}) and Python version"
+        )
+    return result_cache
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Instantiate the template for the whole copier data x Python matrix concurrently."
+    )
+    _ = parser.add_argument(
+        "--data-file",
+        dest="data_files",
+        action="append",
+        type=Path,
+        help="Copier data file to instantiate the template with (repeatable, default: every file in tests/copier_data)",
+    )
+    _ = parser.add_argument(
+        "--python-version",
+        dest="python_versions",
+        action="append",
+        help=f"Python version to instantiate the template with (repeatable, default: {', '.join(DEFAULT_PYTHON_VERSIONS)})",
+    )
+    _ = parser.add_argument(
+        "--jobs", type=int, default=None, help="How many combinations to run concurrently (default: all of them)"
+    )
+    _ = parser.add_argument(
+        "--vcs-ref",
+        default="HEAD",
+        help="Git ref of this repository to instantiate the template from (default: HEAD, so commit the changes to test)",
+    )
+    _ = parser.add_argument(
+        "--shared-cache-dir",
+        type=Path,
+        default=DEFAULT_SHARED_CACHE_DIR,
+        help="Directory of the package cache and PRE_COMMIT_HOME shared by all the combinations (default: .cache/copier-matrix)",
+    )
+    _ = parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Install packages only from the shared cache, which has to be warm already",
+    )
+    _ = parser.add_argument(
+        "--result-cache-dir",
+        type=Path,
+        default=DEFAULT_RESULT_CACHE_DIR,
+        help="Directory of the results of previous runs (default: .cache/copier-matrix/results)",
+    )
+    _ = parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        help="Run every combination, even the ones that already passed with the same template, data file and Python version",
+    )
+    _ = parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="Keep the instantiated templates and logs instead of deleting them on success",
+    )
+    args = parser.parse_args()
+
+    combinations = [
+        Combination(data_file.resolve(), python_version)
+        for data_file in (args.data_files or DEFAULT_DATA_FILES)
+        for python_version in (args.python_versions or DEFAULT_PYTHON_VERSIONS)
+    ]
+    args.shared_cache_dir = args.shared_cache_dir.resolve()
+    args.shared_cache_dir.mkdir(parents=True, exist_ok=True)
+    result_cache = None if args.no_result_cache else load_cached_results(combinations, args)
+    combinations_to_run = [combination for combination in combinations if combination.cached_record is None]
+
+    work_dir = Path(tempfile.mkdtemp(prefix="copier-matrix-"))
+    _print(f"Running {len(combinations_to_run)} combinations in {work_dir}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.jobs or max(1, len(combinations_to_run))) as executor:
+        futures = [executor.submit(run_combination, combination, args, work_dir) for combination in combinations_to_run]
+    for future in futures:
+        future.result()
+    if result_cache is not None:
+        for combination in combinations_to_run:
+            result_cache.store(
+                ResultCache.key_for(combination.key_inputs),
+                {
+                    "key_inputs": combination.key_inputs,
+                    "passed": combination.failed_step is None,
+                    "failed_step": combination.failed_step,
+                    "step_seconds": combination.step_seconds,
+                    "finished_at": time.time(),
+                },
+            )
+    print_summary(combinations, time.perf_counter() - start)
+
+    is_failed = any(combination.failed_step is not None for combination in combinations)
+    if args.keep or is_failed:
+        _print(f"The instantiated templates and logs are kept in {work_dir}")
+    else:
+        shutil.rmtree(work_dir)
+    return 1 if is_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import importlib.util
+import sys
+from pathlib import Path
+from types import ModuleType
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def load_script(relative_path: str, module_name: str) -> ModuleType:
+    # the tooling scripts live outside of any package (and some have dashes in their names), so they have to be loaded from their paths
+    script_path = REPO_ROOT / relative_path
+    # as when running the script, its own directory is importable, which is how the ones in .devcontainer import each other
+    if str(script_path.parent) not in sys.path:
+        sys.path.append(str(script_path.parent))
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    assert spec is not None
+    assert spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
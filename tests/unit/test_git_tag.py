@@ -0,0 +1,168 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from .scripts import load_script
+
+git_tag = load_script("src/git_tag.py", "git_tag")
+ARGPARSE_ERROR_EXIT_CODE = 2
+
+
+def _git(repo_path: Path, *args: str) -> str:
+    return subprocess.run(  # noqa: S603 # these are our own fixed git commands
+        ["git", *args],  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+        cwd=repo_path,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def _write_pyproject(path: Path, version: str | None) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    version_line = f'version = "{version}"\n' if version is not None else ""
+    _ = path.write_text(f'[project]\nname = "{path.parent.name}"\n{version_line}', encoding="utf-8")
+
+
+def _remote_tags(origin: Path) -> dict[str, str]:
+    return {
+        ref.removeprefix("refs/tags/"): sha
+        for sha, _, ref in (
+            line.partition("\t") for line in _git(origin, "ls-remote", "--tags", "--refs", ".").splitlines()
+        )
+    }
+
+
+@pytest.fixture
+def origin(tmp_path: Path) -> Path:
+    origin_path = tmp_path / "origin.git"
+    _ = _git(tmp_path, "init", "--quiet", "--bare", str(origin_path))
+    return origin_path
+
+
+@pytest.fixture
+def clone(tmp_path: Path, origin: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Create a repository with a root package, a nested package and a workspace root without a version, pushed to the bare origin."""
+    for name, value in (("NAME", "Test"), ("EMAIL", "test@example.com")):
+        monkeypatch.setenv(f"GIT_AUTHOR_{name}", value)
+        monkeypatch.setenv(f"GIT_COMMITTER_{name}", value)
+    clone_path = tmp_path / "clone"
+    _ = _git(tmp_path, "init", "--quiet", str(clone_path))
+    _write_pyproject(clone_path / "pyproject.toml", "1.0.0")
+    _write_pyproject(clone_path / "packages" / "lib" / "pyproject.toml", "2.0.0")
+    _write_pyproject(clone_path / "packages" / "workspace" / "pyproject.toml", None)
+    _ = _git(clone_path, "add", "--all")
+    _ = _git(clone_path, "commit", "--quiet", "--message", "initial")
+    _ = _git(clone_path, "remote", "add", "origin", str(origin))
+    _ = _git(clone_path, "push", "--quiet", "origin", "HEAD")
+    monkeypatch.chdir(clone_path)
+    return clone_path
+
+
+def _run_main(monkeypatch: pytest.MonkeyPatch, *args: str) -> None:
+    monkeypatch.setattr(sys, "argv", ["git_tag.py", *args])
+    git_tag.main()
+
+
+class TestBatch:
+    @pytest.mark.usefixtures("clone")
+    def test_When_neither_confirming_nor_pushing__Then_the_tag_of_every_versioned_package_is_printed(
+        self, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+    ):
+        _run_main(monkeypatch, "--batch")
+
+        assert capsys.readouterr().out.splitlines() == [
+            "packages/lib/pyproject.toml\tpackages/lib/v2.0.0",
+            "pyproject.toml\tv1.0.0",
+        ]
+
+    def test_When_pushing__Then_every_new_tag_is_pushed_on_head(
+        self, clone: Path, origin: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        _run_main(monkeypatch, "--batch", "--push-tag-to-remote")
+
+        head = _git(clone, "rev-parse", "HEAD").strip()
+        assert _remote_tags(origin) == {"v1.0.0": head, "packages/lib/v2.0.0": head}
+
+    def test_When_pushing_and_a_tag_is_on_the_remote__Then_it_fails_without_pushing_any_tag(
+        self, clone: Path, origin: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        first_commit = _git(clone, "rev-parse", "HEAD").strip()
+        _ = _git(clone, "push", "--quiet", "origin", f"{first_commit}:refs/tags/v1.0.0")
+        _ = _git(clone, "commit", "--quiet", "--allow-empty", "--message", "second")
+
+        with pytest.raises(Exception, match=r"tags v1\.0\.0 exist on remote 'origin'"):
+            _run_main(monkeypatch, "--batch", "--push-tag-to-remote")
+
+        assert _remote_tags(origin) == {"v1.0.0": first_commit}
+
+    def test_When_confirming_and_pushing__Then_the_tags_are_pushed(
+        self, clone: Path, origin: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        _run_main(monkeypatch, "--batch", "--confirm-tag-not-present", "--push-tag-to-remote")
+
+        head = _git(clone, "rev-parse", "HEAD").strip()
+        assert _remote_tags(origin) == {"v1.0.0": head, "packages/lib/v2.0.0": head}
+
+    @pytest.mark.usefixtures("clone")
+    def test_When_no_tag_is_on_the_remote__Then_confirming_succeeds(self, monkeypatch: pytest.MonkeyPatch):
+        _run_main(monkeypatch, "--batch", "--confirm-tag-not-present")
+
+    def test_When_a_tag_is_on_the_remote__Then_confirming_fails_naming_it(
+        self, clone: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        _ = _git(clone, "push", "--quiet", "origin", "HEAD:refs/tags/packages/lib/v2.0.0")
+
+        with pytest.raises(Exception, match=r"tags packages/lib/v2\.0\.0 exist on remote 'origin'"):
+            _run_main(monkeypatch, "--batch", "--confirm-tag-not-present")
+
+    def test_When_a_tag_only_exists_locally__Then_confirming_fails(self, clone: Path, monkeypatch: pytest.MonkeyPatch):
+        _ = _git(clone, "tag", "v1.0.0")
+
+        with pytest.raises(Exception, match=r"tags v1\.0\.0 exist"):
+            _run_main(monkeypatch, "--batch", "--confirm-tag-not-present")
+
+    @pytest.mark.usefixtures("clone")
+    def test_When_a_file_is_given__Then_it_is_rejected(
+        self, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+    ):
+        with pytest.raises(SystemExit) as exc_info:  # noqa: PT011 # argparse exits with just the code
+            _run_main(monkeypatch, "pyproject.toml", "--batch")
+
+        assert exc_info.value.code == ARGPARSE_ERROR_EXIT_CODE
+        assert "a file cannot be given with --batch" in capsys.readouterr().err
+
+
+class TestTagIndex:
+    def test_When_tags_were_pushed__Then_the_snapshot_reports_them_without_asking_the_remote(
+        self, clone: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        _run_main(monkeypatch, "--batch", "--push-tag-to-remote")
+        _ = _git(clone, "tag", "--delete", "v1.0.0", "packages/lib/v2.0.0")
+
+        def fail_fetch(remote: str) -> set[str]:
+            raise AssertionError(f"{remote} was asked while the snapshot was fresh")
+
+        monkeypatch.setattr(git_tag, "fetch_remote_tags", fail_fetch)
+
+        assert git_tag.TagIndex("origin", ttl_seconds=300).existing(["v1.0.0", "packages/lib/v2.0.0"]) == [
+            "packages/lib/v2.0.0",
+            "v1.0.0",
+        ]
+
+    def test_When_there_is_no_snapshot__Then_pushed_tags_are_not_recorded(self, clone: Path):
+        tag_index = git_tag.TagIndex("origin", ttl_seconds=300)
+
+        tag_index.add_pushed(["v1.0.0"])
+
+        assert not (clone / ".git" / "git-tag-index" / "origin.json").exists()
+
+    @pytest.mark.usefixtures("clone")
+    def test_When_snapshot_expired__Then_the_remote_is_asked_again(self, origin: Path):
+        tag_index = git_tag.TagIndex("origin", ttl_seconds=0)
+        assert tag_index.remote_tags() == set()
+        _ = _git(origin, "tag", "v9.9.9", "HEAD")
+
+        assert tag_index.remote_tags() == {"v9.9.9"}
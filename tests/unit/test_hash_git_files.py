@@ -0,0 +1,584 @@
+import argparse
+import errno
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from .scripts import load_script
+
+hash_git_files = load_script(".github/workflows/hash_git_files.py", "hash_git_files")
+
+# comfortably outside of the racy window, so that the digests of these files are cached
+OLD_MTIME_NS = time.time_ns() - 10 * hash_git_files.DIGEST_CACHE_RACY_WINDOW_NS
+
+
+# the root of "a.txt" containing "a" and "pkg/b.py" containing "b", pinned so that any change to the leaf or node encoding is caught
+MERKLE_SHA256_OF_DAEMON_REPO = "38fcf1d56225bb321ab7582f3c1fac5a724161c523a559a34858b6ee65620030"
+
+
+def _write_old_file(path: Path, contents: bytes) -> os.stat_result:
+    _ = path.write_bytes(contents)
+    os.utime(path, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+    return path.stat()
+
+
+def _saved_cache(tmp_path: Path, file: str, stat_result: os.stat_result, digest: list[str]) -> Any:  # noqa: ANN401 # the script is loaded from its path, so its classes are not known statically
+    """Return a cache freshly loaded from a file holding just the digest of the one file, since lookups only see the loaded entries."""
+    cache = hash_git_files.DigestCache.load(tmp_path / "cache.json", digest_width=len(digest))
+    cache.put(file, stat_result, digest)
+    cache.save()
+    return hash_git_files.DigestCache.load(tmp_path / "cache.json", digest_width=len(digest))
+
+
+class TestDigestCache:
+    def test_When_saved_and_loaded__Then_digest_is_returned_for_the_unchanged_file(self, tmp_path: Path):
+        cache_file = tmp_path / "cache.json"
+        stat_result = _write_old_file(tmp_path / "a.txt", b"a")
+        cache = hash_git_files.DigestCache.load(cache_file, digest_width=1)
+        cache.put("a.txt", stat_result, ["digest-a"])
+        cache.save()
+
+        assert hash_git_files.DigestCache.load(cache_file, digest_width=1).get("a.txt", stat_result) == ["digest-a"]
+
+    def test_When_size_changes__Then_entry_is_invalidated(self, tmp_path: Path):
+        file_path = tmp_path / "a.txt"
+        cache = _saved_cache(tmp_path, "a.txt", _write_old_file(file_path, b"a"), ["digest-a"])
+
+        assert cache.get("a.txt", _write_old_file(file_path, b"ab")) is None
+
+    def test_When_only_mtime_changes__Then_entry_is_invalidated(self, tmp_path: Path):
+        file_path = tmp_path / "a.txt"
+        cache = _saved_cache(tmp_path, "a.txt", _write_old_file(file_path, b"a"), ["digest-a"])
+        os.utime(file_path, ns=(OLD_MTIME_NS + 1, OLD_MTIME_NS + 1))
+
+        assert cache.get("a.txt", file_path.stat()) is None
+
+    def test_When_file_was_modified_within_the_racy_window__Then_it_is_not_cached(self, tmp_path: Path):
+        file_path = tmp_path / "a.txt"
+        _ = file_path.write_bytes(b"a")
+        cache = _saved_cache(tmp_path, "a.txt", file_path.stat(), ["digest-a"])
+
+        assert cache.get("a.txt", file_path.stat()) is None
+
+    def test_When_entry_has_a_different_digest_width__Then_it_is_ignored(self, tmp_path: Path):
+        stat_result = _write_old_file(tmp_path / "a.txt", b"a")
+        _ = _saved_cache(tmp_path, "a.txt", stat_result, ["digest-a"])
+
+        assert (
+            hash_git_files.DigestCache.load(tmp_path / "cache.json", digest_width=2).get("a.txt", stat_result) is None
+        )
+
+    def test_When_entries_are_not_looked_up__Then_they_are_evicted_on_save(self, tmp_path: Path):
+        cache_file = tmp_path / "cache.json"
+        stat_a = _write_old_file(tmp_path / "a.txt", b"a")
+        stat_b = _write_old_file(tmp_path / "b.txt", b"b")
+        cache = hash_git_files.DigestCache.load(cache_file, digest_width=1)
+        cache.put("a.txt", stat_a, ["digest-a"])
+        cache.put("b.txt", stat_b, ["digest-b"])
+        cache.save()
+        cache = hash_git_files.DigestCache.load(cache_file, digest_width=1)
+        _ = cache.get("a.txt", stat_a)
+        cache.save()
+
+        cache = hash_git_files.DigestCache.load(cache_file, digest_width=1)
+        assert cache.get("a.txt", stat_a) == ["digest-a"]
+        assert cache.get("b.txt", stat_b) is None
+
+    def test_When_nothing_changed__Then_save_does_not_rewrite_the_file(self, tmp_path: Path):
+        cache_file = tmp_path / "cache.json"
+        stat_result = _write_old_file(tmp_path / "a.txt", b"a")
+        cache = hash_git_files.DigestCache.load(cache_file, digest_width=1)
+        cache.put("a.txt", stat_result, ["digest-a"])
+        cache.save()
+        cache_file.unlink()
+        cache = hash_git_files.DigestCache.load(cache_file, digest_width=1)
+        cache.save()
+
+        assert not cache_file.exists()
+
+    def test_When_cache_file_is_corrupt__Then_it_starts_empty(self, tmp_path: Path):
+        cache_file = tmp_path / "cache.json"
+        _ = cache_file.write_text('{"version": ', encoding="utf-8")
+        stat_result = _write_old_file(tmp_path / "a.txt", b"a")
+
+        assert hash_git_files.DigestCache.load(cache_file, digest_width=1).get("a.txt", stat_result) is None
+
+    def test_When_cache_file_is_from_another_version__Then_it_starts_empty(self, tmp_path: Path):
+        cache_file = tmp_path / "cache.json"
+        stat_result = _write_old_file(tmp_path / "a.txt", b"a")
+        entry = [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, "digest-a"]
+        _ = cache_file.write_text(json.dumps({"version": -1, "entries": {"a.txt": entry}}), encoding="utf-8")
+
+        assert hash_git_files.DigestCache.load(cache_file, digest_width=1).get("a.txt", stat_result) is None
+
+    def test_When_cached_digest_is_used__Then_file_is_not_read_again(self, tmp_path: Path):
+        cache = _saved_cache(tmp_path, "a.txt", _write_old_file(tmp_path / "a.txt", b"a"), ["stale-digest"])
+
+        # the cache trusts the stat fields, so a digest served from it proves the contents were not hashed again
+        assert hash_git_files.file_digester(tmp_path, hash_git_files.ALGORITHM_MERKLE_SHA256, cache)("a.txt") == [
+            "stale-digest"
+        ]
+
+    def test_When_file_changed__Then_digester_hashes_it_again(self, tmp_path: Path):
+        file_path = tmp_path / "a.txt"
+        cache = _saved_cache(tmp_path, "a.txt", _write_old_file(file_path, b"a"), ["stale-digest"])
+        _ = _write_old_file(file_path, b"ab")
+
+        assert hash_git_files.file_digester(tmp_path, hash_git_files.ALGORITHM_MERKLE_SHA256, cache)("a.txt") == (
+            hash_git_files.compute_file_sha256(file_path),
+        )
+
+
+GLOB_TEST_FILES = [
+    ".devcontainer/devcontainer.json",
+    ".devcontainer/nested/devcontainer.json",
+    ".devcontainer/nested/deeper/script.sh",
+    ".pre-commit-config.yaml",
+    "a.py",
+    "b.txt",
+    "c.txt",
+    "pkg/a.py",
+    "pkg/uv.lock",
+    "pkg/sub/b/uv.lock",
+    "uv.lock",
+    "docs/b",
+    "docs/x/y/b",
+]
+
+
+@pytest.fixture(scope="module")
+def glob_test_repo(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    repo_path = tmp_path_factory.mktemp("glob-repo")
+    for file in GLOB_TEST_FILES:
+        (repo_path / file).parent.mkdir(parents=True, exist_ok=True)
+        _ = (repo_path / file).write_text(file, encoding="utf-8")
+    _ = subprocess.run(["git", "init", "--quiet"], cwd=repo_path, check=True)  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+    _ = subprocess.run(["git", "add", "--all"], cwd=repo_path, check=True)  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+    return repo_path
+
+
+class TestGlobToRegex:
+    @pytest.mark.parametrize(
+        ("pattern", "expected"),
+        [
+            pytest.param("*.py", ["a.py"], id="star-is-anchored-to-the-root"),
+            pytest.param("**/*.py", ["a.py", "pkg/a.py"], id="leading-double-star-matches-no-directories-too"),
+            pytest.param(
+                "**/uv.lock", ["pkg/sub/b/uv.lock", "pkg/uv.lock", "uv.lock"], id="leading-double-star-any-depth"
+            ),
+            pytest.param(
+                ".devcontainer/**",
+                [
+                    ".devcontainer/devcontainer.json",
+                    ".devcontainer/nested/deeper/script.sh",
+                    ".devcontainer/nested/devcontainer.json",
+                ],
+                id="trailing-double-star-matches-everything-inside",
+            ),
+            pytest.param(
+                "docs/**/b", ["docs/b", "docs/x/y/b"], id="inner-double-star-matches-zero-or-more-directories"
+            ),
+            pytest.param("?.txt", ["b.txt", "c.txt"], id="question-mark-is-one-character"),
+            pytest.param("pkg/?", [], id="question-mark-does-not-match-a-slash"),
+            pytest.param("[b].txt", ["b.txt"], id="character-class"),
+            pytest.param("[!b].txt", ["c.txt"], id="negated-character-class"),
+            pytest.param("*.lock", ["uv.lock"], id="star-does-not-cross-directories"),
+            pytest.param(".pre-commit-config.yaml", [".pre-commit-config.yaml"], id="dots-are-literal"),
+        ],
+    )
+    def test_When_matched_against_files__Then_same_as_git_glob_pathspec(
+        self, glob_test_repo: Path, pattern: str, expected: list[str]
+    ):
+        matched = sorted(file for file in GLOB_TEST_FILES if re.fullmatch(hash_git_files._glob_to_regex(pattern), file))  # noqa: SLF001 # testing the translation directly
+        git_matched = sorted(
+            subprocess.run(  # noqa: S603 # the patterns are the fixed test parameters
+                ["git", "ls-files", "--", f":(glob){pattern}"],  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+                cwd=glob_test_repo,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.splitlines()
+        )
+
+        assert matched == expected
+        assert matched == git_matched
+
+
+class TestContextRules:
+    def test_When_file_matches_an_exclude__Then_it_is_not_in_the_context(self):
+        rules = hash_git_files.ContextRules("test", include=["**/*.lock"], exclude=["pkg/**"])
+
+        assert rules.matches("uv.lock")
+        assert not rules.matches("pkg/uv.lock")
+
+    def test_When_file_is_the_devcontainer_json__Then_it_is_never_in_the_context(self):
+        rules = hash_git_files.ContextRules(
+            "test", include=[".devcontainer/**"], devcontainer_json=".devcontainer/devcontainer.json"
+        )
+
+        assert rules.matches(".devcontainer/Dockerfile")
+        assert not rules.matches(".devcontainer/devcontainer.json")
+
+    def test_When_no_includes__Then_nothing_matches(self):
+        assert not hash_git_files.ContextRules("test", include=[]).matches("a.py")
+
+    def test_When_exclude_covers_the_devcontainer_json__Then_pathspecs_still_list_it(self, glob_test_repo: Path):
+        rules = hash_git_files.ContextRules.from_json_dict(
+            hash_git_files.DEVCONTAINER_CONTEXT_NAME,
+            hash_git_files.DEFAULT_CONTEXTS[hash_git_files.DEVCONTAINER_CONTEXT_NAME],
+        )
+
+        listed = list(hash_git_files.get_tracked_files(glob_test_repo, rules.to_pathspecs()))
+
+        assert ".devcontainer/devcontainer.json" in listed
+        assert [file for file in listed if rules.matches(file)] == [
+            ".devcontainer/nested/deeper/script.sh",
+            ".pre-commit-config.yaml",
+            "pkg/sub/b/uv.lock",
+            "pkg/uv.lock",
+            "uv.lock",
+        ]
+
+    def test_When_several_contexts__Then_one_context_excludes_do_not_drop_files_of_another(self, glob_test_repo: Path):
+        locks = hash_git_files.ContextRules("locks", include=["**/uv.lock"], exclude=["pkg/**"])
+        python = hash_git_files.ContextRules("python", include=["pkg/**/*.py"])
+
+        listed = list(hash_git_files.get_tracked_files(glob_test_repo, hash_git_files.union_pathspecs([locks, python])))
+
+        assert [file for file in listed if locks.matches(file)] == ["uv.lock"]
+        assert [file for file in listed if python.matches(file)] == ["pkg/a.py"]
+
+    def test_When_config_file_is_missing__Then_default_contexts_are_loaded(self, tmp_path: Path):
+        contexts = hash_git_files.load_context_rules(tmp_path / "missing.json")
+
+        assert list(contexts) == [hash_git_files.DEVCONTAINER_CONTEXT_NAME]
+
+    def test_When_config_file_exists__Then_its_contexts_are_loaded(self, tmp_path: Path):
+        config_file = tmp_path / "hash-contexts.json"
+        _ = config_file.write_text(json.dumps({"uv": {"include": ["**/uv.lock"]}}), encoding="utf-8")
+
+        contexts = hash_git_files.load_context_rules(config_file)
+
+        assert list(contexts) == ["uv"]
+        assert contexts["uv"].matches("pkg/uv.lock")
+
+
+@pytest.fixture
+def daemon_repo(tmp_path: Path) -> Path:
+    repo_path = tmp_path / "repo"
+    (repo_path / "pkg").mkdir(parents=True)
+    _ = (repo_path / "a.txt").write_text("a", encoding="utf-8")
+    _ = (repo_path / "pkg" / "b.py").write_text("b", encoding="utf-8")
+    _ = subprocess.run(["git", "init", "--quiet"], cwd=repo_path, check=True)  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+    _ = subprocess.run(["git", "add", "--all"], cwd=repo_path, check=True)  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+    return repo_path
+
+
+def _daemon_request(repo_path: Path, contexts: list[Any], algorithm: str) -> dict[str, Any]:
+    return {
+        "version": hash_git_files.DAEMON_PROTOCOL_VERSION,
+        "folder": str(repo_path.resolve()),
+        "algorithm": algorithm,
+        "contexts": [rules.to_json_dict() for rules in contexts],
+        "jobs": 1,
+    }
+
+
+def _direct_hashes(repo_path: Path, contexts: list[Any], algorithm: str) -> dict[str, str]:
+    args = argparse.Namespace(algorithm=algorithm, ref=None, no_cache=True, jobs=1, debug=False)
+    return hash_git_files._compute_context_hashes(args, repo_path, contexts).hexdigests()  # noqa: SLF001 # the daemon must agree with the direct computation
+
+
+class TestHashDaemon:
+    @pytest.mark.parametrize("algorithm", ["adler32", "merkle-sha256"])
+    def test_When_queried__Then_hashes_match_the_direct_computation(self, daemon_repo: Path, algorithm: str):
+        contexts = [
+            hash_git_files.ContextRules("all", include=["**"]),
+            hash_git_files.ContextRules("python", include=["**/*.py"]),
+        ]
+        daemon = hash_git_files.HashDaemon(daemon_repo, daemon_repo / "unused.sock")
+
+        response = daemon.handle_request(_daemon_request(daemon_repo, contexts, algorithm))
+
+        assert response["hashes"] == _direct_hashes(daemon_repo, contexts, algorithm)
+
+    def test_When_tracked_file_is_modified__Then_next_query_reflects_it(self, daemon_repo: Path):
+        contexts = [hash_git_files.ContextRules("all", include=["**"])]
+        daemon = hash_git_files.HashDaemon(daemon_repo, daemon_repo / "unused.sock")
+        before = daemon.handle_request(_daemon_request(daemon_repo, contexts, "adler32"))["hashes"]
+
+        _ = (daemon_repo / "pkg" / "b.py").write_text("changed", encoding="utf-8")
+        after = daemon.handle_request(_daemon_request(daemon_repo, contexts, "adler32"))["hashes"]
+
+        assert after != before
+        assert after == _direct_hashes(daemon_repo, contexts, "adler32")
+
+    def test_When_file_is_added_to_the_index__Then_next_query_includes_it(self, daemon_repo: Path):
+        contexts = [hash_git_files.ContextRules("all", include=["**"])]
+        daemon = hash_git_files.HashDaemon(daemon_repo, daemon_repo / "unused.sock")
+        before = daemon.handle_request(_daemon_request(daemon_repo, contexts, "adler32"))["hashes"]
+
+        _ = (daemon_repo / "pkg" / "c.py").write_text("c", encoding="utf-8")
+        _ = subprocess.run(["git", "add", "pkg/c.py"], cwd=daemon_repo, check=True)  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+        after = daemon.handle_request(_daemon_request(daemon_repo, contexts, "adler32"))["hashes"]
+
+        assert after != before
+        assert after == _direct_hashes(daemon_repo, contexts, "adler32")
+
+    def test_When_inotify_is_not_available__Then_changes_are_found_by_polling(
+        self, daemon_repo: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        def unavailable_watcher() -> None:
+            raise OSError(errno.ENOSYS, "inotify is disabled for this test")
+
+        monkeypatch.setattr(hash_git_files, "InotifyWatcher", unavailable_watcher)
+        contexts = [hash_git_files.ContextRules("all", include=["**"])]
+        daemon = hash_git_files.HashDaemon(daemon_repo, daemon_repo / "unused.sock")
+        _ = daemon.handle_request(_daemon_request(daemon_repo, contexts, "merkle-sha256"))
+
+        _ = (daemon_repo / "a.txt").write_text("z", encoding="utf-8")
+        _ = (daemon_repo / "pkg" / "c.py").write_text("c", encoding="utf-8")
+        _ = subprocess.run(["git", "add", "pkg/c.py"], cwd=daemon_repo, check=True)  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+        response = daemon.handle_request(_daemon_request(daemon_repo, contexts, "merkle-sha256"))
+
+        assert response["hashes"] == _direct_hashes(daemon_repo, contexts, "merkle-sha256")
+
+    def test_When_protocol_version_differs__Then_request_is_rejected(self, daemon_repo: Path):
+        daemon = hash_git_files.HashDaemon(daemon_repo, daemon_repo / "unused.sock")
+        request = _daemon_request(daemon_repo, [], "adler32") | {"version": hash_git_files.DAEMON_PROTOCOL_VERSION + 1}
+
+        with pytest.raises(ValueError, match="protocol version"):
+            _ = daemon.handle_request(request)
+
+    def test_When_folder_is_another_repository__Then_request_is_rejected(self, daemon_repo: Path, tmp_path: Path):
+        daemon = hash_git_files.HashDaemon(daemon_repo, daemon_repo / "unused.sock")
+
+        with pytest.raises(ValueError, match="This daemon serves"):
+            _ = daemon.handle_request(_daemon_request(tmp_path, [], "adler32"))
+
+    def test_When_algorithm_is_git_blob__Then_request_is_rejected(self, daemon_repo: Path):
+        daemon = hash_git_files.HashDaemon(daemon_repo, daemon_repo / "unused.sock")
+
+        with pytest.raises(NotImplementedError, match="not supported by the daemon"):
+            _ = daemon.handle_request(_daemon_request(daemon_repo, [], "git-blob"))
+
+    def test_When_daemon_is_serving__Then_query_over_the_socket_returns_its_hashes(self, daemon_repo: Path):
+        contexts = [hash_git_files.ContextRules("all", include=["**"])]
+        # the tmp_path of a test can be longer than the ~100 characters a Unix socket path is limited to
+        with tempfile.TemporaryDirectory(prefix="hash-daemon-") as socket_dir:
+            socket_path = Path(socket_dir) / "daemon.sock"
+            daemon = hash_git_files.HashDaemon(daemon_repo, socket_path)
+            threading.Thread(target=daemon.serve_forever, daemon=True).start()
+            deadline = time.monotonic() + 10
+            while not hash_git_files._is_daemon_running(socket_path):  # noqa: SLF001 # waiting for the daemon to start listening
+                assert time.monotonic() < deadline, "the daemon did not start listening"
+                time.sleep(0.01)
+
+            result = hash_git_files.query_daemon(socket_path, daemon_repo, contexts, "adler32", 1)
+
+        assert result is not None
+        assert result[0] == _direct_hashes(daemon_repo, contexts, "adler32")
+
+    def test_When_no_daemon_is_serving__Then_query_returns_none(self, daemon_repo: Path, tmp_path: Path):
+        contexts = [hash_git_files.ContextRules("all", include=["**"])]
+
+        assert hash_git_files.query_daemon(tmp_path / "missing.sock", daemon_repo, contexts, "adler32", 1) is None
+
+
+@pytest.fixture
+def context_config(tmp_path: Path) -> Path:
+    config_file = tmp_path / "hash-contexts.json"
+    _ = config_file.write_text(
+        json.dumps({"all": {"include": ["**"]}, "python": {"include": ["**/*.py"]}}), encoding="utf-8"
+    )
+    return config_file
+
+
+def _run_main(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], *args: str) -> str:
+    monkeypatch.setattr("sys.argv", ["hash_git_files.py", *args, "--no-daemon", "--no-cache"])
+    hash_git_files.main()
+    return capsys.readouterr().out
+
+
+class TestMain:
+    def test_When_several_contexts_with_json_format__Then_an_object_of_their_hashes_is_printed(
+        self,
+        daemon_repo: Path,
+        context_config: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+    ):
+        contexts = hash_git_files.load_context_rules(context_config)
+
+        output = _run_main(
+            monkeypatch,
+            capsys,
+            str(daemon_repo),
+            f"--context-config={context_config}",
+            "--context=all",
+            "--context=python",
+            "--output-format=json",
+        )
+
+        assert json.loads(output) == _direct_hashes(daemon_repo, list(contexts.values()), "adler32")
+
+    def test_When_several_contexts_with_github_output_format__Then_a_line_per_context_is_printed(
+        self,
+        daemon_repo: Path,
+        context_config: Path,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+    ):
+        contexts = hash_git_files.load_context_rules(context_config)
+        expected = _direct_hashes(daemon_repo, list(contexts.values()), "merkle-sha256")
+
+        output = _run_main(
+            monkeypatch,
+            capsys,
+            str(daemon_repo),
+            f"--context-config={context_config}",
+            "--context=all",
+            "--context=python",
+            "--algorithm=merkle-sha256",
+            "--output-format=github-output",
+        )
+
+        assert output.splitlines() == [f"all={expected['all']}", f"python={expected['python']}"]
+
+    def test_When_no_context_is_selected__Then_just_the_hash_of_all_files_is_printed(
+        self, daemon_repo: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+    ):
+        contexts = [hash_git_files.ContextRules(hash_git_files.ALL_FILES_CONTEXT_NAME, include=["**"])]
+
+        output = _run_main(monkeypatch, capsys, str(daemon_repo))
+
+        assert output == f"{_direct_hashes(daemon_repo, contexts, 'adler32')[hash_git_files.ALL_FILES_CONTEXT_NAME]}\n"
+
+
+def _git(repo_path: Path, *args: str) -> str:
+    return subprocess.run(  # noqa: S603 # the arguments are fixed by the tests
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+        cwd=repo_path,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def _reference_merkle_root(leaves: list[tuple[str, str]]) -> str:
+    """Combine the (file, digest) leaves level by level, promoting an unpaired node to the next level, as the hashing modes specify."""
+    level = [
+        hashlib.sha256(b"\x00" + file.encode("utf-8") + b"\x00" + digest.encode("ascii")).digest()
+        for file, digest in leaves
+    ]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        pairs = [hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        level = pairs + level[len(pairs) * 2 :]
+    return level[0].hex()
+
+
+class TestMerkleSha256:
+    @pytest.mark.parametrize("leaf_count", [0, 1, 2, 3, 5, 6, 7, 8])
+    def test_When_leaves_are_added__Then_root_matches_the_level_by_level_combine(self, leaf_count: int):
+        leaves = [(f"file{index}", hashlib.sha256(str(index).encode()).hexdigest()) for index in range(leaf_count)]
+        context_digest = hash_git_files.MerkleDigest()
+
+        for file, digest in leaves:
+            context_digest.add(file, (digest,))
+
+        assert context_digest.hexdigest() == _reference_merkle_root(leaves)
+
+    def test_When_repository_is_hashed__Then_root_is_the_known_digest(self, daemon_repo: Path):
+        files = list(hash_git_files.get_tracked_files(daemon_repo))
+
+        root = hash_git_files.compute_merkle_sha256(daemon_repo, files, jobs=2)
+
+        assert root == _reference_merkle_root(
+            [(file, hashlib.sha256((daemon_repo / file).read_bytes()).hexdigest()) for file in files]
+        )
+        assert root == MERKLE_SHA256_OF_DAEMON_REPO
+
+    def test_When_hashed_with_any_number_of_threads__Then_root_is_the_same(self, daemon_repo: Path):
+        files = list(hash_git_files.get_tracked_files(daemon_repo))
+
+        roots = {hash_git_files.compute_merkle_sha256(daemon_repo, files, jobs=jobs) for jobs in (1, 2, 8)}
+
+        assert roots == {MERKLE_SHA256_OF_DAEMON_REPO}
+
+
+class TestGitBlob:
+    def test_When_working_tree_is_clean__Then_object_ids_are_those_of_git_hash_object(self, daemon_repo: Path):
+        blob_ids = list(hash_git_files.get_git_blob_ids(daemon_repo))
+
+        assert blob_ids == [(file, _git(daemon_repo, "hash-object", file)) for file in ("a.txt", "pkg/b.py")]
+
+    def test_When_file_is_modified__Then_its_working_tree_contents_are_hashed(self, daemon_repo: Path):
+        _ = (daemon_repo / "pkg" / "b.py").write_text("changed", encoding="utf-8")
+
+        blob_ids = dict(hash_git_files.get_git_blob_ids(daemon_repo))
+
+        assert blob_ids["pkg/b.py"] == _git(daemon_repo, "hash-object", "pkg/b.py")
+
+    def test_When_file_is_deleted__Then_it_is_left_out(self, daemon_repo: Path):
+        (daemon_repo / "a.txt").unlink()
+
+        assert list(hash_git_files.get_git_blob_ids(daemon_repo)) == [
+            ("pkg/b.py", _git(daemon_repo, "hash-object", "pkg/b.py"))
+        ]
+
+    def test_When_contexts_are_hashed__Then_each_is_the_merkle_root_of_its_object_ids(self, daemon_repo: Path):
+        contexts = [hash_git_files.ContextRules("python", include=["**/*.py"])]
+
+        hashes = _direct_hashes(daemon_repo, contexts, "git-blob")
+
+        assert hashes == {
+            "python": _reference_merkle_root([("pkg/b.py", _git(daemon_repo, "hash-object", "pkg/b.py"))])
+        }
+
+    def test_When_submodule_has_a_new_commit__Then_it_is_represented_by_that_commit(self, daemon_repo: Path):
+        submodule = daemon_repo / "sub"
+        submodule.mkdir()
+        _ = _git(submodule, "init", "--quiet")
+        _ = (submodule / "c.txt").write_text("c", encoding="utf-8")
+        _ = _git(submodule, "add", "c.txt")
+        _ = _git(submodule, "commit", "--quiet", "-m", "first")
+        _ = _git(daemon_repo, "add", "sub")
+        _ = (submodule / "c.txt").write_text("changed", encoding="utf-8")
+        _ = _git(submodule, "commit", "--quiet", "--all", "-m", "second")
+
+        blob_ids = dict(hash_git_files.get_git_blob_ids(daemon_repo))
+
+        assert blob_ids["sub"] == _git(submodule, "rev-parse", "HEAD")
+
+    def test_When_ref_is_given__Then_the_files_of_that_commit_are_hashed(
+        self, daemon_repo: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+    ):
+        _ = _git(daemon_repo, "commit", "--quiet", "-m", "first")
+        first_commit = _git(daemon_repo, "rev-parse", "HEAD")
+        clean_hash = _run_main(monkeypatch, capsys, str(daemon_repo), "--algorithm=git-blob")
+        _ = (daemon_repo / "a.txt").write_text("changed", encoding="utf-8")
+        _ = _git(daemon_repo, "commit", "--quiet", "--all", "-m", "second")
+
+        ref_hash = _run_main(monkeypatch, capsys, str(daemon_repo), "--algorithm=git-blob", f"--ref={first_commit}")
+
+        assert ref_hash == clean_hash
+        assert ref_hash != _run_main(monkeypatch, capsys, str(daemon_repo), "--algorithm=git-blob")
+
+    def test_When_ref_is_given_without_git_blob__Then_it_is_rejected(
+        self, daemon_repo: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+    ):
+        with pytest.raises(SystemExit, match="2"):
+            _ = _run_main(monkeypatch, capsys, str(daemon_repo), "--ref=HEAD")
+
+        assert "--ref requires --algorithm git-blob" in capsys.readouterr().err
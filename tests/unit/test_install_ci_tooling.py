@@ -0,0 +1,194 @@
+import argparse
+import base64
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from .scripts import load_script
+
+install_ci_tooling = load_script(".devcontainer/install-ci-tooling.py", "install_ci_tooling")
+CONTENTS = b"#!/bin/sh\necho installing\n"
+
+
+@pytest.fixture
+def source_file(tmp_path: Path) -> Path:
+    path = tmp_path / "source" / "install.sh"
+    path.parent.mkdir()
+    _ = path.write_bytes(CONTENTS)
+    return path
+
+
+def _write_receipt(tool_dir: Path, tool: str, requirements: dict[str, str]) -> None:
+    (tool_dir / tool).mkdir(parents=True)
+    _ = (tool_dir / tool / "uv-receipt.toml").write_text(
+        "[tool]\nrequirements = [\n"
+        + "".join(
+            f'    {{ name = "{name}", specifier = "{specifier}" }},\n' for name, specifier in requirements.items()
+        )
+        + "]\n",
+        encoding="utf-8",
+    )
+
+
+def _sha512_integrity(contents: bytes) -> str:
+    return f"sha512-{base64.b64encode(hashlib.sha512(contents).digest()).decode('ascii')}"
+
+
+class TestDownloadCache:
+    def test_When_url_is_fetched__Then_it_is_stored_under_its_digest(self, tmp_path: Path, source_file: Path):
+        cache = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=False)
+
+        cached_file = cache.fetch(source_file.as_uri())
+
+        assert cached_file == tmp_path / "cache" / "sha256" / f"{hashlib.sha256(CONTENTS).hexdigest()}.sh"
+        assert cached_file.read_bytes() == CONTENTS
+
+    def test_When_url_was_fetched_by_a_previous_run__Then_it_is_used_offline(self, tmp_path: Path, source_file: Path):
+        _ = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=False).fetch(source_file.as_uri())
+        source_file.unlink()
+
+        cached_file = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=True).fetch(source_file.as_uri())
+
+        assert cached_file.read_bytes() == CONTENTS
+
+    def test_When_url_is_not_cached_and_offline__Then_it_fails_without_downloading(
+        self, tmp_path: Path, source_file: Path
+    ):
+        cache = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=True)
+
+        with pytest.raises(FileNotFoundError, match="--offline is set"):
+            _ = cache.fetch(source_file.as_uri())
+
+        assert not (tmp_path / "cache" / "sha256").exists()
+
+    def test_When_cached_file_is_corrupted__Then_it_is_downloaded_again(self, tmp_path: Path, source_file: Path):
+        cache = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=False)
+        _ = cache.fetch(source_file.as_uri()).write_bytes(b"corrupted")
+
+        cached_file = cache.fetch(source_file.as_uri())
+
+        assert cached_file.read_bytes() == CONTENTS
+
+    def test_When_contents_match_the_integrity__Then_they_are_cached(self, tmp_path: Path, source_file: Path):
+        cache = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=False)
+
+        cached_file = cache.fetch(source_file.as_uri(), integrity=_sha512_integrity(CONTENTS))
+
+        assert cached_file.read_bytes() == CONTENTS
+
+    def test_When_contents_do_not_match_the_integrity__Then_nothing_is_cached(self, tmp_path: Path, source_file: Path):
+        cache = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=False)
+
+        with pytest.raises(ValueError, match="do not match the expected checksum"):
+            _ = cache.fetch(source_file.as_uri(), integrity=_sha512_integrity(b"other"))
+
+        assert list((tmp_path / "cache" / "sha256").iterdir()) == []
+        assert not (tmp_path / "cache" / "index.json").exists()
+
+    def test_When_index_is_unreadable__Then_the_cache_starts_empty(self, tmp_path: Path, source_file: Path):
+        (tmp_path / "cache").mkdir()
+        _ = (tmp_path / "cache" / "index.json").write_text("{", encoding="utf-8")
+        cache = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=False)
+
+        cached_file = cache.fetch(source_file.as_uri())
+
+        assert cached_file.read_bytes() == CONTENTS
+
+
+class TestInstallPythonTools:
+    def test_When_uv_is_missing_and_offline__Then_it_fails_instead_of_running_the_installer(self, tmp_path: Path):
+        args = argparse.Namespace(python_version="3.12", cache_dir=tmp_path / "cache", offline=True, find_links=None)
+        cache = install_ci_tooling.DownloadCache(tmp_path / "cache", offline=True)
+
+        with pytest.raises(FileNotFoundError, match="cannot be installed with --offline"):
+            install_ci_tooling.install_python_tools(args, cache, None, {"uv": None})
+
+
+@pytest.fixture
+def tool_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Make the version queries report the pinned uv and pnpm, no SSM plugin, and this directory as the uv tool directory."""
+    tool_dir = tmp_path / "tools"
+    tool_dir.mkdir()
+    outputs = {
+        "--version": f"uv {install_ci_tooling.UV_VERSION} (e176e1714 2025-07-30)",
+        "dir": str(tool_dir),
+    }
+
+    def probe_output(command: list[str]) -> str | None:
+        if command[0] == "pnpm":
+            return install_ci_tooling.PNPM_VERSION
+        if command[0] == "session-manager-plugin":
+            return None
+        return outputs[command[-1]]
+
+    monkeypatch.setattr(install_ci_tooling, "_probe_output", probe_output)
+    return tool_dir
+
+
+class TestProbeInstalledVersions:
+    def test_When_receipts_match_the_pins__Then_every_installed_tool_is_satisfied(self, tool_dir: Path):
+        _write_receipt(
+            tool_dir,
+            "copier",
+            {
+                "copier-template-extensions": f"=={install_ci_tooling.COPIER_TEMPLATE_EXTENSIONS_VERSION}",
+                "copier": f"=={install_ci_tooling.COPIER_VERSION}",
+            },
+        )
+        _write_receipt(tool_dir, "pre-commit", {"pre-commit": f"=={install_ci_tooling.PRE_COMMIT_VERSION}"})
+
+        installed_versions = install_ci_tooling.probe_installed_versions("uv")
+
+        assert installed_versions == install_ci_tooling.PINNED_VERSIONS | {"session-manager-plugin": None}
+        assert [
+            tool
+            for tool in install_ci_tooling.PINNED_VERSIONS
+            if not install_ci_tooling.is_satisfied(installed_versions, tool)
+        ] == ["session-manager-plugin"]
+
+    def test_When_receipt_has_another_version__Then_the_tool_is_not_satisfied(self, tool_dir: Path):
+        _write_receipt(tool_dir, "pre-commit", {"pre-commit": "==4.0.0"})
+
+        installed_versions = install_ci_tooling.probe_installed_versions("uv")
+
+        assert installed_versions["pre-commit"] == "pre-commit==4.0.0"
+        assert not install_ci_tooling.is_satisfied(installed_versions, "pre-commit")
+
+    def test_When_receipt_is_missing_a_requirement__Then_the_tool_is_not_satisfied(self, tool_dir: Path):
+        _write_receipt(tool_dir, "copier", {"copier": f"=={install_ci_tooling.COPIER_VERSION}"})
+
+        installed_versions = install_ci_tooling.probe_installed_versions("uv")
+
+        assert not install_ci_tooling.is_satisfied(installed_versions, "copier")
+
+    @pytest.mark.parametrize(
+        "receipt",
+        [
+            pytest.param(None, id="missing"),
+            pytest.param("[tool\n", id="invalid-toml"),
+            pytest.param("[tool]\nname = 'pre-commit'\n", id="no-requirements"),
+        ],
+    )
+    def test_When_receipt_is_unusable__Then_the_tool_is_reported_as_missing(self, tool_dir: Path, receipt: str | None):
+        if receipt is not None:
+            (tool_dir / "pre-commit").mkdir()
+            _ = (tool_dir / "pre-commit" / "uv-receipt.toml").write_text(receipt, encoding="utf-8")
+
+        installed_versions = install_ci_tooling.probe_installed_versions("uv")
+
+        assert installed_versions["pre-commit"] is None
+        assert not install_ci_tooling.is_satisfied(installed_versions, "pre-commit")
+
+    @pytest.mark.usefixtures("tool_dir")
+    def test_When_uv_is_another_version__Then_it_is_not_satisfied(self, monkeypatch: pytest.MonkeyPatch):
+        def probe_output(command: list[str]) -> str | None:
+            return "uv 0.1.0" if command[-1] == "--version" else None
+
+        monkeypatch.setattr(install_ci_tooling, "_probe_output", probe_output)
+
+        installed_versions = install_ci_tooling.probe_installed_versions("uv")
+
+        assert installed_versions["uv"] == "0.1.0"
+        assert installed_versions["copier"] is None
+        assert not install_ci_tooling.is_satisfied(installed_versions, "uv")
@@ -0,0 +1,286 @@
+import argparse
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from .scripts import load_script
+
+manual_setup_deps = load_script(".devcontainer/manual-setup-deps.py", "manual_setup_deps")
+FINGERPRINT = "a" * 64
+
+
+def _env(name: str, *depends_on: str) -> Any:  # noqa: ANN401 # the script is loaded from its path, so its classes are not known statically
+    return manual_setup_deps.EnvConfig({"package_manager": "uv", "description": name, "depends_on": list(depends_on)})
+
+
+class FakeRunner:
+    """Stands in for the EnvRunner, recording the order the environments are set up in instead of installing anything."""
+
+    def __init__(self, *, jobs: int = 1, fail_fast: bool = False, failing: frozenset[str] | None = None):
+        super().__init__()
+        self.args = argparse.Namespace(jobs=jobs, fail_fast=fail_fast)
+        self.failing = failing if failing is not None else frozenset[str]()
+        self.started: list[str] = []
+        self.finished: list[str] = []
+        self.cancel_count = 0
+        self._lock = threading.Lock()
+
+    def cancel(self) -> None:
+        self.cancel_count += 1
+
+    def setup(self, env: Any) -> None:  # noqa: ANN401 # the script is loaded from its path, so its classes are not known statically
+        with self._lock:
+            self.started.append(env.name)
+        if env.name in self.failing:
+            raise RuntimeError(f"{env.name} failed")
+        with self._lock:
+            self.finished.append(env.name)
+
+
+class TestCheckDependencies:
+    def test_When_dependencies_form_a_cycle__Then_it_is_reported(self):
+        envs = [_env("a", "c"), _env("b", "a"), _env("c", "b")]
+
+        with pytest.raises(ValueError, match="cycle"):
+            manual_setup_deps.check_dependencies(envs)
+
+    def test_When_environment_depends_on_itself__Then_it_is_reported_as_a_cycle(self):
+        with pytest.raises(ValueError, match="cycle"):
+            manual_setup_deps.check_dependencies([_env("a", "a")])
+
+    def test_When_dependency_is_unknown__Then_it_is_reported(self):
+        with pytest.raises(ValueError, match="unknown environments: missing"):
+            manual_setup_deps.check_dependencies([_env("a", "missing")])
+
+    def test_When_names_are_duplicated__Then_it_is_reported(self):
+        with pytest.raises(ValueError, match="duplicates: a"):
+            manual_setup_deps.check_dependencies([_env("a"), _env("a")])
+
+    def test_When_dependencies_form_a_dag__Then_nothing_is_raised(self):
+        manual_setup_deps.check_dependencies([_env("a"), _env("b", "a"), _env("c", "a"), _env("d", "b", "c")])
+
+
+class TestRunEnvs:
+    @pytest.mark.parametrize("jobs", [1, 4])
+    def test_When_environments_depend_on_each_other__Then_dependencies_finish_first(self, jobs: int):
+        runner = FakeRunner(jobs=jobs)
+        envs = [_env("d", "b", "c"), _env("c", "a"), _env("b", "a"), _env("a")]
+
+        failures = manual_setup_deps.run_envs(runner, envs)
+
+        assert failures == {}
+        assert sorted(runner.finished) == ["a", "b", "c", "d"]
+        for env in envs:
+            for dependency in env.depends_on:
+                assert runner.finished.index(dependency) < runner.started.index(env.name)
+
+    def test_When_environment_fails__Then_its_dependents_are_not_set_up(self):
+        runner = FakeRunner(failing=frozenset({"a"}))
+        envs = [_env("a"), _env("b", "a"), _env("c", "b"), _env("independent")]
+
+        failures = manual_setup_deps.run_envs(runner, envs)
+
+        assert set(failures) == {"a", "b", "c"}
+        assert isinstance(failures["a"], RuntimeError)
+        assert isinstance(failures["b"], manual_setup_deps.EnvDependencyFailedError)
+        assert isinstance(failures["c"], manual_setup_deps.EnvDependencyFailedError)
+        assert "b" in str(failures["c"])
+        assert sorted(runner.started) == ["a", "independent"]
+
+    def test_When_dependency_is_not_being_set_up__Then_it_is_considered_satisfied(self):
+        runner = FakeRunner()
+
+        failures = manual_setup_deps.run_envs(runner, [_env("b", "skipped")])
+
+        assert failures == {}
+        assert runner.finished == ["b"]
+
+    def test_When_fail_fast__Then_the_runner_is_cancelled(self):
+        runner = FakeRunner(fail_fast=True, failing=frozenset({"a"}))
+
+        _ = manual_setup_deps.run_envs(runner, [_env("a"), _env("b")])
+
+        assert runner.cancel_count == 1
+
+    def test_When_not_fail_fast__Then_the_runner_is_not_cancelled(self):
+        runner = FakeRunner(failing=frozenset({"a"}))
+
+        failures = manual_setup_deps.run_envs(runner, [_env("a"), _env("b")])
+
+        assert runner.cancel_count == 0
+        assert set(failures) == {"a"}
+
+    def test_When_action_is_given__Then_it_runs_instead_of_setup(self):
+        runner = FakeRunner()
+        warmed: list[str] = []
+
+        def warm(env: Any) -> None:  # noqa: ANN401 # the script is loaded from its path, so its classes are not known statically
+            warmed.append(env.name)
+
+        _ = manual_setup_deps.run_envs(runner, [_env("a"), _env("b", "a")], action=warm)
+
+        assert warmed == ["a", "b"]
+        assert runner.started == []
+
+
+class TestPackageCache:
+    @pytest.mark.parametrize(
+        ("entry_name", "version", "expected"),
+        [
+            ("1.0.1-py3-none-any", "1.0.1", True),
+            ("1.0.1-py3-none-any.http", "1.0.1", True),
+            ("1.0.1", "1.0.1", True),
+            ("1.0.1-py3-none-any", "1.0", False),
+            ("11.0-py3-none-any", "1.0", False),
+            ("1.0.1", "1.0", False),
+        ],
+    )
+    def test_When_version_is_looked_up__Then_only_an_exact_match_counts(
+        self, tmp_path: Path, entry_name: str, version: str, expected: bool
+    ):
+        (tmp_path / "uv" / "wheels-v5" / "pypi" / "package" / entry_name).mkdir(parents=True)
+        package_cache = manual_setup_deps.PackageCache(tmp_path)
+
+        assert package_cache.is_uv_package_cached("package", version) is expected
+
+    def test_When_package_name_differs__Then_it_is_not_cached(self, tmp_path: Path):
+        (tmp_path / "uv" / "wheels-v5" / "pypi" / "package" / "1.0-py3-none-any").mkdir(parents=True)
+        package_cache = manual_setup_deps.PackageCache(tmp_path)
+
+        assert not package_cache.is_uv_package_cached("other-package", "1.0")
+
+
+@pytest.fixture
+def repo_root(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Point the script at a repository with one uv environment in the `project` directory, which has been installed."""
+    monkeypatch.setattr(manual_setup_deps, "REPO_ROOT_DIR", tmp_path)
+    monkeypatch.setattr(manual_setup_deps, "STATE_FILE", tmp_path / ".cache" / "state.json")
+    (tmp_path / "project" / ".venv").mkdir(parents=True)
+    _ = (tmp_path / "project" / "pyproject.toml").write_text('[project]\nname = "project"\n', encoding="utf-8")
+    _ = (tmp_path / "project" / "uv.lock").write_text("version = 1\n", encoding="utf-8")
+    return tmp_path
+
+
+def _project_env() -> Any:  # noqa: ANN401 # the script is loaded from its path, so its classes are not known statically
+    return manual_setup_deps.EnvConfig({"package_manager": "uv", "relative_directory": "project"})
+
+
+class TestSetupState:
+    @pytest.mark.usefixtures("repo_root")
+    def test_When_saved__Then_loaded_state_has_the_same_fingerprints(self):
+        state = manual_setup_deps.SetupState(manual_setup_deps.STATE_FILE)
+        state.record(_project_env(), FINGERPRINT)
+
+        state.save()
+
+        assert manual_setup_deps.SetupState.load(manual_setup_deps.STATE_FILE).fingerprints == {"project": FINGERPRINT}
+
+    def test_When_nothing_was_recorded__Then_save_does_not_write_the_file(self, repo_root: Path):
+        manual_setup_deps.SetupState(manual_setup_deps.STATE_FILE).save()
+
+        assert not (repo_root / ".cache").exists()
+
+    @pytest.mark.parametrize(
+        "contents",
+        [
+            "{not json",
+            "[]",
+            '{"version": 0, "fingerprints": {"project": "a"}}',
+            f'{{"version": {manual_setup_deps.STATE_VERSION}, "fingerprints": []}}',
+        ],
+    )
+    @pytest.mark.usefixtures("repo_root")
+    def test_When_state_file_is_unusable__Then_state_starts_empty(self, contents: str):
+        manual_setup_deps.STATE_FILE.parent.mkdir()
+        _ = manual_setup_deps.STATE_FILE.write_text(contents, encoding="utf-8")
+
+        assert manual_setup_deps.SetupState.load(manual_setup_deps.STATE_FILE).fingerprints == {}
+
+    @pytest.mark.usefixtures("repo_root")
+    def test_When_fingerprint_matches_and_environment_is_installed__Then_it_is_up_to_date(self):
+        state = manual_setup_deps.SetupState(manual_setup_deps.STATE_FILE, {"project": FINGERPRINT})
+
+        assert state.is_up_to_date(_project_env(), FINGERPRINT)
+
+    @pytest.mark.usefixtures("repo_root")
+    def test_When_fingerprint_differs__Then_it_is_not_up_to_date(self):
+        state = manual_setup_deps.SetupState(manual_setup_deps.STATE_FILE, {"project": FINGERPRINT})
+
+        assert not state.is_up_to_date(_project_env(), "b" * 64)
+
+    def test_When_installed_directory_was_removed__Then_it_is_not_up_to_date(self, repo_root: Path):
+        state = manual_setup_deps.SetupState(manual_setup_deps.STATE_FILE, {"project": FINGERPRINT})
+        (repo_root / "project" / ".venv").rmdir()
+
+        assert not state.is_up_to_date(_project_env(), FINGERPRINT)
+
+
+@pytest.mark.usefixtures("repo_root")
+class TestSetup:
+    @pytest.fixture
+    def installs(self, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+        """Record the environments installed by every EnvRunner, instead of running uv."""
+        installed: list[str] = []
+
+        def install(_self: Any, env: Any, *, env_skip_check_lock: bool) -> None:  # noqa: ANN401,ARG001 # stands in for EnvRunner._install
+            installed.append(env.name)
+
+        monkeypatch.setattr(manual_setup_deps.EnvRunner, "_install", install)
+        return installed
+
+    def _runner(self, *, force: bool = False) -> Any:  # noqa: ANN401 # the script is loaded from its path, so its classes are not known statically
+        return manual_setup_deps.EnvRunner(
+            argparse.Namespace(
+                python_version="3.12.7",
+                skip_check_lock=True,
+                optionally_check_lock=False,
+                package_cache_dir=Path("unused"),
+                jobs=1,
+                force=force,
+            )
+        )
+
+    def _set_up_and_save(self, *, force: bool = False) -> None:
+        runner = self._runner(force=force)
+        runner.setup(_project_env())
+        runner.state.save()
+
+    def test_When_nothing_changed_since_the_last_setup__Then_it_is_skipped(self, installs: list[str]):
+        self._set_up_and_save()
+
+        self._set_up_and_save()
+
+        assert installs == ["project"]
+
+    def test_When_lock_file_changed__Then_it_is_set_up_again(self, repo_root: Path, installs: list[str]):
+        self._set_up_and_save()
+        _ = (repo_root / "project" / "uv.lock").write_text("version = 2\n", encoding="utf-8")
+
+        self._set_up_and_save()
+
+        assert installs == ["project", "project"]
+
+    def test_When_forced__Then_it_is_set_up_even_though_nothing_changed(self, installs: list[str]):
+        self._set_up_and_save()
+
+        self._set_up_and_save(force=True)
+
+        assert installs == ["project", "project"]
+
+    def test_When_install_rewrites_the_lock_file__Then_the_next_run_is_skipped(
+        self, repo_root: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        installed: list[str] = []
+
+        def relocking_install(_self: Any, env: Any, *, env_skip_check_lock: bool) -> None:  # noqa: ANN401,ARG001 # stands in for an unfrozen `uv sync`, which can relock
+            installed.append(env.name)
+            _ = (repo_root / "project" / "uv.lock").write_text("version = 1\n# relocked\n", encoding="utf-8")
+
+        monkeypatch.setattr(manual_setup_deps.EnvRunner, "_install", relocking_install)
+        self._set_up_and_save()
+
+        self._set_up_and_save()
+
+        assert installed == ["project"]
@@ -0,0 +1,235 @@
+import os
+import tomllib
+from collections.abc import Iterable
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from .scripts import load_script
+
+replace_private_package_registries = load_script(
+    ".github/workflows/replace_private_package_registries.py", "replace_private_package_registries"
+)
+PRIVATE_INDEX_URL = "https://example-123456789012.d.codeartifact.us-east-1.amazonaws.com/pypi/example/simple/"
+PRIVATE_FILE_URL = "https://example-123456789012.d.codeartifact.us-east-1.amazonaws.com/pypi/example/simple/foo/1.0.0"
+# a second from the epoch, so that any rewrite of the file shows up as a different mtime
+OLD_MTIME_NS = 1_000_000_000
+FILE_MODE = 0o640
+
+
+def _write(path: Path, text: str) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _ = path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+    return path
+
+
+def _lines(*lines: str) -> str:
+    return "".join(f"{line}\n" for line in lines)
+
+
+def _upper(lines: Iterable[str]) -> Iterator[str]:
+    return (line.upper() for line in lines)
+
+
+class TestProcessPyproject:
+    def test_When_an_index_is_the_default__Then_every_index_block_is_replaced_by_pypi(self, tmp_path: Path):
+        pyproject = _write(
+            tmp_path / "pyproject.toml",
+            _lines(
+                "[project]",
+                'name = "example"',
+                "",
+                "[[tool.uv.index]]",
+                'name = "private"',
+                f'url = "{PRIVATE_INDEX_URL}"',
+                "default = true",
+                "",
+                "[[tool.uv.index]]",
+                'name = "other"',
+                'url = "https://example.com/simple/"',
+                "",
+                "[tool.pytest.ini_options]",
+                'addopts = "-q"',
+            ),
+        )
+
+        assert replace_private_package_registries.process_pyproject(pyproject)
+
+        assert pyproject.read_text(encoding="utf-8") == _lines(
+            "[project]",
+            'name = "example"',
+            "",
+            "[tool.pytest.ini_options]",
+            'addopts = "-q"',
+            "[[tool.uv.index]]",
+            'name = "pypi"',
+            'url = "https://pypi.org/simple/"',
+        )
+
+    def test_When_index_block_is_followed_by_a_table__Then_the_table_is_kept(self, tmp_path: Path):
+        pyproject = _write(
+            tmp_path / "pyproject.toml",
+            _lines(
+                "[[tool.uv.index]]",
+                'name = "private"',
+                f'url = "{PRIVATE_INDEX_URL}"',
+                "default = true",
+                "",
+                "[tool.uv]",
+                "package = false",
+            ),
+        )
+
+        _ = replace_private_package_registries.process_pyproject(pyproject)
+
+        assert tomllib.loads(pyproject.read_text(encoding="utf-8"))["tool"]["uv"] == {
+            "package": False,
+            "index": [{"name": "pypi", "url": "https://pypi.org/simple/"}],
+        }
+
+    def test_When_no_index_is_the_default__Then_the_file_is_left_alone(self, tmp_path: Path):
+        text = f'[project]\nname = "example"\n\n[[tool.uv.index]]\nname = "private"\nurl = "{PRIVATE_INDEX_URL}"\n'
+        pyproject = _write(tmp_path / "pyproject.toml", text)
+
+        assert not replace_private_package_registries.process_pyproject(pyproject)
+
+        assert pyproject.read_text(encoding="utf-8") == text
+        assert pyproject.stat().st_mtime_ns == OLD_MTIME_NS
+
+
+class TestProcessLockFile:
+    def test_When_packages_come_from_the_private_registry__Then_they_point_at_pypi_without_their_distributions(
+        self, tmp_path: Path
+    ):
+        lock_file = _write(
+            tmp_path / "uv.lock",
+            _lines(
+                "version = 1",
+                "",
+                "[[package]]",
+                'name = "foo"',
+                'version = "1.0.0"',
+                f'source = {{ registry = "{PRIVATE_INDEX_URL}" }}',
+                f'sdist = {{ url = "{PRIVATE_FILE_URL}/foo-1.0.0.tar.gz", hash = "sha256:aa", size = 1 }}',
+                "wheels = [",
+                f'    {{ url = "{PRIVATE_FILE_URL}/foo-1.0.0-py3-none-any.whl", hash = "sha256:bb", size = 1 }},',
+                "]",
+                "",
+                "[[package]]",
+                'name = "bar"',
+                'version = "2.0.0"',
+                'source = { editable = "." }',
+                "dependencies = [",
+                f'    {{ name = "foo", index = "{PRIVATE_INDEX_URL}" }},',
+                "]",
+            ),
+        )
+
+        assert replace_private_package_registries.process_lock_file(lock_file)
+
+        text = lock_file.read_text(encoding="utf-8")
+        assert "codeartifact" not in text
+        # the distributions are left for the next relock to fill back in from PyPI
+        assert tomllib.loads(text)["package"] == [
+            {"name": "foo", "version": "1.0.0", "source": {"registry": "https://pypi.org/simple"}, "wheels": []},
+            {
+                "name": "bar",
+                "version": "2.0.0",
+                "source": {"editable": "."},
+                "dependencies": [{"name": "foo", "index": "https://pypi.org/simple"}],
+            },
+        ]
+
+    def test_When_nothing_comes_from_a_private_registry__Then_the_file_is_left_alone(self, tmp_path: Path):
+        text = 'version = 1\n\n[[package]]\nname = "foo"\nsource = { registry = "https://pypi.org/simple" }\n'
+        lock_file = _write(tmp_path / "uv.lock", text)
+
+        assert not replace_private_package_registries.process_lock_file(lock_file)
+
+        assert lock_file.read_text(encoding="utf-8") == text
+        assert lock_file.stat().st_mtime_ns == OLD_MTIME_NS
+
+
+class TestRewriteAtomically:
+    def test_When_rewrite_changes_nothing__Then_the_file_and_its_mtime_are_left_alone(self, tmp_path: Path):
+        file_path = _write(tmp_path / "uv.lock", "unchanged\n")
+
+        assert not replace_private_package_registries.rewrite_atomically(file_path, iter)
+
+        assert file_path.stat().st_mtime_ns == OLD_MTIME_NS
+        assert [path.name for path in tmp_path.iterdir()] == ["uv.lock"]
+
+    @pytest.mark.skipif(os.name == "nt", reason="Windows has no executable permission bits")
+    def test_When_file_is_rewritten__Then_its_permissions_are_kept(self, tmp_path: Path):
+        file_path = _write(tmp_path / "uv.lock", "old\n")
+        file_path.chmod(FILE_MODE)
+
+        assert replace_private_package_registries.rewrite_atomically(file_path, _upper)
+
+        assert file_path.read_text(encoding="utf-8") == "OLD\n"
+        assert file_path.stat().st_mode & 0o777 == FILE_MODE
+        assert [path.name for path in tmp_path.iterdir()] == ["uv.lock"]
+
+
+class TestContainsAny:
+    def test_When_file_holds_a_marker__Then_it_is_found(self, tmp_path: Path):
+        file_path = _write(tmp_path / "uv.lock", f'source = {{ registry = "{PRIVATE_INDEX_URL}" }}\n')
+
+        assert replace_private_package_registries.contains_any(file_path, (b"missing", b".codeartifact."))
+
+    def test_When_file_holds_no_marker__Then_none_is_found(self, tmp_path: Path):
+        file_path = _write(tmp_path / "uv.lock", 'source = { registry = "https://pypi.org/simple" }\n')
+
+        assert not replace_private_package_registries.contains_any(file_path, (b".codeartifact.",))
+
+    def test_When_file_is_empty__Then_nothing_is_found(self, tmp_path: Path):
+        file_path = _write(tmp_path / "uv.lock", "")
+
+        assert not replace_private_package_registries.contains_any(file_path, (b".codeartifact.",))
+
+    def test_When_pyproject_has_no_index_block__Then_it_is_skipped_without_being_rewritten(self, tmp_path: Path):
+        pyproject = _write(tmp_path / "pyproject.toml", _lines("[project]", 'name = "example"'))
+
+        assert not replace_private_package_registries.process_pyproject(pyproject)
+
+        assert pyproject.stat().st_mtime_ns == OLD_MTIME_NS
+
+
+class TestFindFiles:
+    def test_When_files_are_nested__Then_only_those_at_most_three_parts_deep_are_found(self, tmp_path: Path):
+        for relative_path in (
+            "pyproject.toml",
+            "a/uv.lock",
+            "a/b/pyproject.toml",
+            "a/b/c/pyproject.toml",
+            "a/b/README.md",
+        ):
+            _ = _write(tmp_path / relative_path, "")
+
+        found = replace_private_package_registries.find_files(tmp_path, replace_private_package_registries.FILE_NAMES)
+
+        assert found == [
+            tmp_path / "a" / "b" / "pyproject.toml",
+            tmp_path / "a" / "uv.lock",
+            tmp_path / "pyproject.toml",
+        ]
+
+    @pytest.mark.parametrize("pruned_name", [".venv", "node_modules", ".cache"])
+    def test_When_directory_is_pruned__Then_it_is_not_searched(self, tmp_path: Path, pruned_name: str):
+        _ = _write(tmp_path / pruned_name / "pyproject.toml", "")
+        _ = _write(tmp_path / "project" / "pyproject.toml", "")
+
+        found = replace_private_package_registries.find_files(tmp_path, replace_private_package_registries.FILE_NAMES)
+
+        assert found == [tmp_path / "project" / "pyproject.toml"]
+
+    @pytest.mark.skipif(os.name == "nt", reason="creating symlinks needs extra privileges on Windows")
+    def test_When_directory_is_a_symlink__Then_it_is_not_followed(self, tmp_path: Path):
+        _ = _write(tmp_path / "project" / "pyproject.toml", "")
+        (tmp_path / "link").symlink_to(tmp_path / "project", target_is_directory=True)
+
+        found = replace_private_package_registries.find_files(tmp_path, replace_private_package_registries.FILE_NAMES)
+
+        assert found == [tmp_path / "project" / "pyproject.toml"]
@@ -0,0 +1,155 @@
+import argparse
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from .scripts import load_script
+
+run_copier_matrix = load_script("tests/run_copier_matrix.py", "run_copier_matrix")
+
+KEY_INPUTS = {
+    "template_hash": "a" * 64,
+    "data_file": "data1.yaml",
+    "data_file_sha256": "b" * 64,
+    "python_version": "3.12.7",
+}
+
+
+def _template_matches_vcs_ref(_vcs_ref: str) -> bool:  # noqa: ARG001 # stands in for run_copier_matrix.template_matches_vcs_ref
+    return True
+
+
+def _template_has_uncommitted_changes(_vcs_ref: str) -> bool:  # noqa: ARG001 # stands in for run_copier_matrix.template_matches_vcs_ref
+    return False
+
+
+def _record(*, passed: bool) -> dict[str, Any]:
+    return {
+        "key_inputs": KEY_INPUTS,
+        "passed": passed,
+        "failed_step": None if passed else "pre_commit",
+        "step_seconds": {"copier_copy": 1.5},
+        "finished_at": 0.0,
+    }
+
+
+class TestResultCache:
+    def test_When_inputs_are_in_another_order__Then_key_is_the_same(self):
+        reordered = dict(reversed(KEY_INPUTS.items()))
+
+        assert run_copier_matrix.ResultCache.key_for(reordered) == run_copier_matrix.ResultCache.key_for(KEY_INPUTS)
+
+    @pytest.mark.parametrize("changed_input", sorted(KEY_INPUTS))
+    def test_When_any_input_changes__Then_key_changes(self, changed_input: str):
+        changed = {**KEY_INPUTS, changed_input: "changed"}
+
+        assert run_copier_matrix.ResultCache.key_for(changed) != run_copier_matrix.ResultCache.key_for(KEY_INPUTS)
+
+    def test_When_stored__Then_loaded_record_matches(self, tmp_path: Path):
+        result_cache = run_copier_matrix.ResultCache(tmp_path / "results")
+        key = run_copier_matrix.ResultCache.key_for(KEY_INPUTS)
+
+        result_cache.store(key, _record(passed=True))
+
+        assert result_cache.load(key) == {"version": run_copier_matrix.RESULT_CACHE_VERSION, **_record(passed=True)}
+
+    def test_When_key_was_never_stored__Then_load_misses(self, tmp_path: Path):
+        assert run_copier_matrix.ResultCache(tmp_path).load(run_copier_matrix.ResultCache.key_for(KEY_INPUTS)) is None
+
+    def test_When_record_is_corrupt__Then_load_misses(self, tmp_path: Path):
+        key = run_copier_matrix.ResultCache.key_for(KEY_INPUTS)
+        _ = (tmp_path / f"{key}.json").write_text("{not json", encoding="utf-8")
+
+        assert run_copier_matrix.ResultCache(tmp_path).load(key) is None
+
+    def test_When_record_is_from_another_version__Then_load_misses(self, tmp_path: Path):
+        key = run_copier_matrix.ResultCache.key_for(KEY_INPUTS)
+        _ = (tmp_path / f"{key}.json").write_text(
+            f'{{"version": {run_copier_matrix.RESULT_CACHE_VERSION + 1}, "passed": true}}', encoding="utf-8"
+        )
+
+        assert run_copier_matrix.ResultCache(tmp_path).load(key) is None
+
+
+class TestLoadCachedResults:
+    @pytest.fixture
+    def data_file(self, tmp_path: Path) -> Path:
+        data_file = tmp_path / "data1.yaml"
+        _ = data_file.write_text("repo_name: example\n", encoding="utf-8")
+        return data_file
+
+    @pytest.fixture
+    def args(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> argparse.Namespace:
+        monkeypatch.setattr(run_copier_matrix, "template_matches_vcs_ref", _template_matches_vcs_ref)
+        monkeypatch.setattr(run_copier_matrix, "compute_template_hash", lambda: "template-hash-1")
+        return argparse.Namespace(vcs_ref="HEAD", result_cache_dir=tmp_path / "results")
+
+    def _store_result(self, args: argparse.Namespace, data_file: Path, *, passed: bool) -> None:
+        combination = run_copier_matrix.Combination(data_file, "3.12.7")
+        result_cache = run_copier_matrix.load_cached_results([combination], args)
+        result_cache.store(
+            run_copier_matrix.ResultCache.key_for(combination.key_inputs),
+            {"key_inputs": combination.key_inputs, "passed": passed, "step_seconds": {"copier_copy": 1.5}},
+        )
+
+    def test_When_combination_already_passed__Then_it_is_skipped_with_its_timings(
+        self, args: argparse.Namespace, data_file: Path
+    ):
+        self._store_result(args, data_file, passed=True)
+        combination = run_copier_matrix.Combination(data_file, "3.12.7")
+
+        _ = run_copier_matrix.load_cached_results([combination], args)
+
+        assert combination.cached_record is not None
+        assert combination.step_seconds == {"copier_copy": 1.5}
+
+    def test_When_combination_failed__Then_it_is_run_again(self, args: argparse.Namespace, data_file: Path):
+        self._store_result(args, data_file, passed=False)
+        combination = run_copier_matrix.Combination(data_file, "3.12.7")
+
+        _ = run_copier_matrix.load_cached_results([combination], args)
+
+        assert combination.cached_record is None
+
+    def test_When_data_file_contents_change__Then_cached_result_is_not_used(
+        self, args: argparse.Namespace, data_file: Path
+    ):
+        self._store_result(args, data_file, passed=True)
+        _ = data_file.write_text("repo_name: changed\n", encoding="utf-8")
+        combination = run_copier_matrix.Combination(data_file, "3.12.7")
+
+        _ = run_copier_matrix.load_cached_results([combination], args)
+
+        assert combination.cached_record is None
+
+    def test_When_template_hash_changes__Then_cached_result_is_not_used(
+        self, args: argparse.Namespace, data_file: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        self._store_result(args, data_file, passed=True)
+        monkeypatch.setattr(run_copier_matrix, "compute_template_hash", lambda: "template-hash-2")
+        combination = run_copier_matrix.Combination(data_file, "3.12.7")
+
+        _ = run_copier_matrix.load_cached_results([combination], args)
+
+        assert combination.cached_record is None
+
+    def test_When_python_version_differs__Then_cached_result_is_not_used(
+        self, args: argparse.Namespace, data_file: Path
+    ):
+        self._store_result(args, data_file, passed=True)
+        combination = run_copier_matrix.Combination(data_file, "3.13.2")
+
+        _ = run_copier_matrix.load_cached_results([combination], args)
+
+        assert combination.cached_record is None
+
+    def test_When_template_has_uncommitted_changes__Then_result_cache_is_not_used(
+        self, args: argparse.Namespace, data_file: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        self._store_result(args, data_file, passed=True)
+        monkeypatch.setattr(run_copier_matrix, "template_matches_vcs_ref", _template_has_uncommitted_changes)
+        combination = run_copier_matrix.Combination(data_file, "3.12.7")
+
+        assert run_copier_matrix.load_cached_results([combination], args) is None
+        assert combination.cached_record is None
@@ -0,0 +1,131 @@
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from .scripts import load_script
+
+update_fleet = load_script("tests/update_fleet.py", "update_fleet")
+SHARED_CACHE_DIR = Path("/shared-cache")
+# the real subprocess.run, for the git commands the fake steps leave alone
+_subprocess_run = subprocess.run
+
+
+def _write_clone(
+    clone_path: Path, *, answers: str = "", python_version_file: str | None = None, script_options: str = ""
+) -> Path:
+    (clone_path / ".devcontainer").mkdir(parents=True)
+    _ = (clone_path / ".devcontainer" / "manual-setup-deps.py").write_text(
+        _lines(
+            "import argparse",
+            "parser = argparse.ArgumentParser()",
+            f'parser.add_argument("--python-version"){script_options}',
+            "parser.parse_args()",
+        ),
+        encoding="utf-8",
+    )
+    _ = (clone_path / update_fleet.ANSWERS_FILE_NAME).write_text(
+        f"_commit: v0.0.70\n_src_path: gh:LabAutomationAndScreening/copier-python-package-template\n{answers}",
+        encoding="utf-8",
+    )
+    if python_version_file is not None:
+        _ = (clone_path / ".python-version").write_text(python_version_file, encoding="utf-8")
+    return clone_path
+
+
+def _lines(*lines: str) -> str:
+    return "".join(f"{line}\n" for line in lines)
+
+
+class TestSetupDepsCommand:
+    @pytest.mark.parametrize("answer", ["python_version: 3.13.2\n", "python_version: '3.13.2'\n"])
+    def test_When_answers_have_python_version__Then_it_is_passed(self, tmp_path: Path, answer: str):
+        clone_path = _write_clone(tmp_path, answers=answer, python_version_file="3.12.7\n")
+
+        command = update_fleet.setup_deps_command(clone_path, SHARED_CACHE_DIR)
+
+        assert command[command.index("--python-version") + 1] == "3.13.2"
+
+    def test_When_only_python_version_file_exists__Then_its_version_is_passed(self, tmp_path: Path):
+        clone_path = _write_clone(tmp_path, python_version_file="3.12.7\n")
+
+        command = update_fleet.setup_deps_command(clone_path, SHARED_CACHE_DIR)
+
+        assert command[command.index("--python-version") + 1] == "3.12.7"
+
+    def test_When_no_python_version_is_recorded__Then_none_is_passed(self, tmp_path: Path):
+        clone_path = _write_clone(tmp_path)
+
+        assert "--python-version" not in update_fleet.setup_deps_command(clone_path, SHARED_CACHE_DIR)
+
+    def test_When_script_supports_package_cache_dir__Then_the_shared_one_is_passed(self, tmp_path: Path):
+        clone_path = _write_clone(tmp_path, script_options='\nparser.add_argument("--package-cache-dir")')
+
+        command = update_fleet.setup_deps_command(clone_path, SHARED_CACHE_DIR)
+
+        assert command[:2] == [sys.executable, str(Path(".devcontainer") / "manual-setup-deps.py")]
+        assert command[command.index("--package-cache-dir") + 1] == str(SHARED_CACHE_DIR / "packages")
+
+    def test_When_script_predates_package_cache_dir__Then_it_is_not_passed(self, tmp_path: Path):
+        clone_path = _write_clone(tmp_path)
+
+        assert "--package-cache-dir" not in update_fleet.setup_deps_command(clone_path, SHARED_CACHE_DIR)
+
+    def test_When_script_only_mentions_package_cache_dir__Then_it_is_not_passed(self, tmp_path: Path):
+        clone_path = _write_clone(tmp_path, script_options="  # TODO: add --package-cache-dir")
+
+        assert "--package-cache-dir" not in update_fleet.setup_deps_command(clone_path, SHARED_CACHE_DIR)
+
+
+def _git_output(clone_path: Path, *args: str) -> str:
+    return _subprocess_run(
+        ["git", *args],
+        cwd=clone_path,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+@pytest.fixture
+def committed_clone(tmp_path: Path) -> Path:
+    clone_path = _write_clone(tmp_path / "clone")
+    for git_args in (["init", "--quiet"], ["add", "--all"], ["commit", "--quiet", "-m", "initial"]):
+        _ = subprocess.run(  # noqa: S603 # the arguments are fixed by the test
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *git_args],  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+            cwd=clone_path,
+            check=True,
+        )
+    return clone_path
+
+
+class TestUpdateRepo:
+    @pytest.mark.parametrize("pre_commit_returncode", [0, 1])
+    def test_When_pre_commit_has_run__Then_the_added_files_are_left_untracked(
+        self, committed_clone: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, pre_commit_returncode: int
+    ):
+        tracked_during_pre_commit: list[str] = []
+
+        def run(command: list[str], **kwargs: Any) -> subprocess.CompletedProcess[Any]:  # noqa: ANN401 # passed through to subprocess.run
+            if command[0] in ("git", sys.executable):  # the git commands and the --help probe of manual-setup-deps.py
+                return _subprocess_run(command, **kwargs)  # pyright: ignore[reportUnknownVariableType] # the overloads of subprocess.run depend on the passed-through arguments
+            if command[0] == "copier":
+                _ = (committed_clone / "added.txt").write_text("added", encoding="utf-8")
+            elif command[0] == "pre-commit":
+                tracked_during_pre_commit.extend(_git_output(committed_clone, "ls-files").splitlines())
+                return subprocess.CompletedProcess(command, pre_commit_returncode)
+            return subprocess.CompletedProcess(command, 0)
+
+        monkeypatch.setattr(update_fleet.subprocess, "run", run)
+        repo = update_fleet.Repo(committed_clone)
+        args = argparse.Namespace(vcs_ref=None, skip_pre_commit=False, shared_cache_dir=tmp_path / "shared")
+
+        update_fleet.update_repo(repo, args, tmp_path)
+
+        assert repo.failed_step == (None if pre_commit_returncode == 0 else "pre_commit")
+        assert "$ git add --intent-to-add --all" in repo.log_file.read_text(encoding="utf-8")
+        assert "added.txt" in tracked_during_pre_commit
+        assert _git_output(committed_clone, "status", "--porcelain") == "?? added.txt\n"
@@ -0,0 +1,275 @@
+"""Update every local clone of a repository instantiated from this template to a new version of it, several at a time.
+
+Clones are discovered by their `.copier-answers.yml`. Each one then runs `copier update`, `manual-setup-deps.py` and
+`pre-commit run -a` in turn, with all of them sharing one package cache and one PRE_COMMIT_HOME so that each package and hook environment
+is only downloaded once across the fleet. Conflicts are written as .rej files next to the files they belong to, and listed in the report
+for resolving by hand, e.g.:
+    python tests/update_fleet.py ~/repos
+    python tests/update_fleet.py ~/repos ~/work --jobs 8 --vcs-ref v0.0.70
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+ANSWERS_FILE_NAME = ".copier-answers.yml"
+# the name of this template in the `_src_path` of the answers files, to leave repositories instantiated from other templates alone
+DEFAULT_TEMPLATE_NAME = "copier-python-package-template"
+DEFAULT_MAX_DEPTH = 3
+DEFAULT_SHARED_CACHE_DIR = Path.home() / ".cache" / "copier-fleet"
+# the same hooks the CI lint-matrix skips, since updating the template changes the devcontainer context hash every time
+SKIPPED_HOOKS = "git-dirty,compute-devcontainer-context-hash"
+# the answers file is written by copier itself, so its top-level keys are always plain `key: value` lines
+ANSWER_PATTERN = re.compile(r"^(?P<key>_commit|_src_path|python_version):\s*(?P<value>\S+)\s*$", re.MULTILINE)
+# installed dependencies and caches can hold hundreds of thousands of directories, none of which are clones
+PRUNED_DIRECTORY_NAMES = frozenset({".git", ".venv", "venv", "node_modules", "__pycache__", ".cache"})
+_print_lock = threading.Lock()
+
+
+def _print(message: str) -> None:
+    with _print_lock:
+        print(message, flush=True)  # noqa: T201 # this just runs as a simple script, so using print instead of log
+
+
+def read_answers(repo_path: Path) -> dict[str, str]:
+    text = (repo_path / ANSWERS_FILE_NAME).read_text(encoding="utf-8")
+    # copier quotes the strings that YAML would otherwise read as numbers, such as a Python version of 3.12
+    return {match["key"]: match["value"].strip("'\"") for match in ANSWER_PATTERN.finditer(text)}
+
+
+def read_python_version(repo_path: Path) -> str | None:
+    python_version = read_answers(repo_path).get("python_version")
+    if python_version is None and (repo_path / ".python-version").is_file():
+        python_version = (repo_path / ".python-version").read_text(encoding="utf-8").strip() or None
+    return python_version
+
+
+def setup_deps_command(repo_path: Path, shared_cache_dir: Path) -> list[str]:
+    """Build the command for the manual-setup-deps.py the update left in the clone, which may predate some of its options."""
+    script_path = repo_path / ".devcontainer" / "manual-setup-deps.py"
+    command = [sys.executable, str(script_path.relative_to(repo_path))]
+    python_version = read_python_version(repo_path)
+    if python_version is not None:
+        command.extend(["--python-version", python_version])
+    # ask the script itself, rather than searching its source for the option, which would also match a mention of it in a comment
+    help_text = subprocess.run(  # noqa: S603 # the script is the one the update just wrote into the clone
+        [sys.executable, str(script_path), "--help"], cwd=repo_path, capture_output=True, text=True, check=False
+    ).stdout
+    if "--package-cache-dir" in help_text:
+        command.extend(["--package-cache-dir", str(shared_cache_dir / "packages")])
+    return command
+
+
+def discover_repos(roots: list[Path], template_name: str, max_depth: int) -> list[Path]:
+    """Find the Git clones instantiated from the template under the roots, without descending into a clone once it's found."""
+    found: list[Path] = []
+    directories = [(root.resolve(), 0) for root in roots]
+    while directories:
+        directory, depth = directories.pop()
+        if (directory / ANSWERS_FILE_NAME).is_file() and (directory / ".git").exists():
+            if template_name in read_answers(directory).get("_src_path", ""):
+                found.append(directory)
+            continue
+        if depth >= max_depth:
+            continue
+        try:
+            with os.scandir(directory) as entries:
+                subdirectories = [
+                    Path(entry.path)
+                    for entry in entries
+                    if entry.name not in PRUNED_DIRECTORY_NAMES and entry.is_dir(follow_symlinks=False)
+                ]
+        except PermissionError:
+            continue
+        directories.extend((subdirectory, depth + 1) for subdirectory in subdirectories)
+    return sorted(set(found))
+
+
+def _git(repo_path: Path, *args: str) -> str:
+    return subprocess.run(  # noqa: S603 # these are our own fixed git commands
+        ["git", *args],  # noqa: S607 # if `git` isn't in PATH already, then there are bigger problems to solve
+        cwd=repo_path,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+class Repo:
+    """One clone of the fleet, with the duration of each of its steps and the conflicts its update left behind."""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = path
+        self.step_seconds: dict[str, float] = {}
+        self.failed_step: str | None = None
+        self.skipped_reason: str | None = None
+        self.conflicts: list[str] = []
+        self.log_file: Path | None = None
+        self.from_commit = read_answers(path).get("_commit", "?")
+        self.to_commit = self.from_commit
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.step_seconds.values())
+
+
+def update_repo(repo: Repo, args: argparse.Namespace, log_dir: Path) -> None:
+    """Run every step of the update in turn, logging their output to a file and stopping at the first failing step."""
+    if _git(repo.path, "status", "--porcelain"):
+        # copier refuses to update a dirty working tree, and its changes would be mixed up with the update's anyway
+        repo.skipped_reason = "uncommitted changes"
+        _print(f"[{repo.path.name}] skipped, since it has uncommitted changes")
+        return
+    repo.log_file = log_dir / f"{repo.path.parent.name}-{repo.path.name}.log"
+    env = dict(os.environ)
+    env.update(
+        {
+            "PRE_COMMIT_HOME": str(args.shared_cache_dir / "pre-commit"),
+            # the same directory --package-cache-dir gives uv, so that clones whose script predates that option still share it
+            "UV_CACHE_DIR": str(args.shared_cache_dir / "packages" / "uv"),
+            "SKIP": SKIPPED_HOOKS,
+        }
+    )
+    copier_update = ["copier", "update", "--trust", "--defaults", "--conflict", "rej"]
+    if args.vcs_ref is not None:
+        copier_update.extend(["--vcs-ref", args.vcs_ref])
+    # each command is only built once the steps before it have run, since the update changes the files they read
+    steps: list[tuple[str, Callable[[], list[str]]]] = [
+        ("copier_update", lambda: copier_update),
+        ("setup_deps", lambda: setup_deps_command(repo.path, args.shared_cache_dir)),
+        # so that pre-commit also checks the files the update added, without staging their contents
+        ("git_add", lambda: ["git", "add", "--intent-to-add", "--all"]),
+        ("pre_commit", lambda: ["pre-commit", "run", "--all-files"]),
+    ]
+    if args.skip_pre_commit:
+        steps = steps[:2]
+    with repo.log_file.open("w", encoding="utf-8") as log:
+        try:
+            for step_name, build_command in steps:
+                command = build_command()
+                _ = log.write(f"$ {' '.join(command)}\n")
+                _ = log.flush()
+                start = time.perf_counter()
+                returncode = subprocess.run(  # noqa: S603 # these are our own fixed commands
+                    command, cwd=repo.path, env=env, stdout=log, stderr=subprocess.STDOUT, check=False
+                ).returncode
+                repo.step_seconds[step_name] = time.perf_counter() - start
+                if step_name == "copier_update":
+                    repo.to_commit = read_answers(repo.path).get("_commit", "?")
+                    repo.conflicts = [
+                        line
+                        for line in _git(repo.path, "ls-files", "--others", "--", ":(glob)**/*.rej").splitlines()
+                        if line
+                    ]
+                if returncode != 0:
+                    repo.failed_step = step_name
+                    _print(f"[{repo.path.name}] {step_name} failed after {repo.step_seconds[step_name]:.1f}s")
+                    return
+                _print(f"[{repo.path.name}] {step_name} finished in {repo.step_seconds[step_name]:.1f}s")
+        finally:
+            if "git_add" in repo.step_seconds:
+                # the clone had no changes before the update, so resetting the index only drops the intent-to-add entries, leaving the
+                # files the update added untracked again
+                _ = _git(repo.path, "reset", "--quiet")
+
+
+def print_summary(repos: list[Repo], wall_seconds: float) -> None:
+    step_names = list(dict.fromkeys(step for repo in repos for step in repo.step_seconds)) or ["copier_update"]
+    width = max(len(step) for step in [*step_names, "total"]) + 2
+    name_width = max(len(name) for name in ["repository", *(repo.path.name for repo in repos)]) + 2
+    _print("")
+    _print(
+        f"{'repository':<{name_width}}" + "".join(f"{step:>{width}}" for step in [*step_names, "total"]) + "  result"
+    )
+    for repo in sorted(repos, key=lambda repo: repo.total_seconds, reverse=True):
+        timings = "".join(
+            f"{repo.step_seconds[step]:>{width - 1}.1f}s" if step in repo.step_seconds else f"{'-':>{width}}"
+            for step in step_names
+        )
+        if repo.skipped_reason is not None:
+            result = f"skipped ({repo.skipped_reason})"
+        elif repo.failed_step is not None:
+            result = f"FAILED at {repo.failed_step} (see {repo.log_file})"
+        elif repo.conflicts:
+            result = f"{len(repo.conflicts)} conflicts"
+        else:
+            result = "ok"
+        _print(
+            f"{repo.path.name:<{name_width}}{timings}{repo.total_seconds:>{width - 1}.1f}s  {result}, {repo.from_commit} -> {repo.to_commit}"
+        )
+    for repo in repos:
+        for conflict in repo.conflicts:
+            _print(f"Conflict to resolve: {repo.path / conflict}")
+    _print(f"\nUpdating {len(repos)} repositories took {wall_seconds:.1f}s of wall time")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Update the local clones of repositories instantiated from this template concurrently."
+    )
+    _ = parser.add_argument("roots", nargs="+", type=Path, help="Directories to search for the clones")
+    _ = parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=DEFAULT_MAX_DEPTH,
+        help=f"How many directories deep below the roots to search for the clones (default: {DEFAULT_MAX_DEPTH})",
+    )
+    _ = parser.add_argument(
+        "--template-name",
+        default=DEFAULT_TEMPLATE_NAME,
+        help=f"Only update the clones whose _src_path contains this (default: {DEFAULT_TEMPLATE_NAME})",
+    )
+    _ = parser.add_argument(
+        "--vcs-ref", default=None, help="Version of the template to update to (default: its latest tag)"
+    )
+    _ = parser.add_argument(
+        "--jobs", type=int, default=min(8, os.cpu_count() or 1), help="How many clones to update concurrently"
+    )
+    _ = parser.add_argument(
+        "--shared-cache-dir",
+        type=Path,
+        default=DEFAULT_SHARED_CACHE_DIR,
+        help="Directory of the package cache and PRE_COMMIT_HOME shared by all the clones (default: ~/.cache/copier-fleet)",
+    )
+    _ = parser.add_argument(
+        "--skip-pre-commit", action="store_true", help="Only update the template and set up the dependencies"
+    )
+    _ = parser.add_argument(
+        "--list", action="store_true", help="Only list the clones that would be updated, and their template versions"
+    )
+    args = parser.parse_args()
+
+    repos = [Repo(path) for path in discover_repos(args.roots, args.template_name, args.max_depth)]
+    if not repos:
+        _print(f"No clones of {args.template_name} found under {', '.join(str(root) for root in args.roots)}")
+        return 0
+    if args.list:
+        for repo in repos:
+            _print(f"{repo.path}\t{repo.from_commit}")
+        return 0
+
+    log_dir = Path(tempfile.mkdtemp(prefix="copier-fleet-"))
+    _print(f"Updating {len(repos)} repositories, {args.jobs} at a time, logging to {log_dir}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(update_repo, repo, args, log_dir) for repo in repos]
+    for future in futures:
+        future.result()
+    print_summary(repos, time.perf_counter() - start)
+    return 1 if any(repo.failed_step is not None or repo.conflicts for repo in repos) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())